@@ -0,0 +1,400 @@
+import asyncio
+import os
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import db
+import metrics
+
+# ==============================
+# 비동기 DB 접근 계층
+# - 쓰기: 전용 writer 스레드 하나 + 큐 (sqlite 쓰기는 어차피 직렬)
+#         일정 시간(GROUP_COMMIT_WINDOW) 동안 모아서 한 번에 커밋
+# - 읽기: 읽기 전용 커넥션을 가진 작은 스레드 풀
+# 이벤트 루프(게이트웨이 하트비트)를 sqlite 호출로 막지 않기 위함
+# ==============================
+
+READ_POOL_SIZE = 4
+
+# 그룹 커밋(write-behind): 쓰기를 이 시간/개수만큼 모아서 한 트랜잭션으로 커밋
+# 0 으로 두면 큐가 빌 때마다 바로 커밋
+GROUP_COMMIT_WINDOW = float(os.getenv("DB_COMMIT_WINDOW", "0.05"))
+GROUP_COMMIT_MAX_OPS = int(os.getenv("DB_COMMIT_MAX_OPS", "64"))
+
+# 연달아 들어온 같은 쓰기는 executemany 버전으로 한 번에 실행
+# (값: 인자 튜플 리스트를 받는 함수, 결과 리스트 또는 None 반환)
+_BATCHED = {
+    db.add_exp: db.add_exp_many,
+    db.log_study_time: db.log_study_time_many,
+    db.log_study_session: db.log_study_session_many,
+    db.close_session: lambda rows: db.close_sessions_many(
+        [user_id for user_id, in rows]),
+}
+
+_write_queue = queue.Queue()
+_writer = None
+_readers = None
+_lock = threading.Lock()
+_pending = 0  # 실행됐지만 아직 커밋되지 않은 쓰기 수 (+ 큐에 대기 중인 쓰기)
+_pending_lock = threading.Lock()
+
+# 경험치 랭킹 인메모리 인덱스 (읽기는 이벤트 루프에서 바로)
+leaderboard = db.leaderboard
+profiles = db.profiles  # 프로필 캐시 (통계 보기용)
+
+_WRITE = "write"
+_READ = "read"
+
+
+def start():
+    global _writer, _readers
+    with _lock:
+        if _writer is None:
+            _writer = threading.Thread(target=_writer_loop,
+                                       name="db-writer",
+                                       daemon=True)
+            _writer.start()
+        if _readers is None:
+            _readers = ThreadPoolExecutor(max_workers=READ_POOL_SIZE,
+                                          thread_name_prefix="db-reader",
+                                          initializer=db.open_reader)
+
+
+def close():
+    # 대기 중인 쓰기를 모두 실행/커밋한 뒤 스레드 정리
+    global _writer, _readers
+    with _lock:
+        if _writer is not None:
+            _write_queue.put(None)
+            _writer.join()
+            _writer = None
+        if _readers is not None:
+            _readers.shutdown(wait=True)
+            _readers = None
+
+
+def _add_pending(n):
+    global _pending
+    with _pending_lock:
+        _pending += n
+
+
+def _writer_loop():
+    db.group_commit = True
+    uncommitted = 0
+    deadline = None
+    stop = False
+    while not stop:
+        timeout = None
+        if deadline is not None:
+            timeout = max(0, deadline - time.monotonic())
+        try:
+            items = [_write_queue.get(timeout=timeout)]
+        except queue.Empty:
+            items = []
+        # 이미 쌓여 있는 요청은 한꺼번에 꺼낸다
+        while items and len(items) < GROUP_COMMIT_MAX_OPS:
+            try:
+                items.append(_write_queue.get_nowait())
+            except queue.Empty:
+                break
+        if None in items:
+            stop = True
+            items = items[:items.index(None)]
+
+        i = 0
+        while i < len(items):
+            kind, fn, args, loop, fut = items[i]
+            j = i + 1
+            if kind == _WRITE and fn in _BATCHED:
+                while (j < len(items) and items[j][0] == _WRITE
+                       and items[j][1] is fn):
+                    j += 1
+            run = items[i:j]
+            if kind == _WRITE:
+                _run_writes(fn, run)
+                uncommitted += len(run)
+                if deadline is None:
+                    deadline = time.monotonic() + GROUP_COMMIT_WINDOW
+            else:
+                _run_one(fn, args, loop, fut)
+            i = j
+
+        if uncommitted and (stop or uncommitted >= GROUP_COMMIT_MAX_OPS
+                            or time.monotonic() >= deadline):
+            _flush(uncommitted)
+            uncommitted = 0
+            deadline = None
+    db.group_commit = False
+
+
+def _run_writes(fn, run):
+    # savepoint 로 감싸서 한 요청의 실패가 같은 트랜잭션의 다른 쓰기를 날리지 않게
+    if not db.conn.in_transaction:
+        db.cursor.execute("BEGIN")
+    db.cursor.execute("SAVEPOINT op")
+    changes = db.conn.total_changes
+    started = time.perf_counter()
+    try:
+        if len(run) > 1:
+            results = _BATCHED[fn]([item[2] for item in run])
+            if results is None:
+                results = [None] * len(run)
+        else:
+            results = [fn(*run[0][2])]
+    except Exception as e:
+        db.cursor.execute("ROLLBACK TO op")
+        db.cursor.execute("RELEASE op")
+        metrics.inc("db_errors_total", len(run), function=fn.__name__)
+        for _, _, _, loop, fut in run:
+            loop.call_soon_threadsafe(_set_exception, fut, e)
+        return
+    db.cursor.execute("RELEASE op")
+    _record(fn, "write", started, len(run), db.conn.total_changes - changes)
+    # write-behind: 실행 즉시 응답하고 커밋은 나중에 묶어서
+    for (_, _, _, loop, fut), result in zip(run, results):
+        loop.call_soon_threadsafe(_set_result, fut, result)
+
+
+def _record(fn, kind, started, requests, rows):
+    name = fn.__name__
+    metrics.observe("db_seconds", time.perf_counter() - started,
+                    function=name, kind=kind)
+    metrics.inc("db_requests_total", requests, function=name)
+    metrics.inc("db_rows_total", rows, function=name)
+
+
+def _rows(result):
+    # 읽은 행 수: 목록이면 길이, 한 건짜리 결과(dict/튜플/값)는 1
+    if isinstance(result, list):
+        return len(result)
+    return int(result is not None)
+
+
+def _measured_read(fn, *args):
+    started = time.perf_counter()
+    try:
+        result = fn(*args)
+    except Exception:
+        metrics.inc("db_errors_total", function=fn.__name__)
+        raise
+    _record(fn, "read", started, 1, _rows(result))
+    return result
+
+
+def _run_one(fn, args, loop, fut):
+    # 커밋 전 쓰기가 있을 때 들어온 읽기 - writer 커넥션에서 바로 실행
+    try:
+        result = _measured_read(fn, *args)
+    except Exception as e:
+        loop.call_soon_threadsafe(_set_exception, fut, e)
+    else:
+        loop.call_soon_threadsafe(_set_result, fut, result)
+
+
+def _flush(count):
+    started = time.perf_counter()
+    try:
+        db.conn.commit()
+    except Exception as e:
+        print("DB 커밋 실패:", e)
+        db.conn.rollback()
+        db.load_leaderboard()  # 롤백된 경험치를 인덱스에서도 되돌림
+        db.load_compacted_before()
+        db.profiles.clear()
+    metrics.observe("db_commit_seconds", time.perf_counter() - started)
+    _add_pending(-count)
+
+
+def _set_result(fut, result):
+    if not fut.cancelled():
+        fut.set_result(result)
+
+
+def _set_exception(fut, exc):
+    if not fut.cancelled():
+        fut.set_exception(exc)
+
+
+async def _write(fn, *args):
+    start()
+    loop = asyncio.get_running_loop()
+    fut = loop.create_future()
+    _add_pending(1)
+    _write_queue.put((_WRITE, fn, args, loop, fut))
+    return await fut
+
+
+async def _read(fn, *args):
+    start()
+    loop = asyncio.get_running_loop()
+    if _pending:
+        # 아직 커밋 안 된 내 쓰기를 봐야 하므로 writer 커넥션에서 읽는다
+        fut = loop.create_future()
+        _write_queue.put((_READ, fn, args, loop, fut))
+        return await fut
+    return await loop.run_in_executor(_readers, _measured_read, fn, *args)
+
+
+# ==============================
+# db.py 와 같은 이름의 비동기 버전
+# ==============================
+
+
+async def save_attendance(user_id, nickname):
+    return await _write(db.save_attendance, user_id, nickname)
+
+
+async def save_wakeup(user_id, nickname):
+    return await _write(db.save_wakeup, user_id, nickname)
+
+
+async def log_study_time(user_id, minutes):
+    return await _write(db.log_study_time, user_id, minutes)
+
+
+async def log_study_session(user_id, start, end):
+    return await _write(db.log_study_session, user_id, start, end)
+
+
+async def add_exp(user_id, amount):
+    return await _write(db.add_exp, user_id, amount)
+
+
+async def open_session(user_id, guild_id, channel_id, start, msg_id):
+    return await _write(db.open_session, user_id, guild_id, channel_id, start,
+                        msg_id)
+
+
+async def set_session_message(user_id, msg_id):
+    return await _write(db.set_session_message, user_id, msg_id)
+
+
+async def open_sessions_many(rows):
+    return await _write(db.open_sessions_many, rows)
+
+
+async def close_session(user_id):
+    return await _write(db.close_session, user_id)
+
+
+async def close_sessions_many(user_ids):
+    return await _write(db.close_sessions_many, user_ids)
+
+
+async def get_open_sessions():
+    return await _read(db.get_open_sessions)
+
+
+async def checkpoint_sessions(rows):
+    return await _write(db.checkpoint_sessions, rows)
+
+
+async def set_state(key, value):
+    return await _write(db.set_state, key, value)
+
+
+async def delete_state(key):
+    return await _write(db.delete_state, key)
+
+
+async def check_streaks(fix=False):
+    return await _write(db.check_streaks, fix)
+
+
+async def get_attendance(user_id):
+    return await _read(db.get_attendance, user_id)
+
+
+async def get_attendance_calendar(user_id, month=None):
+    return await _read(db.get_attendance_calendar, user_id, month)
+
+
+async def get_today_study_time(user_id):
+    return await _read(db.get_today_study_time, user_id)
+
+
+async def get_study_heatmap(user_id=None):
+    return await _read(db.get_study_heatmap, user_id)
+
+
+async def get_level(user_id):
+    return await _read(db.get_level, user_id)
+
+
+async def get_top_users_by_exp(limit=10):
+    return await _read(db.get_top_users_by_exp, limit)
+
+
+async def get_period_top(period, by="minutes", limit=10):
+    return await _read(db.get_period_top, period, by, limit)
+
+
+async def get_monthly_stats(user_id):
+    return await _read(db.get_monthly_stats, user_id)
+
+
+async def get_weekly_stats(user_id):
+    return await _read(db.get_weekly_stats, user_id)
+
+
+async def get_profile(user_id):
+    # 캐시에 있으면 DB 를 거치지 않고 바로 반환
+    day = db._today()
+    profile = db.profiles.get(user_id, day)
+    if profile is not None:
+        return profile
+    db.profiles.begin_load(user_id)
+    profile = await _read(db.load_profile, user_id)
+    db.profiles.put(user_id, day, profile)
+    return profile
+
+
+async def get_period_stats(user_ids, start, end):
+    return await _read(db.get_period_stats, user_ids, start, end)
+
+
+async def get_streak_attendance(user_id):
+    return await _read(db.get_streak_attendance, user_id)
+
+
+async def get_streak_wakeup(user_id):
+    return await _read(db.get_streak_wakeup, user_id)
+
+
+async def get_streak_study(user_id):
+    return await _read(db.get_streak_study, user_id)
+
+
+# ==============================
+# 오래된 기록 압축 (db.py 의 retention 함수들을 순서대로)
+# 달마다 COMPACT_BATCH 명씩 (접기 + 삭제) 따로 큐에 넣어서 그 사이 다른 쓰기가 끼어들 수 있게
+# 압축 경계는 그 달의 마지막 묶음이 끝난 뒤에 옮긴다
+# ==============================
+
+
+async def compact(dry_run=False, now=None):
+    # 반환: 보고서 dict (cutoff, rows, rows_total, bytes_*)
+    cutoff = db.compaction_cutoff(now)
+    report = await _read(db.compact_plan, cutoff)
+    report["dry_run"] = dry_run
+    if dry_run or not report["rows_total"]:
+        return report
+    deleted = dict.fromkeys(db.COMPACT_TABLES, 0)
+    for end in await _read(db.compaction_months, cutoff):
+        after = ""
+        while after is not None:
+            chunk, after = await _write(db.compact_chunk, end, after,
+                                        db.COMPACT_BATCH)
+            for table, n in chunk.items():
+                deleted[table] += n
+        await _write(db.advance_compaction, end)
+    report["rows"] = deleted
+    report["rows_total"] = sum(deleted.values())
+    report.update(await _write(db.finish_compaction))
+    # 빈 페이지로 돌아간 바이트 / 실제로 줄어든 파일 크기 (vacuum 이 없으면 0)
+    report["bytes_reclaimed"] = report["bytes_used"] - report["bytes_used_after"]
+    report["bytes_file_reclaimed"] = report["bytes_file"] - report["bytes_file_after"]
+    return report
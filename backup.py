@@ -0,0 +1,215 @@
+import asyncio
+import hashlib
+import json
+import os
+import sqlite3
+import sys
+import time
+from datetime import datetime
+from pathlib import Path
+
+from pytz import timezone
+
+# ==============================
+# princess.db 백업 / JSONL 내보내기·가져오기
+# - 백업: sqlite 온라인 백업 API 를 별도 스레드에서 한 단계로 복사
+#         (WAL 이라 읽는 동안에도 writer 는 막히지 않는다. 여러 단계로 나누면
+#          그 사이 다른 커넥션이 커밋할 때마다 처음부터 다시 복사해서 끝나지 않는다)
+#         끝나면 sha256 체크섬 파일을 같이 쓰고 오래된 백업은 BACKUP_KEEP 개만 남긴다
+# - JSONL: 테이블을 한 줄씩 흘려 쓰고, 가져올 때는 IMPORT_CHUNK 행씩 executemany
+#          (DB 가 커져도 메모리는 일정)
+# db.py 를 import 하면 마이그레이션이 돌기 때문에 경로 설정만 같은 방식으로 읽는다
+# ==============================
+
+KST = timezone('Asia/Seoul')
+DB_PATH = os.getenv("PRINCESS_DB", "princess.db")
+BACKUP_DIR = os.getenv("BACKUP_DIR", "backups")
+BACKUP_KEEP = int(os.getenv("BACKUP_KEEP", "7"))
+IMPORT_CHUNK = 1000
+
+JSONL_FORMAT = "princess-jsonl"
+
+
+def _sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _checksum_path(path):
+    return Path(str(path) + ".sha256")
+
+
+def backup_now(db_path=DB_PATH, backup_dir=BACKUP_DIR, keep=BACKUP_KEEP):
+    # 반환: {"path", "bytes", "sha256", "seconds", "removed"}
+    started = time.monotonic()
+    backup_dir = Path(backup_dir)
+    backup_dir.mkdir(parents=True, exist_ok=True)
+    stamp = datetime.now(KST).strftime("%Y%m%d-%H%M%S")
+    target = backup_dir / f"{Path(db_path).stem}-{stamp}.db"
+    partial = target.with_suffix(".db.part")
+
+    source = sqlite3.connect(db_path, timeout=5)
+    dest = sqlite3.connect(partial)
+    try:
+        source.backup(dest, pages=-1)
+    finally:
+        dest.close()
+        source.close()
+    # 다 쓴 다음에 이름을 바꿔서, 중간에 죽어도 반쪽 백업이 목록에 섞이지 않게
+    os.replace(partial, target)
+    checksum = _sha256(target)
+    _checksum_path(target).write_text(f"{checksum}  {target.name}\n")
+    return {
+        "path": str(target),
+        "bytes": target.stat().st_size,
+        "sha256": checksum,
+        "seconds": round(time.monotonic() - started, 3),
+        "removed": rotate(backup_dir, Path(db_path).stem, keep),
+    }
+
+
+def rotate(backup_dir=BACKUP_DIR, stem=Path(DB_PATH).stem, keep=BACKUP_KEEP):
+    # 최신 keep 개만 남기고 지운 파일 이름 목록을 반환
+    backups = sorted(Path(backup_dir).glob(f"{stem}-*.db"), reverse=True)
+    removed = []
+    for old in backups[keep:]:
+        old.unlink()
+        _checksum_path(old).unlink(missing_ok=True)
+        removed.append(old.name)
+    return removed
+
+
+def verify(path):
+    # 체크섬이 맞고 sqlite 가 열어서 무결성 검사를 통과하면 True
+    path = Path(path)
+    expected = _checksum_path(path).read_text().split()[0]
+    if _sha256(path) != expected:
+        return False
+    conn = sqlite3.connect(path.resolve().as_uri() + "?mode=ro", uri=True)
+    try:
+        return conn.execute("PRAGMA integrity_check").fetchone()[0] == "ok"
+    finally:
+        conn.close()
+
+
+async def backup():
+    # 이벤트 루프를 막지 않게 기본 스레드 풀에서 실행 (DB writer 스레드와는 별개)
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(None, backup_now)
+
+
+# ==============================
+# JSONL 내보내기 / 가져오기
+# 첫 줄: {"format", "user_version"}
+# 테이블마다: {"table", "columns", "sql", "indexes"} 한 줄 뒤에 행마다 [값, ...] 한 줄
+# ==============================
+
+
+def export_jsonl(out_path, db_path=DB_PATH):
+    # 한 읽기 트랜잭션 안에서 내보내서 (WAL) 실행 중인 봇과 같이 돌려도 일관된 스냅샷
+    # 반환: {테이블: 행 수}
+    conn = sqlite3.connect(Path(db_path).resolve().as_uri() + "?mode=ro",
+                           uri=True)
+    counts = {}
+    try:
+        conn.execute("BEGIN")
+        version = conn.execute("PRAGMA user_version").fetchone()[0]
+        tables = conn.execute("""
+            SELECT name, sql FROM sqlite_master
+            WHERE type='table' AND name NOT LIKE 'sqlite_%' ORDER BY name
+        """).fetchall()
+        with open(out_path, "w", encoding="utf-8") as out:
+            out.write(json.dumps({"format": JSONL_FORMAT,
+                                  "user_version": version}) + "\n")
+            for table, sql in tables:
+                indexes = [row[0] for row in conn.execute(
+                    "SELECT sql FROM sqlite_master WHERE type='index' "
+                    "AND tbl_name=? AND sql IS NOT NULL", (table, ))]
+                cur = conn.execute(f"SELECT * FROM {table}")
+                columns = [d[0] for d in cur.description]
+                out.write(json.dumps({"table": table, "columns": columns,
+                                      "sql": sql, "indexes": indexes},
+                                     ensure_ascii=False) + "\n")
+                counts[table] = 0
+                for row in cur:
+                    out.write(json.dumps(row, ensure_ascii=False) + "\n")
+                    counts[table] += 1
+        conn.rollback()
+    finally:
+        conn.close()
+    return counts
+
+
+def import_jsonl(in_path, db_path):
+    # 새 DB 파일(또는 봇을 멈춘 DB)로 가져오기 - 테이블이 없으면 내보낸 스키마로 만든다
+    # 한 트랜잭션으로 넣어서 중간에 실패하면 아무것도 바뀌지 않는다
+    # 반환: {테이블: 행 수}
+    conn = sqlite3.connect(db_path)
+    conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+    conn.execute("PRAGMA journal_mode=WAL")
+    counts = {}
+    try:
+        with open(in_path, encoding="utf-8") as f:
+            header = json.loads(f.readline())
+            if header.get("format") != JSONL_FORMAT:
+                raise ValueError(f"JSONL 형식이 아님: {in_path}")
+            conn.execute("BEGIN")
+            table = insert = None
+            chunk = []
+            for line in f:
+                item = json.loads(line)
+                if isinstance(item, list):
+                    chunk.append(item)
+                    if len(chunk) >= IMPORT_CHUNK:
+                        conn.executemany(insert, chunk)
+                        counts[table] += len(chunk)
+                        chunk = []
+                    continue
+                if chunk:
+                    conn.executemany(insert, chunk)
+                    counts[table] += len(chunk)
+                    chunk = []
+                table = item["table"]
+                exists = conn.execute(
+                    "SELECT 1 FROM sqlite_master WHERE type='table' AND name=?",
+                    (table, )).fetchone()
+                if not exists:
+                    conn.execute(item["sql"])
+                    for sql in item["indexes"]:
+                        conn.execute(sql)
+                columns = ", ".join(item["columns"])
+                marks = ", ".join("?" * len(item["columns"]))
+                insert = (f"INSERT OR REPLACE INTO {table} ({columns}) "
+                          f"VALUES ({marks})")
+                counts[table] = 0
+            if chunk:
+                conn.executemany(insert, chunk)
+                counts[table] += len(chunk)
+            conn.execute(f"PRAGMA user_version = {int(header['user_version'])}")
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+    return counts
+
+
+if __name__ == "__main__":
+    # python backup.py backup | verify <파일> | export <out.jsonl> | import <in.jsonl> <대상.db>
+    command, args = (sys.argv[1], sys.argv[2:]) if len(sys.argv) > 1 else (None, [])
+    if command == "backup":
+        print(json.dumps(backup_now(), ensure_ascii=False))
+    elif command == "verify" and len(args) == 1:
+        print("ok" if verify(args[0]) else "손상됨")
+    elif command == "export" and len(args) == 1:
+        print(json.dumps(export_jsonl(args[0]), ensure_ascii=False))
+    elif command == "import" and len(args) == 2:
+        print(json.dumps(import_jsonl(args[0], args[1]), ensure_ascii=False))
+    else:
+        print("사용법: python backup.py backup | verify <파일> | "
+              "export <out.jsonl> | import <in.jsonl> <대상.db>")
+        sys.exit(1)
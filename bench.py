@@ -0,0 +1,242 @@
+import argparse
+import json
+import os
+import platform
+import random
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+
+# ==============================
+# db.py 데이터 계층 벤치마크
+# 가짜 유저 x 일수 만큼의 출석/기상/공부/경험치 기록을 임시 DB 에 만들고
+# 주요 함수의 p50/p95/p99 지연과 초당 처리량을 JSON 으로 남긴다 (커밋끼리 비교용)
+#
+#   python bench.py --users 2000 --days 180 --out bench.json
+#   python bench.py --scale 100,1000,10000 --days 90 --out scale.json
+#
+# db.py 는 import 할 때 PRINCESS_DB 로 연결하므로, 데이터셋 하나당 프로세스 하나
+# (--scale 은 크기마다 자기 자신을 다시 실행해서 결과를 모은다)
+# ==============================
+
+ATTENDANCE_RATE = 0.6  # 하루에 출석할 확률
+WAKEUP_RATE = 0.4
+STUDY_RATE = 0.5
+MAX_STUDY_MINUTES = 240
+
+
+def percentile(sorted_values, p):
+    # nearest-rank
+    if not sorted_values:
+        return 0.0
+    k = max(0, min(len(sorted_values) - 1,
+                   round(p / 100 * len(sorted_values) + 0.5) - 1))
+    return sorted_values[k]
+
+
+def summarize(latencies, wall):
+    latencies = sorted(latencies)
+    ms = 1000
+    return {
+        "n": len(latencies),
+        "p50_ms": round(percentile(latencies, 50) * ms, 4),
+        "p95_ms": round(percentile(latencies, 95) * ms, 4),
+        "p99_ms": round(percentile(latencies, 99) * ms, 4),
+        "mean_ms": round(sum(latencies) / len(latencies) * ms, 4),
+        "ops_per_sec": round(len(latencies) / wall, 1) if wall else None,
+    }
+
+
+def _timed(fn, calls):
+    # calls: [args 튜플, ...] - 호출마다 지연을 재고 전체 시간으로 처리량 계산
+    latencies = []
+    clock = time.perf_counter
+    started = clock()
+    for args in calls:
+        t = clock()
+        fn(*args)
+        latencies.append(clock() - t)
+    return summarize(latencies, clock() - started)
+
+
+def generate(db, users, days, rng):
+    # 오늘 이전 days 일 동안의 기록을 현재 스키마에 바로 채운다 (오늘은 비워 둠)
+    today = db._today()
+    user_ids = [str(100000000000000000 + i) for i in range(users)]
+    cur = db.cursor
+    cur.executemany(
+        "INSERT INTO users (user_id, nickname, exp, level) VALUES (?, ?, 0, 1)",
+        [(u, f"user{i}") for i, u in enumerate(user_ids)])
+    masks = {}
+    study = []
+    rollups = []
+    exp = dict.fromkeys(user_ids, 0)
+    for day in range(today - days, today):
+        month, bit = db._month_bit(day)
+        for u in user_ids:
+            checkins = 0
+            row = masks.setdefault((u, month), [0, 0, 0])
+            if rng.random() < ATTENDANCE_RATE:
+                row[0] |= bit
+                checkins += 1
+            if rng.random() < WAKEUP_RATE:
+                row[1] |= bit
+                checkins += 1
+            minutes = 0
+            if rng.random() < STUDY_RATE:
+                minutes = rng.randint(1, MAX_STUDY_MINUTES)
+                study.append((u, day, minutes))
+                if minutes >= db.STUDY_STREAK_MINUTES:
+                    row[2] |= bit
+            gained = round(minutes / 30 * 10) + 10 * checkins
+            exp[u] += gained
+            if minutes or checkins:
+                rollups.append((u, day, minutes, gained, checkins))
+    cur.executemany(
+        "INSERT INTO checkins (user_id, month, attendance, wakeup, study) "
+        "VALUES (?, ?, ?, ?, ?)",
+        [(u, month, *row) for (u, month), row in masks.items()])
+    cur.executemany("INSERT INTO study (user_id, day, minutes) VALUES (?, ?, ?)",
+                    study)
+    db._bump_rollups(rollups)
+    cur.executemany("UPDATE users SET exp=? WHERE user_id=?",
+                    [(e, u) for u, e in exp.items()])
+    db._sync_levels(cur)
+    db._write_streaks(cur, db._compute_streaks(cur))
+    db.conn.commit()
+    db.load_leaderboard()
+    return user_ids
+
+
+def run(users, days, ops, seed):
+    # 이 프로세스에서 데이터셋 하나를 만들고 측정 (db 는 여기서 처음 import)
+    workdir = tempfile.mkdtemp(prefix="princess-bench-")
+    os.environ["PRINCESS_DB"] = os.path.join(workdir, "bench.db")
+    import db
+
+    rng = random.Random(seed)
+    t = time.perf_counter()
+    user_ids = generate(db, users, days, rng)
+    setup_seconds = time.perf_counter() - t
+
+    # 쓰기는 오늘 아직 기록이 없는 유저부터 (같은 유저 두 번째 출석은 중복 경로)
+    writers = [rng.choice(user_ids) for _ in range(ops)]
+    readers = [(rng.choice(user_ids), ) for _ in range(ops)]
+    fresh = user_ids[:ops]
+    results = {
+        "save_attendance": _timed(db.save_attendance,
+                                  [(u, "bench") for u in fresh]),
+        "save_attendance_duplicate": _timed(db.save_attendance,
+                                            [(u, "bench") for u in fresh]),
+        "save_wakeup": _timed(db.save_wakeup, [(u, "bench") for u in fresh]),
+        "log_study_time": _timed(db.log_study_time,
+                                 [(u, rng.randint(1, 60)) for u in writers]),
+        "add_exp": _timed(db.add_exp, [(u, rng.randint(1, 30)) for u in writers]),
+        "get_monthly_stats": _timed(db.get_monthly_stats, readers),
+        "get_weekly_stats": _timed(db.get_weekly_stats, readers),
+        "get_streak_attendance": _timed(db.get_streak_attendance, readers),
+        "get_streak_wakeup": _timed(db.get_streak_wakeup, readers),
+        "get_streak_study": _timed(db.get_streak_study, readers),
+        "load_profile": _timed(db.load_profile, readers),
+        "get_top_users_by_exp": _timed(db.get_top_users_by_exp,
+                                       [(10, )] * ops),
+        "get_period_top": _timed(db.get_period_top, [("week", )] * ops),
+        "leaderboard_rank": _timed(db.leaderboard.rank, readers),
+    }
+    db.conn.commit()
+    return {
+        "users": users,
+        "days": days,
+        "ops": ops,
+        "seed": seed,
+        "setup_seconds": round(setup_seconds, 3),
+        "db_bytes": os.path.getsize(os.environ["PRINCESS_DB"]),
+        "results": results,
+    }
+
+
+def _meta():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"],
+                                capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__)),
+                                timeout=10).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {
+        "commit": commit,
+        "python": platform.python_version(),
+        "sqlite": sqlite3.sqlite_version,
+        "platform": platform.platform(),
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+    }
+
+
+def scale(sizes, days, ops, seed):
+    # 크기마다 새 프로세스에서 run - 결과를 모아서 함수별 증가 곡선을 만든다
+    runs = []
+    for users in sizes:
+        with tempfile.NamedTemporaryFile(suffix=".json", delete=False) as f:
+            out = f.name
+        subprocess.run([sys.executable, os.path.abspath(__file__),
+                        "--users", str(users), "--days", str(days),
+                        "--ops", str(min(ops, users)), "--seed", str(seed),
+                        "--out", out, "--quiet"], check=True)
+        with open(out, encoding="utf-8") as f:
+            runs.append(json.load(f)["run"])
+        os.unlink(out)
+    curves = {
+        name: [(r["users"], r["results"][name]["p50_ms"],
+                r["results"][name]["p99_ms"]) for r in runs]
+        for name in runs[0]["results"]
+    }
+    return {"runs": runs, "curves": curves}
+
+
+def _print_run(run_result):
+    print(f"users={run_result['users']} days={run_result['days']} "
+          f"ops={run_result['ops']} setup={run_result['setup_seconds']}s "
+          f"db={run_result['db_bytes'] / 1024 / 1024:.1f}MB")
+    print(f"{'':28}{'p50':>9}{'p95':>9}{'p99':>9}{'ops/s':>11}")
+    for name, r in run_result["results"].items():
+        print(f"{name:28}{r['p50_ms']:>9.3f}{r['p95_ms']:>9.3f}"
+              f"{r['p99_ms']:>9.3f}{r['ops_per_sec']:>11}")
+
+
+def _print_curves(curves):
+    # 함수별 p50 (ms) 를 크기 순으로
+    for name, points in curves.items():
+        line = "  ".join(f"{users}:{p50:.3f}" for users, p50, _ in points)
+        print(f"{name:28}{line}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="princess.db 데이터 계층 벤치마크")
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--days", type=int, default=180)
+    parser.add_argument("--ops", type=int, default=500, help="함수별 호출 수")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--scale", help="유저 수 목록 (예: 100,1000,10000)")
+    parser.add_argument("--out", default="bench.json")
+    parser.add_argument("--quiet", action="store_true")
+    args = parser.parse_args(argv)
+
+    report = {"meta": _meta()}
+    if args.scale:
+        sizes = [int(x) for x in args.scale.split(",")]
+        report.update(scale(sizes, args.days, args.ops, args.seed))
+        if not args.quiet:
+            _print_curves(report["curves"])
+    else:
+        report["run"] = run(args.users, args.days, min(args.ops, args.users),
+                            args.seed)
+        if not args.quiet:
+            _print_run(report["run"])
+    with open(args.out, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+import discord
+
+# ==============================
+# 서버별 채널 해석 캐시
+# 서버 설정(state.BotState.guild)에 채널 ID 가 있으면 ID 로 바로,
+# 없으면 예전처럼 이름으로 한 번만 찾아서 guild_id 별로 들고 있는다
+# 채널 생성/이름 변경/삭제, 설정 변경 때 그 서버 것만 버린다
+# ==============================
+
+# 설정이 없는 서버에서 쓰는 예전 채널 이름
+DEFAULT_TRACKED_VOICE_NAMES = ("🎥｜캠스터디",)
+DEFAULT_STUDY_LOG_NAME = "📕｜공부기록"
+
+# 서버 설정 키 (bot_state 의 guild:<id> 값)
+TRACKED_VOICE_KEY = "tracked_voice_channel_ids"
+STUDY_LOG_KEY = "study_log_channel_id"
+RANKING_KEY = "ranking_channel_id"
+
+
+class GuildChannels:
+    # 한 서버의 해석 결과 (채널 객체는 discord.py 캐시의 것을 그대로)
+    __slots__ = ("tracked_voice_ids", "study_log", "ranking")
+
+    def __init__(self, tracked_voice_ids, study_log, ranking):
+        self.tracked_voice_ids = tracked_voice_ids
+        self.study_log = study_log
+        self.ranking = ranking
+
+
+class ChannelResolver:
+
+    def __init__(self, bot_state):
+        self.bot_state = bot_state
+        self._cache = {}  # guild_id -> GuildChannels
+        self.resolves = 0
+
+    def get(self, guild):
+        resolved = self._cache.get(guild.id)
+        if resolved is None:
+            resolved = self._cache[guild.id] = self._resolve(guild)
+        return resolved
+
+    def invalidate(self, guild_id=None):
+        if guild_id is None:
+            self._cache.clear()
+        else:
+            self._cache.pop(guild_id, None)
+
+    def is_tracked(self, channel):
+        # 공부 시간을 기록하는 음성 채널인지 (None 이면 False)
+        return (channel is not None
+                and channel.id in self.get(channel.guild).tracked_voice_ids)
+
+    def study_log(self, guild):
+        return self.get(guild).study_log
+
+    def ranking(self, guild):
+        return self.get(guild).ranking
+
+    def _resolve(self, guild):
+        self.resolves += 1
+        config = self.bot_state.guild(guild.id)
+        tracked = config.get(TRACKED_VOICE_KEY)
+        if tracked:
+            tracked = frozenset(int(c) for c in tracked)
+        else:
+            tracked = frozenset(c.id for c in guild.voice_channels
+                                if c.name in DEFAULT_TRACKED_VOICE_NAMES)
+        if config.get(STUDY_LOG_KEY):
+            study_log = guild.get_channel(int(config[STUDY_LOG_KEY]))
+        else:
+            study_log = discord.utils.get(guild.text_channels,
+                                          name=DEFAULT_STUDY_LOG_NAME)
+        # 랭킹 채널: 서버 설정 -> 전역 기본값이 이 서버 채널이면 그것
+        ranking_id = config.get(RANKING_KEY) or self.bot_state.get(RANKING_KEY)
+        ranking = guild.get_channel(int(ranking_id)) if ranking_id else None
+        return GuildChannels(tracked, study_log, ranking)
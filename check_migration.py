@@ -0,0 +1,209 @@
+import argparse
+import json
+import os
+import random
+import sqlite3
+import subprocess
+import sys
+import tempfile
+
+# ==============================
+# 출석/기상 비트마스크 전환 (migration 8) 전후 비교
+# 예전 행 스키마 (user_version 7: 출석/기상 하루 한 행, 공부 일별 분) 에 무작위 기록을 채우고
+# 그때 쿼리로 월간/주간 통계, 연속 기록, 출석 목록을 적어 둔 다음
+# db.py 를 import 해서 마이그레이션하고 지금 함수들이 같은 답을 내는지 확인
+#
+#   python check_migration.py --users 300 --days 150 --seed 1
+#
+# db.py 는 import 할 때 PRINCESS_DB 로 연결/마이그레이션하므로
+# 예전 DB 만들기와 확인(--check)은 프로세스를 나눈다 (bench.py --scale 과 같은 방식)
+# ==============================
+
+ATTENDANCE_RATE = 0.6
+WAKEUP_RATE = 0.4
+STUDY_RATE = 0.5
+MAX_STUDY_MINUTES = 240
+STREAK_KINDS = ("attendance", "wakeup", "study")
+
+# 예전 get_period_stats (행 테이블 UNION) - 경험치는 그때 누적값이라 여기선 빼고 비교
+_OLD_PERIOD_STATS = """
+    SELECT 'attendance', COUNT(*), 0 FROM attendance
+    WHERE day BETWEEN ? AND ? AND user_id = ?
+    UNION ALL
+    SELECT 'wakeup', COUNT(*), 0 FROM wakeup
+    WHERE day BETWEEN ? AND ? AND user_id = ?
+    UNION ALL
+    SELECT 'study', SUM(minutes >= ?), SUM(minutes) FROM study
+    WHERE day BETWEEN ? AND ? AND user_id = ?
+"""
+
+# 예전 _compute_streaks 의 원본 날짜
+_OLD_STREAK_SOURCES = {
+    "attendance": "SELECT user_id, day FROM attendance",
+    "wakeup": "SELECT user_id, day FROM wakeup",
+    "study": "SELECT user_id, day FROM study WHERE minutes >= ?",
+}
+
+
+def _old_period_stats(cur, user_id, start, end, study_minutes):
+    cur.execute(_OLD_PERIOD_STATS, (start, end, user_id, start, end, user_id,
+                                    study_minutes, start, end, user_id))
+    stats = {"attendance": 0, "wakeup": 0, "study_days": 0, "study_minutes": 0}
+    for kind, value, minutes in cur.fetchall():
+        if kind == "study":
+            stats["study_days"] = value or 0
+            stats["study_minutes"] = minutes or 0
+        else:
+            stats[kind] = value
+    return stats
+
+
+def _old_streaks(cur, study_minutes):
+    # 예전 _compute_streaks 그대로 (봇이 매일 갱신하던 streaks 값과 같다)
+    result = {}
+    for kind, source in _OLD_STREAK_SOURCES.items():
+        params = (study_minutes, ) if kind == "study" else ()
+        cur.execute(f"{source} ORDER BY user_id, day", params)
+        prev_user, prev_day = None, None
+        current = best = 0
+        for user_id, day in cur.fetchall():
+            if user_id != prev_user:
+                current = 1
+                best = 0
+            elif day == prev_day + 1:
+                current += 1
+            elif day != prev_day:
+                current = 1
+            best = max(best, current)
+            result[(user_id, kind)] = (current, best, day)
+            prev_user, prev_day = user_id, day
+    return result
+
+
+def build(path, users, days, seed):
+    # path 에 user_version 7 DB 를 만들고 예전 쿼리의 답을 돌려준다
+    # (마이그레이션 1~7 은 db.py 것을 그대로 쓰려고 db 는 메모리 DB 로 import)
+    os.environ["PRINCESS_DB"] = ":memory:"
+    import db
+
+    rng = random.Random(seed)
+    conn = sqlite3.connect(path)
+    cur = conn.cursor()
+    for step in db.MIGRATIONS[:7]:
+        step(cur)
+    cur.execute("PRAGMA user_version = 7")
+
+    # 오늘까지 포함 (오늘 기록이 있어야 연속 기록이 0 이 아니다)
+    today = db._today()
+    user_ids = [str(100000000000000000 + i) for i in range(users)]
+    cur.executemany(
+        "INSERT INTO users (user_id, nickname, exp, level) VALUES (?, ?, 0, 1)",
+        [(u, f"user{i}") for i, u in enumerate(user_ids)])
+    rows = {"attendance": [], "wakeup": [], "study": []}
+    # 유저마다 빈도를 다르게 - 기록이 없는 유저, 매일 하는 유저도 섞이게
+    for i, u in enumerate(user_ids):
+        activity = (0.0, 1.0)[i] if i < 2 else rng.random()
+        for day in range(today - days, today + 1):
+            if activity == 1.0 or rng.random() < ATTENDANCE_RATE * activity:
+                rows["attendance"].append((u, day))
+            if rng.random() < WAKEUP_RATE * activity:
+                rows["wakeup"].append((u, day))
+            if rng.random() < STUDY_RATE * activity:
+                rows["study"].append(
+                    (u, day, rng.randint(1, MAX_STUDY_MINUTES)))
+    cur.executemany("INSERT INTO attendance (user_id, day) VALUES (?, ?)",
+                    rows["attendance"])
+    cur.executemany("INSERT INTO wakeup (user_id, day) VALUES (?, ?)",
+                    rows["wakeup"])
+    cur.executemany(
+        "INSERT INTO study (user_id, day, minutes) VALUES (?, ?, ?)",
+        rows["study"])
+    streaks = _old_streaks(cur, db.STUDY_STREAK_MINUTES)
+    cur.executemany(
+        "INSERT INTO streaks (user_id, kind, current, best, last_day) "
+        "VALUES (?, ?, ?, ?, ?)",
+        [(u, k, c, b, d) for (u, k), (c, b, d) in streaks.items()])
+    conn.commit()
+
+    # 예전 조회 함수들의 답 (get_attendance / get_*_stats / get_streak_*)
+    month, week = db.month_range(), db.week_range()
+    expected = {}
+    for u in user_ids:
+        cur.execute(
+            "SELECT day FROM attendance WHERE user_id=? ORDER BY day DESC",
+            (u, ))
+        expected[u] = {
+            "attendance": [db.day_str(row[0]) for row in cur.fetchall()],
+            "monthly": _old_period_stats(cur, u, *month,
+                                         db.STUDY_STREAK_MINUTES),
+            "weekly": _old_period_stats(cur, u, *week, db.STUDY_STREAK_MINUTES),
+            "streaks": {
+                kind: streaks[(u, kind)][0]
+                if streaks.get((u, kind), (0, 0, None))[2] == today else 0
+                for kind in STREAK_KINDS
+            },
+        }
+    conn.close()
+    return {"today": today, "users": expected}
+
+
+def check(path, baseline):
+    # path 를 지금 db.py 로 마이그레이션하고 baseline 과 비교 - 다른 항목 목록을 반환
+    os.environ["PRINCESS_DB"] = path
+    import db
+
+    if db._today() != baseline["today"]:
+        raise SystemExit("확인 중에 날짜가 바뀌었습니다 - 다시 실행하세요")
+    mismatches = []
+    getters = {
+        "attendance": lambda u: [row[0] for row in db.get_attendance(u)],
+        "monthly": db.get_monthly_stats,
+        "weekly": db.get_weekly_stats,
+        "streaks": lambda u: {
+            "attendance": db.get_streak_attendance(u),
+            "wakeup": db.get_streak_wakeup(u),
+            "study": db.get_streak_study(u),
+        },
+    }
+    for u, expected in baseline["users"].items():
+        for name, getter in getters.items():
+            got = getter(u)
+            if name in ("monthly", "weekly"):
+                got = {k: got[k] for k in expected[name]}
+            if got != expected[name]:
+                mismatches.append((u, name, expected[name], got))
+    return mismatches
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="출석/기상 비트마스크 마이그레이션 전후 결과 비교")
+    parser.add_argument("--users", type=int, default=300)
+    parser.add_argument("--days", type=int, default=150)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--check", nargs=2, metavar=("DB", "BASELINE"),
+                        help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.check:
+        with open(args.check[1], encoding="utf-8") as f:
+            baseline = json.load(f)
+        mismatches = check(args.check[0], baseline)
+        for mismatch in mismatches[:20]:
+            print("불일치:", mismatch)
+        print(f"유저 {len(baseline['users'])}명, 불일치 {len(mismatches)}건")
+        sys.exit(1 if mismatches else 0)
+
+    workdir = tempfile.mkdtemp(prefix="princess-migration-")
+    path = os.path.join(workdir, "old.db")
+    out = os.path.join(workdir, "baseline.json")
+    baseline = build(path, args.users, args.days, args.seed)
+    with open(out, "w", encoding="utf-8") as f:
+        json.dump(baseline, f, ensure_ascii=False)
+    result = subprocess.run([sys.executable, os.path.abspath(__file__),
+                             "--check", path, out])
+    sys.exit(result.returncode)
+
+
+if __name__ == "__main__":
+    main()
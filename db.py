@@ -1,149 +1,972 @@
+import json
+import os
 import sqlite3
-from datetime import datetime, timedelta
+import threading
+from datetime import date, datetime, timedelta
+from pathlib import Path
 
-# DB 연결
-conn = sqlite3.connect("princess.db", check_same_thread=False)
+from pytz import timezone
+
+from leaderboard import Leaderboard
+from levels import level_for_exp
+from profile_cache import ProfileCache
+
+DB_PATH = os.getenv("PRINCESS_DB", "princess.db")
+
+# 날짜는 main.py 와 같은 한국 시간 기준, DB 에는 정수 일 번호로 저장
+KST = timezone('Asia/Seoul')
+_EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+_KST_OFFSET = 9 * 3600  # 서머타임 없음 - epoch 초 + 이 값 = 한국 시간 초
+
+# DB 연결 (쓰기 전용 - async_db 의 writer 스레드가 사용)
+conn = sqlite3.connect(DB_PATH, check_same_thread=False)
 cursor = conn.cursor()
 
-# 유저 정보 테이블
-cursor.execute("""
-CREATE TABLE IF NOT EXISTS users (
-    user_id TEXT PRIMARY KEY,
-    nickname TEXT,
-    exp INTEGER DEFAULT 0
-)
-""")
-
-# 출석 테이블
-cursor.execute("""
-CREATE TABLE IF NOT EXISTS attendance (
-    user_id TEXT,
-    date TEXT
-)
-""")
-
-# 기상 테이블
-cursor.execute("""
-CREATE TABLE IF NOT EXISTS wakeup (
-    user_id TEXT,
-    date TEXT
-)
-""")
-
-# 공부 시간 테이블
-cursor.execute("""
-CREATE TABLE IF NOT EXISTS study (
-    user_id TEXT,
-    date TEXT,
-    minutes INTEGER
-)
-""")
-conn.commit()
+# 읽기 전용 커넥션은 스레드마다 하나씩 (async_db 의 reader 풀)
+_local = threading.local()
+
+# async_db writer 가 여러 쓰기를 한 트랜잭션으로 묶는 중이면 True
+group_commit = False
+
+# 경험치 랭킹 인메모리 인덱스 (시작 시 users 로 채우고 add_exp 가 갱신)
+leaderboard = Leaderboard()
+
+# 유저 프로필 캐시 (async_db.get_profile 이 채우고 쓰기 함수가 write-through)
+profiles = ProfileCache()
+
+# 새 DB 는 압축 후 빈 페이지를 조금씩 돌려줄 수 있게 (기존 DB 는 시작할 때 한 번 VACUUM 으로 전환)
+cursor.execute("PRAGMA auto_vacuum=INCREMENTAL")
+# WAL: 읽기와 쓰기가 서로 막지 않도록 / 커밋 fsync 부담 줄이기
+cursor.execute("PRAGMA journal_mode=WAL")
+cursor.execute("PRAGMA synchronous=NORMAL")
+cursor.execute("PRAGMA busy_timeout=5000")
+cursor.execute("PRAGMA temp_store=MEMORY")
+
+# ==============================
+# 스키마 마이그레이션 (PRAGMA user_version 으로 버전 관리)
+# ==============================
+
+
+def _migration_1(cur):
+    # 최초 스키마
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS users (
+        user_id TEXT PRIMARY KEY,
+        nickname TEXT,
+        exp INTEGER DEFAULT 0
+    )
+    """)
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS attendance (
+        user_id TEXT,
+        date TEXT
+    )
+    """)
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS wakeup (
+        user_id TEXT,
+        date TEXT
+    )
+    """)
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS study (
+        user_id TEXT,
+        date TEXT,
+        minutes INTEGER
+    )
+    """)
+
+
+def _migration_2(cur):
+    # 출석/기상: 중복 행 제거 후 (user_id, date) 기본키
+    for table in ("attendance", "wakeup"):
+        cur.execute(f"""
+        CREATE TABLE {table}_v2 (
+            user_id TEXT NOT NULL,
+            date TEXT NOT NULL,
+            PRIMARY KEY (user_id, date)
+        ) WITHOUT ROWID
+        """)
+        cur.execute(f"""
+        INSERT OR IGNORE INTO {table}_v2 (user_id, date)
+        SELECT user_id, date FROM {table}
+        WHERE user_id IS NOT NULL AND date IS NOT NULL
+        """)
+        cur.execute(f"DROP TABLE {table}")
+        cur.execute(f"ALTER TABLE {table}_v2 RENAME TO {table}")
+
+    # 공부: 같은 날 여러 행은 분을 합쳐서 한 행으로
+    cur.execute("""
+    CREATE TABLE study_v2 (
+        user_id TEXT NOT NULL,
+        date TEXT NOT NULL,
+        minutes INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (user_id, date)
+    ) WITHOUT ROWID
+    """)
+    cur.execute("""
+    INSERT INTO study_v2 (user_id, date, minutes)
+    SELECT user_id, date, COALESCE(SUM(minutes), 0) FROM study
+    WHERE user_id IS NOT NULL AND date IS NOT NULL
+    GROUP BY user_id, date
+    """)
+    cur.execute("DROP TABLE study")
+    cur.execute("ALTER TABLE study_v2 RENAME TO study")
+
+    # 랭킹 정렬용
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_users_exp ON users (exp DESC)")
+
+
+def _migration_3(cur):
+    # 연속 기록 캐시: 종류별(attendance/wakeup/study) 현재/최고 연속일수
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS streaks (
+        user_id TEXT NOT NULL,
+        kind TEXT NOT NULL,
+        current INTEGER NOT NULL,
+        best INTEGER NOT NULL,
+        last_date TEXT NOT NULL,
+        PRIMARY KEY (user_id, kind)
+    ) WITHOUT ROWID
+    """)
+    # (채우기는 날짜 형식이 바뀌는 migration 7 에서)
+
+
+def _migration_4(cur):
+    # 진행 중인 공부 세션 저널 (재시작/크래시 후 복구용)
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS open_sessions (
+        user_id TEXT PRIMARY KEY,
+        guild_id TEXT,
+        channel_id TEXT,
+        start TEXT NOT NULL,
+        msg_id INTEGER
+    ) WITHOUT ROWID
+    """)
+
+
+def _migration_5(cur):
+    # 봇 상태/설정 (랭킹 메시지 ID, 채널 ID, 서버별 설정 등) - 값은 JSON
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS bot_state (
+        key TEXT PRIMARY KEY,
+        value TEXT
+    ) WITHOUT ROWID
+    """)
+
+
+def _migration_6(cur):
+    # 레벨을 users 에 저장 (add_exp 가 같이 갱신 -> 레벨업 감지에 추가 조회 불필요)
+    cur.execute("ALTER TABLE users ADD COLUMN level INTEGER NOT NULL DEFAULT 1")
+    _sync_levels(cur)
+
+
+def _migration_7(cur):
+    # 날짜 TEXT(YYYY-MM-DD) -> 정수 일 번호(day, KST 1970-01-01 부터 일수)
+    day_expr = "CAST(julianday(date) - julianday('1970-01-01') AS INTEGER)"
+    for table in ("attendance", "wakeup"):
+        cur.execute(f"""
+        CREATE TABLE {table}_v3 (
+            user_id TEXT NOT NULL,
+            day INTEGER NOT NULL,
+            PRIMARY KEY (user_id, day)
+        ) WITHOUT ROWID
+        """)
+        cur.execute(f"""
+        INSERT OR IGNORE INTO {table}_v3 (user_id, day)
+        SELECT user_id, {day_expr} AS d FROM {table} WHERE d IS NOT NULL
+        """)
+        cur.execute(f"DROP TABLE {table}")
+        cur.execute(f"ALTER TABLE {table}_v3 RENAME TO {table}")
+
+    cur.execute("""
+    CREATE TABLE study_v3 (
+        user_id TEXT NOT NULL,
+        day INTEGER NOT NULL,
+        minutes INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (user_id, day)
+    ) WITHOUT ROWID
+    """)
+    cur.execute(f"""
+    INSERT INTO study_v3 (user_id, day, minutes)
+    SELECT user_id, {day_expr} AS d, SUM(minutes) FROM study
+    WHERE d IS NOT NULL GROUP BY user_id, d
+    """)
+    cur.execute("DROP TABLE study")
+    cur.execute("ALTER TABLE study_v3 RENAME TO study")
+
+    cur.execute("DROP TABLE streaks")
+    cur.execute("""
+    CREATE TABLE streaks (
+        user_id TEXT NOT NULL,
+        kind TEXT NOT NULL,
+        current INTEGER NOT NULL,
+        best INTEGER NOT NULL,
+        last_day INTEGER NOT NULL,
+        PRIMARY KEY (user_id, kind)
+    ) WITHOUT ROWID
+    """)
+    # (채우기는 출석/기상 저장 방식이 바뀌는 migration 8 에서)
+
+
+def _migration_8(cur):
+    # 출석/기상: 하루 한 행 -> 유저별 한 달 한 행 비트마스크 (비트 i = i+1 일)
+    cur.execute("""
+    CREATE TABLE checkins (
+        user_id TEXT NOT NULL,
+        month INTEGER NOT NULL,
+        attendance INTEGER NOT NULL DEFAULT 0,
+        wakeup INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (user_id, month)
+    ) WITHOUT ROWID
+    """)
+    masks = {}
+    for kind in CHECKIN_KINDS:
+        cur.execute(f"SELECT user_id, day FROM {kind}")
+        for user_id, day in cur.fetchall():
+            month, bit = _month_bit(day)
+            row = masks.setdefault((user_id, month), dict.fromkeys(
+                CHECKIN_KINDS, 0))
+            row[kind] |= bit
+    cur.executemany(
+        "INSERT INTO checkins (user_id, month, attendance, wakeup) "
+        "VALUES (?, ?, ?, ?)",
+        [(user_id, month, row["attendance"], row["wakeup"])
+         for (user_id, month), row in masks.items()])
+    mismatches = _verify_checkins(cur)
+    if mismatches:
+        raise RuntimeError(f"출석/기상 비트마스크 변환 불일치: {mismatches[:5]}")
+    cur.execute("DROP TABLE attendance")
+    cur.execute("DROP TABLE wakeup")
+    # (연속 기록 채우기는 공부일도 비트마스크가 되는 migration 11 에서)
+
+
+def _verify_checkins(cur):
+    # 변환 전 행 테이블과 비트마스크가 같은 답을 내는지 비교 (migration 8)
+    # 날짜 집합 / 월별 횟수 / 연속 기록을 모두 확인하고 다른 항목 목록을 반환
+    mismatches = []
+    for kind in CHECKIN_KINDS:
+        cur.execute(f"SELECT user_id, day FROM {kind} ORDER BY user_id, day")
+        rows = cur.fetchall()
+        bits = list(_checkin_days(cur, kind))
+        if rows != bits:
+            mismatches.append((kind, "days", len(rows), len(bits)))
+        counts = {}
+        for user_id, day in rows:
+            key = (user_id, _month_bit(day)[0])
+            counts[key] = counts.get(key, 0) + 1
+        cur.execute(f"SELECT user_id, month, {kind} FROM checkins "
+                    f"WHERE {kind} != 0")
+        totals = {(user_id, month): _popcount(mask)
+                  for user_id, month, mask in cur.fetchall()}
+        if counts != totals:
+            mismatches.append((kind, "counts", len(counts), len(totals)))
+        if _streaks_from_days(rows) != _streaks_from_days(bits):
+            mismatches.append((kind, "streaks"))
+    return mismatches
+
+
+def _migration_9(cur):
+    # 공부 세션 구간 (epoch 초) + 유저별 요일/시간대 누적 (요일*24+시, 월요일 0시 = 0)
+    # 예전 기록은 하루 합계(분)만 있어서 구간/히트맵은 이후 세션부터 쌓인다
+    cur.execute("""
+    CREATE TABLE study_log (
+        user_id TEXT NOT NULL,
+        started INTEGER NOT NULL,
+        ended INTEGER NOT NULL,
+        PRIMARY KEY (user_id, started)
+    ) WITHOUT ROWID
+    """)
+    cur.execute("""
+    CREATE TABLE study_hours (
+        user_id TEXT NOT NULL,
+        hour INTEGER NOT NULL,
+        seconds INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (user_id, hour)
+    ) WITHOUT ROWID
+    """)
+
+
+def _migration_10(cur):
+    # 일/주/월 단위 유저별 집계 (공부 분, 획득 경험치, 출석+기상 횟수)
+    # 기존 기록으로 공부 분/체크인은 채우고, 경험치는 날짜 기록이 없어서 0 부터
+    cur.execute("""
+    CREATE TABLE rollups (
+        period TEXT NOT NULL,
+        start INTEGER NOT NULL,
+        user_id TEXT NOT NULL,
+        minutes INTEGER NOT NULL DEFAULT 0,
+        exp INTEGER NOT NULL DEFAULT 0,
+        checkins INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (period, start, user_id)
+    ) WITHOUT ROWID
+    """)
+    cur.execute(
+        "CREATE INDEX idx_rollups_minutes ON rollups (period, start, minutes)")
+    cur.execute("CREATE INDEX idx_rollups_exp ON rollups (period, start, exp)")
+    cur.execute("SELECT user_id, day, minutes FROM study")
+    rows = [(user_id, day, minutes, 0, 0)
+            for user_id, day, minutes in cur.fetchall()]
+    for kind in CHECKIN_KINDS:
+        rows.extend((user_id, day, 0, 0, 1)
+                    for user_id, day in list(_checkin_days(cur, kind)))
+    _bump_rollups(rows, cur)
+
+
+def _migration_11(cur):
+    # 공부일(하루 STUDY_STREAK_MINUTES 분 이상)도 checkins 비트마스크로
+    # study 일별 행이 압축으로 지워져도 공부일수/연속공부를 계산할 수 있게
+    cur.execute(
+        "ALTER TABLE checkins ADD COLUMN study INTEGER NOT NULL DEFAULT 0")
+    cur.execute("SELECT user_id, day FROM study WHERE minutes >= ?",
+                (STUDY_STREAK_MINUTES, ))
+    _set_study_bits(cur, cur.fetchall())
+    cur.execute("DELETE FROM streaks")
+    _write_streaks(cur, _compute_streaks(cur))
+
+
+def _migration_12(cur):
+    # 진행 중 세션을 주기적으로 정산 - 어디까지 정산했는지 (NULL 이면 아직, 시작부터)와
+    # 그때까지 준 경험치 (퇴장/복구 때 나머지만 주도록)
+    cur.execute("ALTER TABLE open_sessions ADD COLUMN credited TEXT")
+    cur.execute("ALTER TABLE open_sessions "
+                "ADD COLUMN credited_exp INTEGER NOT NULL DEFAULT 0")
+
+
+MIGRATIONS = [
+    _migration_1,
+    _migration_2,
+    _migration_3,
+    _migration_4,
+    _migration_5,
+    _migration_6,
+    _migration_7,
+    _migration_8,
+    _migration_9,
+    _migration_10,
+    _migration_11,
+    _migration_12,
+]
+
+
+def enable_incremental_vacuum():
+    # auto_vacuum 은 VACUUM 을 해야 바뀐다 - 예전 DB 는 한 번만 전체 VACUUM (트랜잭션 밖에서)
+    if cursor.execute("PRAGMA auto_vacuum").fetchone()[0] == 2:
+        return
+    cursor.execute("PRAGMA auto_vacuum=INCREMENTAL")
+    cursor.execute("VACUUM")
+
+
+def migrate():
+    # 봇 시작 시 현재 버전 이후의 마이그레이션을 순서대로 적용
+    version = cursor.execute("PRAGMA user_version").fetchone()[0]
+    for number, step in enumerate(MIGRATIONS[version:], start=version + 1):
+        cursor.execute("BEGIN")
+        try:
+            step(cursor)
+            cursor.execute(f"PRAGMA user_version = {number}")
+        except Exception:
+            conn.rollback()
+            raise
+        conn.commit()
+
+
+def open_reader():
+    # 현재 스레드에 읽기 전용 커넥션을 붙인다 (reader 풀 initializer)
+    uri = Path(DB_PATH).resolve().as_uri() + "?mode=ro"
+    reader = sqlite3.connect(uri, uri=True, check_same_thread=False,
+                             timeout=5)
+    _local.cursor = reader.cursor()
+
+
+def _read_cursor():
+    # reader 스레드면 자기 커넥션, 아니면 공용 커서
+    return getattr(_local, "cursor", cursor)
+
+
+def _commit():
+    # 그룹 커밋 중에는 writer 가 모아서 한 번에 커밋한다
+    if not group_commit:
+        conn.commit()
+
+
+# ==============================
+# 날짜 <-> 일 번호 변환
+# ==============================
+
+
+def now_kst():
+    return datetime.now(KST)
+
+
+def to_day(value):
+    # date / datetime / "YYYY-MM-DD" / 일 번호 -> 일 번호
+    if isinstance(value, int):
+        return value
+    if isinstance(value, str):
+        value = date.fromisoformat(value[:10])
+    elif isinstance(value, datetime):
+        if value.tzinfo is not None:
+            value = value.astimezone(KST)
+        value = value.date()
+    return value.toordinal() - _EPOCH_ORDINAL
+
+
+def from_day(day):
+    return date.fromordinal(day + _EPOCH_ORDINAL)
+
+
+def day_str(day):
+    return from_day(day).isoformat()
+
+
+def _today():
+    return to_day(now_kst())
+
+
+# ==============================
+# 출석/기상 월별 비트마스크
+# checkins.month = YYYYMM, 비트 (일 - 1) 이 켜져 있으면 그날 체크인
+# ==============================
+
+CHECKIN_KINDS = ("attendance", "wakeup")
+
+
+def _month_bit(day):
+    # 일 번호 -> (YYYYMM, 그날 비트)
+    d = from_day(day)
+    return d.year * 100 + d.month, 1 << (d.day - 1)
+
+
+def _month_key(month):
+    # "YYYY-MM" <-> YYYYMM
+    if isinstance(month, str):
+        year, mon = month.split("-")
+        return int(year) * 100 + int(mon)
+    return f"{month // 100:04d}-{month % 100:02d}"
+
+
+def _month_first(month):
+    # YYYYMM -> 그 달 1일의 일 번호
+    return to_day(date(month // 100, month % 100, 1))
+
+
+def _mask_days(month, mask):
+    # 비트마스크 -> 일 번호 목록 (오름차순)
+    first = _month_first(month)
+    days = []
+    while mask:
+        low = mask & -mask
+        days.append(first + low.bit_length() - 1)
+        mask ^= low
+    return days
+
+
+def _range_mask(month, start, end):
+    # 그 달에서 [start, end] 일 번호 구간에 해당하는 비트
+    first = _month_first(month)
+    lo = max(start - first, 0)
+    hi = min(end - first, 30)
+    if hi < lo:
+        return 0
+    return (1 << (hi + 1)) - (1 << lo)
+
+
+def _popcount(mask):
+    return bin(mask).count("1")
+
+
+def _checkin(user_id, kind, today):
+    # 오늘 비트를 켠다 - 이미 켜져 있었으면 False
+    month, bit = _month_bit(today)
+    cursor.execute(
+        f"""
+        INSERT INTO checkins (user_id, month, {kind}) VALUES (?, ?, ?)
+        ON CONFLICT(user_id, month) DO UPDATE SET {kind} = {kind} | excluded.{kind}
+        WHERE {kind} & excluded.{kind} = 0
+    """, (user_id, month, bit))
+    return cursor.rowcount > 0
+
+
+def _set_study_bits(cur, rows):
+    # rows: [(user_id, 일 번호), ...] - 공부일 비트를 켠다 (이미 켜져 있으면 그대로)
+    masks = {}
+    for user_id, day in rows:
+        month, bit = _month_bit(day)
+        masks[(user_id, month)] = masks.get((user_id, month), 0) | bit
+    cur.executemany(
+        """
+        INSERT INTO checkins (user_id, month, study) VALUES (?, ?, ?)
+        ON CONFLICT(user_id, month) DO UPDATE SET study = study | excluded.study
+    """, [(user_id, month, mask) for (user_id, month), mask in masks.items()])
+
+
+def _checkin_days(cur, kind, user_id=None):
+    # (user_id, 일 번호) 를 유저/날짜 순으로 - 연속 기록 재계산용
+    where, params = ("AND user_id=?", (user_id, )) if user_id else ("", ())
+    cur.execute(
+        f"""
+        SELECT user_id, month, {kind} FROM checkins
+        WHERE {kind} != 0 {where} ORDER BY user_id, month
+    """, params)
+    for uid, month, mask in cur.fetchall():
+        for day in _mask_days(month, mask):
+            yield uid, day
+
+
+_REGISTER_USER = """
+    INSERT INTO users (user_id, nickname, exp) VALUES (?, ?, 0)
+    ON CONFLICT(user_id) DO NOTHING
+"""
+
+_UPSERT_STUDY = """
+    INSERT INTO study (user_id, day, minutes) VALUES (?, ?, ?)
+    ON CONFLICT(user_id, day) DO UPDATE SET minutes = minutes + excluded.minutes
+"""
+
+_UPSERT_EXP = """
+    INSERT INTO users (user_id, nickname, exp, level)
+    VALUES (?, 'Unknown', ?, ?)
+    ON CONFLICT(user_id) DO UPDATE SET
+        exp = exp + excluded.exp,
+        level = ?
+"""
 
 
 def _register_user(user_id, nickname):
-    cursor.execute("SELECT * FROM users WHERE user_id=?", (user_id, ))
-    if not cursor.fetchone():
-        cursor.execute(
-            "INSERT INTO users (user_id, nickname, exp) VALUES (?, ?, 0)",
-            (user_id, nickname))
+    cursor.execute(_REGISTER_USER, (user_id, nickname))
+    leaderboard.ensure(user_id, nickname)
 
 
 def save_attendance(user_id, nickname):
-    today = datetime.now().strftime("%Y-%m-%d")
-    cursor.execute("SELECT * FROM attendance WHERE user_id=? AND date=?",
-                   (user_id, today))
-    if cursor.fetchone():
+    today = _today()
+    if not _checkin(user_id, "attendance", today):
         return False
-    cursor.execute("INSERT INTO attendance (user_id, date) VALUES (?, ?)",
-                   (user_id, today))
     _register_user(user_id, nickname)
-    conn.commit()
+    _bump_rollups([(user_id, today, 0, 0, 1)])
+    _bump_streak(user_id, "attendance", today)
+    _profile_checkin(user_id, "attendance", today)
+    _commit()
     return True
 
 
 def get_attendance(user_id):
-    cursor.execute(
-        "SELECT date FROM attendance WHERE user_id=? ORDER BY date DESC",
-        (user_id, ))
-    return cursor.fetchall()
+    cur = _read_cursor()
+    cur.execute(
+        """
+        SELECT month, attendance FROM checkins
+        WHERE user_id=? AND attendance != 0 ORDER BY month DESC
+    """, (user_id, ))
+    return [(day_str(day), ) for month, mask in cur.fetchall()
+            for day in reversed(_mask_days(month, mask))]
+
+
+def _month_days(month):
+    # "YYYY-MM" -> (1일, 말일) 일 번호
+    year, mon = (int(x) for x in month.split("-"))
+    first = date(year, mon, 1)
+    next_first = (first + timedelta(days=31)).replace(day=1)
+    return to_day(first), to_day(next_first) - 1
+
+
+def get_attendance_calendar(user_id, month=None):
+    # 한 달치 출석 달력 페이지 (month: "YYYY-MM", None 이면 가장 최근 출석 달)
+    # 반환: (month, [출석한 일], 이전 출석 달 or None, 다음 출석 달 or None)
+    cur = _read_cursor()
+    if month is None:
+        cur.execute(
+            "SELECT MAX(month) FROM checkins WHERE user_id=? AND attendance != 0",
+            (user_id, ))
+        latest = cur.fetchone()[0]
+        if latest is None:
+            return None, [], None, None
+        month = _month_key(latest)
+    key = _month_key(month)
+    cur.execute(
+        "SELECT attendance FROM checkins WHERE user_id=? AND month=?",
+        (user_id, key))
+    row = cur.fetchone()
+    first = _month_first(key)
+    days = [day - first + 1 for day in _mask_days(key, row[0] if row else 0)]
+    cur.execute(
+        """
+        SELECT MAX(month) FROM checkins
+        WHERE user_id=? AND month < ? AND attendance != 0
+    """, (user_id, key))
+    older = cur.fetchone()[0]
+    cur.execute(
+        """
+        SELECT MIN(month) FROM checkins
+        WHERE user_id=? AND month > ? AND attendance != 0
+    """, (user_id, key))
+    newer = cur.fetchone()[0]
+    return (month, days, _month_key(older) if older else None,
+            _month_key(newer) if newer else None)
 
 
 def save_wakeup(user_id, nickname):
-    today = datetime.now().strftime("%Y-%m-%d")
-    cursor.execute("SELECT * FROM wakeup WHERE user_id=? AND date=?",
-                   (user_id, today))
-    if cursor.fetchone():
+    today = _today()
+    if not _checkin(user_id, "wakeup", today):
         return False
-    cursor.execute("INSERT INTO wakeup (user_id, date) VALUES (?, ?)",
-                   (user_id, today))
     _register_user(user_id, nickname)
-    conn.commit()
+    _bump_rollups([(user_id, today, 0, 0, 1)])
+    _bump_streak(user_id, "wakeup", today)
+    _profile_checkin(user_id, "wakeup", today)
+    _commit()
     return True
 
 
 def log_study_time(user_id, minutes):
-    today = datetime.now().strftime("%Y-%m-%d")
+    today = _today()
     _register_user(user_id, "Unknown")  # 자동 등록 보장
-    cursor.execute("SELECT minutes FROM study WHERE user_id=? AND date=?",
-                   (user_id, today))
-    row = cursor.fetchone()
-    if row:
-        total = row[0] + minutes
-        cursor.execute("UPDATE study SET minutes=? WHERE user_id=? AND date=?",
-                       (total, user_id, today))
+    cursor.execute(_UPSERT_STUDY, (user_id, today, minutes))
+    _bump_rollups([(user_id, today, minutes, 0, 0)])
+    _after_study(user_id, today, minutes)
+    _commit()
+
+
+def log_study_time_many(rows):
+    # rows: [(user_id, minutes), ...] - executemany 한 번으로 처리
+    today = _today()
+    cursor.executemany(_REGISTER_USER,
+                       [(user_id, "Unknown") for user_id, _ in rows])
+    for user_id, _ in rows:
+        leaderboard.ensure(user_id)
+    cursor.executemany(_UPSERT_STUDY,
+                       [(user_id, today, minutes) for user_id, minutes in rows])
+    _bump_rollups([(user_id, today, minutes, 0, 0)
+                   for user_id, minutes in rows])
+    totals = {}
+    for user_id, minutes in rows:
+        totals[user_id] = totals.get(user_id, 0) + minutes
+    for user_id, minutes in totals.items():
+        _after_study(user_id, today, minutes)
+    _commit()
+
+
+# ==============================
+# 공부 세션 구간 / 요일·시간대 히트맵
+# 세션 하나를 (시작, 끝) 구간으로 남기고
+# - 하루 합계(study)는 KST 자정에서 나눠서 각 날짜에
+# - 히트맵(study_hours)은 정시마다 나눠서 요일*24+시 칸에 바로 더한다
+# ==============================
+
+HOURS_PER_WEEK = 7 * 24
+
+_INSERT_STUDY_LOG = """
+    INSERT OR IGNORE INTO study_log (user_id, started, ended) VALUES (?, ?, ?)
+"""
+
+_UPSERT_STUDY_HOURS = """
+    INSERT INTO study_hours (user_id, hour, seconds) VALUES (?, ?, ?)
+    ON CONFLICT(user_id, hour) DO UPDATE SET seconds = seconds + excluded.seconds
+"""
+
+
+def _to_epoch(value):
+    # datetime(타임존 없으면 KST) / ISO 문자열 / epoch 초 -> epoch 초
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    if isinstance(value, datetime):
+        if value.tzinfo is None:
+            value = KST.localize(value)
+        return value.timestamp()
+    return float(value)
+
+
+def _split(start, end, size):
+    # [start, end) 를 KST 기준 size 초 경계마다 자른 조각들
+    t = start
+    while t < end:
+        boundary = ((t + _KST_OFFSET) // size + 1) * size - _KST_OFFSET
+        yield t, min(boundary, end)
+        t = boundary
+
+
+def _hour_of_week(t):
+    # epoch 초 -> 월요일 0시 = 0 ... 일요일 23시 = 167 (1970-01-01 은 목요일)
+    local = int(t + _KST_OFFSET)
+    return (local // 86400 + 3) % 7 * 24 + local % 86400 // 3600
+
+
+def log_study_session(user_id, start, end):
+    log_study_session_many([(user_id, start, end)])
+
+
+def log_study_session_many(rows):
+    # rows: [(user_id, start, end), ...] - 날짜/시간대별로 모아서 executemany
+    sessions = []
+    daily = {}  # (user_id, 일 번호) -> 분
+    hourly = {}  # (user_id, 요일*24+시) -> 초
+    for user_id, start, end in rows:
+        start, end = _to_epoch(start), _to_epoch(end)
+        if end <= start:
+            continue
+        sessions.append((user_id, int(start), int(end)))
+        # 분은 세션 시작부터의 경과 분으로 나눠서 합이 전체 분과 같게
+        for a, b in _split(start, end, 86400):
+            minutes = int((b - start) // 60) - int((a - start) // 60)
+            if minutes:
+                key = (user_id, int(a + _KST_OFFSET) // 86400)
+                daily[key] = daily.get(key, 0) + minutes
+        for a, b in _split(start, end, 3600):
+            key = (user_id, _hour_of_week(a))
+            hourly[key] = hourly.get(key, 0) + b - a
+    if not sessions:
+        return
+    users = list(dict.fromkeys(user_id for user_id, _, _ in sessions))
+    cursor.executemany(_REGISTER_USER,
+                       [(user_id, "Unknown") for user_id in users])
+    for user_id in users:
+        leaderboard.ensure(user_id)
+    cursor.executemany(_INSERT_STUDY_LOG, sessions)
+    cursor.executemany(_UPSERT_STUDY,
+                       [(u, day, m) for (u, day), m in daily.items()])
+    _bump_rollups([(u, day, m, 0, 0) for (u, day), m in daily.items()])
+    cursor.executemany(_UPSERT_STUDY_HOURS,
+                       [(u, hour, round(sec))
+                        for (u, hour), sec in hourly.items()])
+    for (user_id, day), minutes in sorted(daily.items(), key=lambda x: x[0][1]):
+        _after_study(user_id, day, minutes)
+    _commit()
+
+
+def get_study_heatmap(user_id=None):
+    # 요일*24+시 168칸의 누적 공부 분 (user_id=None 이면 서버 전체)
+    cur = _read_cursor()
+    if user_id is None:
+        cur.execute("SELECT hour, SUM(seconds) FROM study_hours GROUP BY hour")
     else:
-        cursor.execute(
-            "INSERT INTO study (user_id, date, minutes) VALUES (?, ?, ?)",
-            (user_id, today, minutes))
-    conn.commit()
+        cur.execute("SELECT hour, seconds FROM study_hours WHERE user_id=?",
+                    (user_id, ))
+    heatmap = [0] * HOURS_PER_WEEK
+    for hour, seconds in cur.fetchall():
+        heatmap[hour] = seconds // 60
+    return heatmap
 
 
 def get_today_study_time(user_id):
-    today = datetime.now().strftime("%Y-%m-%d")
-    cursor.execute("SELECT minutes FROM study WHERE user_id=? AND date=?",
-                   (user_id, today))
-    row = cursor.fetchone()
+    cur = _read_cursor()
+    today = _today()
+    cur.execute("SELECT minutes FROM study WHERE user_id=? AND day=?",
+                (user_id, today))
+    row = cur.fetchone()
     return row[0] if row else 0
 
 
 def add_exp(user_id, amount):
-    cursor.execute("SELECT exp FROM users WHERE user_id=?", (user_id, ))
-    row = cursor.fetchone()
-    if row:
-        new_exp = row[0] + amount
-        cursor.execute("UPDATE users SET exp=? WHERE user_id=?",
-                       (new_exp, user_id))
-    else:
-        cursor.execute(
-            "INSERT INTO users (user_id, nickname, exp) VALUES (?, ?, ?)",
-            (user_id, "Unknown", amount))
-    conn.commit()
+    # 레벨이 올랐으면 새 레벨, 아니면 None
+    return add_exp_many([(user_id, amount)])[0]
+
+
+def add_exp_many(rows):
+    # rows: [(user_id, amount), ...] - executemany 한 번으로 처리
+    # 레벨은 랭킹 인덱스(메모리)의 경험치로 계산해서 같이 저장
+    params = []
+    results = []
+    pending = {}
+    for user_id, amount in rows:
+        user_id = str(user_id)
+        old = pending.get(user_id, leaderboard.exp(user_id))
+        new = old + amount
+        pending[user_id] = new
+        new_level = level_for_exp(new)
+        params.append((user_id, amount, level_for_exp(amount), new_level))
+        results.append(new_level if new_level > level_for_exp(old) else None)
+    cursor.executemany(_UPSERT_EXP, params)
+    today = _today()
+    _bump_rollups([(user_id, today, 0, amount, 0) for user_id, amount in rows])
+    for user_id, amount in rows:
+        _profile_exp(user_id, leaderboard.add(user_id, amount), amount)
+    _commit()
+    return results
 
 
 def get_level(user_id):
-    cursor.execute("SELECT exp FROM users WHERE user_id=?", (user_id, ))
-    row = cursor.fetchone()
-    if not row:
-        return 1
-    exp = row[0]
-    thresholds = [0, 30, 80, 150, 250, 400, 600, 900, 1300]
-    level = 1
-    for i, threshold in enumerate(thresholds):
-        if exp < threshold:
-            break
-        level = i + 1
-    return level
+    cur = _read_cursor()
+    cur.execute("SELECT level FROM users WHERE user_id=?", (user_id, ))
+    row = cur.fetchone()
+    return row[0] if row else 1
+
+
+def _sync_levels(cur):
+    # 레벨 곡선 설정이 바뀌었을 수도 있으니 저장된 레벨을 경험치 기준으로 맞춘다
+    cur.execute("SELECT user_id, exp, level FROM users")
+    changed = [(level_for_exp(exp), user_id)
+               for user_id, exp, level in cur.fetchall()
+               if level != level_for_exp(exp)]
+    cur.executemany("UPDATE users SET level=? WHERE user_id=?", changed)
+    return len(changed)
+
+
+# ==============================
+# 공부 세션 저널
+# ==============================
+
+_OPEN_SESSION = """
+    INSERT OR REPLACE INTO open_sessions
+        (user_id, guild_id, channel_id, start, msg_id)
+    VALUES (?, ?, ?, ?, ?)
+"""
+
+
+def open_session(user_id, guild_id, channel_id, start, msg_id):
+    # start: ISO 형식 문자열 (타임존 포함)
+    cursor.execute(_OPEN_SESSION,
+                   (user_id, guild_id, channel_id, start, msg_id))
+    _commit()
+
+
+def set_session_message(user_id, msg_id):
+    # 입장 공지가 나간 뒤 메시지 ID 만 채운다 (세션 행은 공지보다 먼저 만든다)
+    cursor.execute("UPDATE open_sessions SET msg_id=? WHERE user_id=?",
+                   (msg_id, user_id))
+    _commit()
+
+
+def open_sessions_many(rows):
+    # rows: [(user_id, guild_id, channel_id, start, msg_id), ...]
+    cursor.executemany(_OPEN_SESSION, rows)
+    _commit()
+
+
+def close_session(user_id):
+    cursor.execute("DELETE FROM open_sessions WHERE user_id=?", (user_id, ))
+    _commit()
+
+
+def close_sessions_many(user_ids):
+    cursor.executemany("DELETE FROM open_sessions WHERE user_id=?",
+                       [(u, ) for u in user_ids])
+    _commit()
+
+
+def get_open_sessions():
+    # [(user_id, guild_id, channel_id, start, msg_id, credited, credited_exp), ...]
+    # credited: 정산한 시각 (ISO, 아직 없으면 None)
+    cur = _read_cursor()
+    cur.execute("SELECT user_id, guild_id, channel_id, start, msg_id, "
+                "credited, credited_exp FROM open_sessions")
+    return cur.fetchall()
+
+
+def checkpoint_sessions(rows):
+    # rows: [(user_id, 정산 시작, 정산 끝, 경험치), ...]
+    # 진행 중(또는 복구 중) 세션의 구간 공부시간 + 경험치 + 저널의 정산 시각을
+    # executemany 로 한 번에 (writer 에서 한 트랜잭션) - 반환은 add_exp_many 와 같은 레벨업 목록
+    if not rows:
+        return []
+    log_study_session_many([(user_id, start, end) for user_id, start, end, _ in rows])
+    gained = [(i, user_id, exp) for i, (user_id, _, _, exp) in enumerate(rows) if exp]
+    results = [None] * len(rows)
+    if gained:
+        for (i, _, _), level in zip(gained, add_exp_many(
+                [(user_id, exp) for _, user_id, exp in gained])):
+            results[i] = level
+    cursor.executemany(
+        "UPDATE open_sessions SET credited=?, credited_exp=credited_exp+? "
+        "WHERE user_id=?",
+        [(end.isoformat() if isinstance(end, datetime) else end, exp, user_id)
+         for user_id, _, end, exp in rows])
+    _commit()
+    return results
+
+
+# ==============================
+# 유저 프로필 (profile_cache 용)
+# ==============================
+
+
+def load_profile(user_id):
+    # 캐시 미스 때 DB 에서 프로필 전체를 읽는다
+    cur = _read_cursor()
+    today = _today()
+    month = get_period_stats([user_id], *month_range())[str(user_id)]
+    week = get_period_stats([user_id], *week_range())[str(user_id)]
+    cur.execute("SELECT minutes FROM study WHERE user_id=? AND day=?",
+                (user_id, today))
+    row = cur.fetchone()
+    cur.execute("SELECT kind, current FROM streaks WHERE user_id=? AND last_day=?",
+                (user_id, today))
+    streaks = {"attendance": 0, "wakeup": 0, "study": 0}
+    streaks.update(cur.fetchall())
+    cur.execute("SELECT exp FROM users WHERE user_id=?", (user_id, ))
+    exp = (cur.fetchone() or (0, ))[0] or 0
+    return {
+        "exp": exp,
+        "level": level_for_exp(exp),
+        "today_minutes": row[0] if row else 0,
+        "streaks": streaks,
+        "month": month,
+        "week": week,
+    }
+
+
+def _profile_checkin(user_id, kind, today):
+    if not profiles.cached(user_id):
+        profiles.invalidate(user_id)
+        return
+    streak = _streak_value(user_id, kind, today)
+
+    def apply(profile):
+        profile["month"][kind] += 1
+        profile["week"][kind] += 1
+        profile["streaks"][kind] = streak
+
+    profiles.update(user_id, apply)
+
+
+def _profile_exp(user_id, exp, amount):
+    # exp: 반영 후 누적 경험치, amount: 이번에 얻은 경험치 (이번 주/달 획득분에 더함)
+
+    def apply(profile):
+        profile["exp"] = exp
+        profile["level"] = level_for_exp(exp)
+        profile["month"]["exp"] += amount
+        profile["week"]["exp"] += amount
+
+    profiles.update(user_id, apply)
+
+
+# ==============================
+# 봇 상태 저장소
+# ==============================
+
+
+def get_all_state():
+    # {key: value} - 시작 시 한 번 읽어서 state.BotState 에 올린다
+    cur = _read_cursor()
+    cur.execute("SELECT key, value FROM bot_state")
+    return {key: json.loads(value) for key, value in cur.fetchall()}
+
+
+def set_state(key, value):
+    cursor.execute("INSERT OR REPLACE INTO bot_state (key, value) VALUES (?, ?)",
+                   (key, json.dumps(value, ensure_ascii=False)))
+    _commit()
+
+
+def delete_state(key):
+    cursor.execute("DELETE FROM bot_state WHERE key=?", (key, ))
+    _commit()
+
+
+def load_leaderboard():
+    # DB 기준으로 랭킹 인덱스를 다시 채운다 (시작 시 / 커밋 실패 후)
+    cur = _read_cursor()
+    cur.execute("SELECT user_id, nickname, exp FROM users")
+    leaderboard.load(cur.fetchall())
 
 
 def get_top_users_by_exp(limit=10):
-    cursor.execute(
+    cur = _read_cursor()
+    cur.execute(
         """
         SELECT nickname, exp FROM users
         ORDER BY exp DESC
         LIMIT ?
     """, (limit, ))
-    return cursor.fetchall()
+    return cur.fetchall()
 
 
 # ==============================
@@ -151,159 +974,500 @@ def get_top_users_by_exp(limit=10):
 # ==============================
 
 
+# 한 번에 넣을 IN (...) 파라미터 수 (sqlite 변수 개수 제한 대비)
+_IN_CHUNK = 500
+
+
+def _empty_stats():
+    return {
+        "attendance": 0,
+        "wakeup": 0,
+        "study_days": 0,
+        "study_minutes": 0,
+        "exp": 0
+    }
+
+
+def get_period_stats(user_ids, start, end):
+    # user_ids 여러 명의 [start, end] 기간 통계를 집계/비트마스크 쿼리 두 번으로 계산
+    # user_ids=None 이면 기록이 있는 전체 유저
+    # 반환: {user_id(str): {"attendance", "wakeup", "study_days",
+    #                       "study_minutes", "exp"}}
+    cur = _read_cursor()
+    start, end = to_day(start), to_day(end)
+    if user_ids is None:
+        chunks = [None]
+        stats = {}
+    else:
+        ids = list(dict.fromkeys(str(u) for u in user_ids))
+        chunks = [ids[i:i + _IN_CHUNK] for i in range(0, len(ids), _IN_CHUNK)]
+        stats = {u: _empty_stats() for u in ids}
+
+    # 공부 분/획득 경험치: 기간이 딱 한 주/한 달이면 그 집계 한 행, 아니면 일 집계 합
+    # 일 집계가 압축된 구간(compacted_before 이전)은 월 집계로 - 그 부분이 달 단위가 아니면
+    # 정확히 셀 수 없으므로 ValueError
+    period = _rollup_period(start, end)
+    if period != "day":
+        spans = [(period, start, start)]
+    else:
+        spans = [("day", max(start, compacted_before), end)]
+        if start < compacted_before:
+            last = min(end, compacted_before - 1)
+            if (_period_start("month", start) != start
+                    or _period_start("month", last + 1) != last + 1):
+                raise ValueError(
+                    f"압축된 기간은 달 단위로만 조회 가능: {day_str(start)} ~ "
+                    f"{day_str(last)} (압축 경계 {day_str(compacted_before)})")
+            spans.append(("month", start, last))
+    # 한 기간 행이면 start = ? 로 써야 (period, start, user_id) 기본키로 유저까지 바로 찾는다
+    span_sql = " OR ".join(
+        "(period = ? AND start = ?)" if lo == hi else
+        "(period = ? AND start BETWEEN ? AND ?)" for _, lo, hi in spans)
+    span_params = [x for period_, lo, hi in spans
+                   for x in ((period_, lo) if lo == hi else (period_, lo, hi))]
+
+    for chunk in chunks:
+        if chunk is None:
+            where, params = "", []
+        else:
+            where = f"AND user_id IN ({','.join('?' * len(chunk))})"
+            params = chunk
+        cur.execute(
+            f"""
+            SELECT user_id, SUM(minutes), SUM(exp) FROM rollups
+            WHERE ({span_sql}) {where} GROUP BY user_id
+        """, [*span_params, *params])
+        for user_id, minutes, exp in cur.fetchall():
+            row = stats.setdefault(user_id, _empty_stats())
+            row["study_minutes"] = minutes
+            row["exp"] = exp
+        # 출석/기상/공부일은 기간에 걸친 달의 비트마스크를 읽어 기간 비트만 popcount
+        cur.execute(
+            f"""
+            SELECT user_id, month, attendance, wakeup, study FROM checkins
+            WHERE month BETWEEN ? AND ? {where}
+        """, [_month_bit(start)[0], _month_bit(end)[0], *params])
+        for user_id, month, attendance, wakeup, study in cur.fetchall():
+            mask = _range_mask(month, start, end)
+            row = stats.setdefault(user_id, _empty_stats())
+            row["attendance"] += _popcount(attendance & mask)
+            row["wakeup"] += _popcount(wakeup & mask)
+            row["study_days"] += _popcount(study & mask)
+    return stats
+
+
+def month_range(now=None):
+    # 이번 달 (1일, 말일) 일 번호
+    return _month_days((now or now_kst()).strftime("%Y-%m"))
+
+
+def week_range(now=None):
+    # 이번 주 (월요일, 일요일) 일 번호
+    today = to_day(now or now_kst())
+    week_start = today - from_day(today).weekday()
+    return week_start, week_start + 6
+
+
+# ==============================
+# 일/주/월 집계 (rollups) - 쓰기 함수가 바로바로 더한다
+# period: "day" / "week" (월요일 시작) / "month", start: 기간 첫날 일 번호
+# ==============================
+
+ROLLUP_PERIODS = ("day", "week", "month")
+ROLLUP_VALUES = ("minutes", "exp", "checkins")
+
+_UPSERT_ROLLUP = """
+    INSERT INTO rollups (period, start, user_id, minutes, exp, checkins)
+    VALUES (?, ?, ?, ?, ?, ?)
+    ON CONFLICT(period, start, user_id) DO UPDATE SET
+        minutes = minutes + excluded.minutes,
+        exp = exp + excluded.exp,
+        checkins = checkins + excluded.checkins
+"""
+
+
+def _period_start(period, day):
+    if period == "week":
+        return day - from_day(day).weekday()
+    if period == "month":
+        return _month_first(_month_bit(day)[0])
+    return day
+
+
+def _rollup_period(start, end):
+    # [start, end] 가 딱 한 주/한 달이면 그 단위, 아니면 "day"
+    if end - start == 6 and _period_start("week", start) == start:
+        return "week"
+    if (_period_start("month", start) == start
+            and _period_start("month", end + 1) == end + 1
+            and end - start < 31):
+        return "month"
+    return "day"
+
+
+def _bump_rollups(rows, cur=None):
+    # rows: [(user_id, 일 번호, 분, 경험치, 체크인), ...] -> 일/주/월 집계에 더한다
+    totals = {}
+    for user_id, day, minutes, exp, checkins in rows:
+        for period in ROLLUP_PERIODS:
+            key = (period, _period_start(period, day), user_id)
+            old = totals.get(key, (0, 0, 0))
+            totals[key] = (old[0] + minutes, old[1] + exp, old[2] + checkins)
+    (cur or cursor).executemany(_UPSERT_ROLLUP,
+                                [key + value for key, value in totals.items()])
+
+
+def get_period_top(period, by="minutes", limit=10, now=None):
+    # 이번 주/달 by 기준 TOP limit: [(user_id, 값), ...]
+    # (period, start, by) 인덱스를 거꾸로 읽어서 바로 끝난다
+    if by not in ROLLUP_VALUES:
+        raise ValueError(f"알 수 없는 집계 값: {by}")
+    cur = _read_cursor()
+    start = _period_start(period, to_day(now or now_kst()))
+    cur.execute(
+        f"""
+        SELECT user_id, {by} FROM rollups
+        WHERE period=? AND start=? AND {by} > 0
+        ORDER BY {by} DESC LIMIT ?
+    """, (period, start, limit))
+    return cur.fetchall()
+
+
 def get_monthly_stats(user_id):
-    now = datetime.now()
-    month_start = now.replace(day=1).strftime("%Y-%m-%d")
-    next_month = (now.replace(day=28) + timedelta(days=4)).replace(
-        day=1)  # 다음 달 1일
-    month_end = (next_month - timedelta(days=1)).strftime("%Y-%m-%d")
+    return get_period_stats([user_id], *month_range())[str(user_id)]
 
-    # 출석
-    cursor.execute(
-        """
-        SELECT COUNT(DISTINCT date) FROM attendance
-        WHERE user_id=? AND date BETWEEN ? AND ?
-    """, (user_id, month_start, month_end))
-    attendance = cursor.fetchone()[0]
 
-    # 기상
-    cursor.execute(
-        """
-        SELECT COUNT(DISTINCT date) FROM wakeup
-        WHERE user_id=? AND date BETWEEN ? AND ?
-    """, (user_id, month_start, month_end))
-    wakeup = cursor.fetchone()[0]
+def get_weekly_stats(user_id):
+    return get_period_stats([user_id], *week_range())[str(user_id)]
 
-    # 공부일수 (하루 10분 이상)
-    cursor.execute(
-        """
-        SELECT COUNT(DISTINCT date) FROM study
-        WHERE user_id=? AND date BETWEEN ? AND ? AND minutes >= 10
-    """, (user_id, month_start, month_end))
-    study_days = cursor.fetchone()[0]
 
-    # 총 공부시간
+# ==============================
+# 연속 출석/기상/공부일수 함수
+# ==============================
+
+
+# 10분 이상 공부한 날만 streak로 인정
+STUDY_STREAK_MINUTES = 10
+
+STREAK_KINDS = ("attendance", "wakeup", "study")
+
+# 어제 연속이었으면 +1, 오늘 이미 했으면 그대로, 아니면 1부터
+# (지난 날짜 기록이 늦게 들어와도 마지막 날짜를 되돌리지 않는다)
+_BUMP_STREAK = """
+    INSERT INTO streaks (user_id, kind, current, best, last_day)
+    VALUES (?, ?, 1, 1, ?)
+    ON CONFLICT(user_id, kind) DO UPDATE SET
+        current = CASE WHEN last_day = excluded.last_day THEN current
+                       WHEN last_day = excluded.last_day - 1 THEN current + 1
+                       ELSE 1 END,
+        best = MAX(best, CASE WHEN last_day = excluded.last_day THEN current
+                              WHEN last_day = excluded.last_day - 1 THEN current + 1
+                              ELSE 1 END),
+        last_day = excluded.last_day
+    WHERE excluded.last_day >= last_day
+"""
+
+
+def _bump_streak(user_id, kind, today):
+    cursor.execute(_BUMP_STREAK, (user_id, kind, today))
+
+
+def _after_study(user_id, today, minutes):
+    # 방금 minutes 분이 더해진 today(일 번호) 공부 기록 기준으로 연속공부/프로필 갱신
+    cursor.execute("SELECT minutes FROM study WHERE user_id=? AND day=?",
+                   (user_id, today))
+    total = cursor.fetchone()[0]
+    crossed = total - minutes < STUDY_STREAK_MINUTES <= total
+    if total >= STUDY_STREAK_MINUTES:
+        _checkin(user_id, "study", today)
+        _bump_streak(user_id, "study", today)
+    if not profiles.cached(user_id) or today != _today():
+        # 자정을 넘긴 세션의 어제 몫 등은 그냥 다시 읽게 한다
+        profiles.invalidate(user_id)  # 읽는 중인 프로필이 있으면 버리게
+        return
+    streak = _streak_value(user_id, "study", today) if crossed else None
+
+    def apply(profile):
+        profile["today_minutes"] = total
+        for period in ("month", "week"):
+            profile[period]["study_minutes"] += minutes
+            if crossed:
+                profile[period]["study_days"] += 1
+        if streak is not None:
+            profile["streaks"]["study"] = streak
+
+    profiles.update(user_id, apply)
+
+
+def _streak_value(user_id, kind, today):
     cursor.execute(
         """
-        SELECT COALESCE(SUM(minutes), 0) FROM study
-        WHERE user_id=? AND date BETWEEN ? AND ?
-    """, (user_id, month_start, month_end))
-    study_minutes = cursor.fetchone()[0]
-
-    # 획득 경험치
-    cursor.execute("""
-        SELECT exp FROM users WHERE user_id=?
-    """, (user_id, ))
+        SELECT current FROM streaks
+        WHERE user_id=? AND kind=? AND last_day=?
+    """, (user_id, kind, today))
     row = cursor.fetchone()
-    exp = row[0] if row else 0
+    return row[0] if row else 0
 
-    return {
-        "attendance": attendance,
-        "wakeup": wakeup,
-        "study_days": study_days,
-        "study_minutes": study_minutes,
-        "exp": exp
-    }
 
+def get_streak_attendance(user_id):
+    return _get_streak("attendance", user_id)
 
-def get_weekly_stats(user_id):
-    now = datetime.now()
-    week_start = (now - timedelta(days=now.weekday())).strftime("%Y-%m-%d")
-    week_end = (now + timedelta(days=6 - now.weekday())).strftime("%Y-%m-%d")
 
-    # 출석
-    cursor.execute(
-        """
-        SELECT COUNT(DISTINCT date) FROM attendance
-        WHERE user_id=? AND date BETWEEN ? AND ?
-    """, (user_id, week_start, week_end))
-    attendance = cursor.fetchone()[0]
+def get_streak_wakeup(user_id):
+    return _get_streak("wakeup", user_id)
 
-    # 기상
-    cursor.execute(
-        """
-        SELECT COUNT(DISTINCT date) FROM wakeup
-        WHERE user_id=? AND date BETWEEN ? AND ?
-    """, (user_id, week_start, week_end))
-    wakeup = cursor.fetchone()[0]
 
-    # 공부일수 (하루 10분 이상)
-    cursor.execute(
+def get_streak_study(user_id):
+    return _get_streak("study", user_id)
+
+
+def _get_streak(kind, user_id):
+    # 오늘 기록이 있어야 연속으로 인정 (없으면 0)
+    cur = _read_cursor()
+    today = _today()
+    cur.execute(
         """
-        SELECT COUNT(DISTINCT date) FROM study
-        WHERE user_id=? AND date BETWEEN ? AND ? AND minutes >= 10
-    """, (user_id, week_start, week_end))
-    study_days = cursor.fetchone()[0]
+        SELECT current FROM streaks
+        WHERE user_id=? AND kind=? AND last_day=?
+    """, (user_id, kind, today))
+    row = cur.fetchone()
+    return row[0] if row else 0
 
-    # 총 공부시간
-    cursor.execute(
+
+def _streak_days(cur, kind):
+    # (user_id, 일 번호) 를 유저/날짜 순으로 - 달마다 비트를 훑는다
+    return list(_checkin_days(cur, kind))
+
+
+def _streaks_from_days(days):
+    # days: 유저/날짜 순 (user_id, 일 번호) -> {user_id: (current, best, last_day)}
+    result = {}
+    prev_user, prev_day = None, None
+    current = best = 0
+    for user_id, day in days:
+        if user_id != prev_user:
+            current = 1
+            best = 0
+        elif day == prev_day + 1:
+            current += 1
+        elif day != prev_day:
+            current = 1
+        best = max(best, current)
+        result[user_id] = (current, best, day)
+        prev_user, prev_day = user_id, day
+    return result
+
+
+def _compute_streaks(cur):
+    # 원본 기록에서 연속 기록을 다시 계산
+    # 반환: {(user_id, kind): (current, best, last_day)}
+    result = {}
+    for kind in STREAK_KINDS:
+        for user_id, streak in _streaks_from_days(_streak_days(cur, kind)).items():
+            result[(user_id, kind)] = streak
+    return result
+
+
+def _write_streaks(cur, streaks):
+    cur.executemany(
         """
-        SELECT COALESCE(SUM(minutes), 0) FROM study
-        WHERE user_id=? AND date BETWEEN ? AND ?
-    """, (user_id, week_start, week_end))
-    study_minutes = cursor.fetchone()[0]
-
-    # 획득 경험치
-    cursor.execute("""
-        SELECT exp FROM users WHERE user_id=?
-    """, (user_id, ))
-    row = cursor.fetchone()
-    exp = row[0] if row else 0
+        INSERT OR REPLACE INTO streaks (user_id, kind, current, best, last_day)
+        VALUES (?, ?, ?, ?, ?)
+    """, [(u, k, c, b, d) for (u, k), (c, b, d) in streaks.items()])
 
-    return {
-        "attendance": attendance,
-        "wakeup": wakeup,
-        "study_days": study_days,
-        "study_minutes": study_minutes,
-        "exp": exp
-    }
+
+def check_streaks(fix=False):
+    # 저장된 연속 기록이 원본 데이터와 맞는지 검사
+    # 반환: [(user_id, kind, 저장값, 재계산값), ...]  fix=True 면 재계산값으로 덮어씀
+    expected = _compute_streaks(cursor)
+    cursor.execute("SELECT user_id, kind, current, best, last_day FROM streaks")
+    stored = {(u, k): (c, b, d) for u, k, c, b, d in cursor.fetchall()}
+    mismatches = [(u, k, stored.get((u, k)), expected.get((u, k)))
+                  for (u, k) in expected.keys() | stored.keys()
+                  if stored.get((u, k)) != expected.get((u, k))]
+    if fix and mismatches:
+        cursor.execute("DELETE FROM streaks")
+        _write_streaks(cursor, expected)
+        _commit()
+    return mismatches
 
 
 # ==============================
-# 연속 출석/기상/공부일수 함수
+# 오래된 원본 기록 압축 (retention)
+# 기준일(COMPACT_HORIZON_DAYS 일 전이 속한 달의 1일) 이전의
+# - study 일별 행: 월 집계(rollups month) + 공부일 비트(checkins.study) 로 접고 삭제
+# - rollups 일 집계: 주/월 집계가 남아 있으므로 삭제
+# - study_log 세션 구간: 히트맵(study_hours)에 이미 더해져 있으므로 삭제
+# 출석/기상은 이미 한 달 한 행 비트마스크라 더 접을 것이 없다
+# 실행 순서는 async_db.compact 가 조율 (달마다, COMPACT_BATCH 명씩 나눈 쓰기로 writer 큐에)
 # ==============================
 
+COMPACT_HORIZON_DAYS = int(os.getenv("COMPACT_HORIZON_DAYS", "180"))
+COMPACT_BATCH = int(os.getenv("COMPACT_BATCH", "200"))  # 쓰기 한 번에 접고 지울 유저 수
 
-def get_streak_attendance(user_id):
-    return _get_streak_days("attendance", user_id)
+# 이 날짜(일 번호) 이전은 일 단위 집계가 없다 - bot_state 에 저장
+compacted_before = 0
 
+# 테이블 -> (날짜 컬럼, 추가 조건, 일 번호 -> 컬럼 값, 컬럼 값 -> 일 번호)
+_COMPACT_TARGETS = {
+    "study": ("day", "", lambda day: day, lambda value: value),
+    "rollups": ("start", "period = 'day' AND ", lambda day: day,
+                lambda value: value),
+    "study_log": ("started", "", lambda day: day * 86400 - _KST_OFFSET,
+                  lambda value: (value + _KST_OFFSET) // 86400),
+}
+COMPACT_TABLES = tuple(_COMPACT_TARGETS)
 
-def get_streak_wakeup(user_id):
-    return _get_streak_days("wakeup", user_id)
 
+def load_compacted_before():
+    # 시작 시 / 커밋 실패 후 (롤백된 경계로 되돌림)
+    global compacted_before
+    compacted_before = get_all_state().get("compacted_before", 0)
 
-def get_streak_study(user_id):
-    # 10분 이상 공부한 날만 streak로 인정
+
+def compaction_cutoff(now=None):
+    day = to_day(now or now_kst()) - COMPACT_HORIZON_DAYS
+    return _period_start("month", day)
+
+
+def _db_bytes(cur):
+    page_size = cur.execute("PRAGMA page_size").fetchone()[0]
+    pages = cur.execute("PRAGMA page_count").fetchone()[0]
+    free = cur.execute("PRAGMA freelist_count").fetchone()[0]
+    return (pages - free) * page_size, pages * page_size
+
+
+def _table_bytes(cur):
+    # {테이블: 인덱스 포함 바이트} - dbstat 이 없는 sqlite 빌드면 None
+    try:
+        cur.execute("""
+            SELECT m.tbl_name, SUM(s.pgsize) FROM dbstat s
+            JOIN sqlite_master m ON m.name = s.name GROUP BY m.tbl_name
+        """)
+    except sqlite3.OperationalError:
+        return None
+    return dict(cur.fetchall())
+
+
+def compact_plan(cutoff):
+    # 지울 행 수와 (dbstat 이 있으면) 돌려받을 대략의 바이트 - dry-run 보고서
+    cur = _read_cursor()
+    rows = {}
+    estimate = 0
+    sizes = _table_bytes(cur)
+    for table, (column, extra, to_value, _) in _COMPACT_TARGETS.items():
+        cur.execute(f"SELECT COUNT(*) FROM {table} WHERE {extra}{column} < ?",
+                    (to_value(cutoff), ))
+        rows[table] = cur.fetchone()[0]
+        if sizes is not None and rows[table]:
+            total = cur.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+            estimate += sizes.get(table, 0) * rows[table] // total
+    used, file_bytes = _db_bytes(cur)
+    return {
+        "cutoff": day_str(cutoff),
+        "rows": rows,
+        "rows_total": sum(rows.values()),
+        "bytes_used": used,
+        "bytes_file": file_bytes,
+        "bytes_estimated": estimate if sizes is not None else None,
+    }
+
+
+def compaction_months(cutoff):
+    # 압축할 달마다 그 달의 끝(다음 달 1일) 일 번호 - 남은 가장 오래된 기록의 달부터 기준일까지
+    cur = _read_cursor()
+    oldest = cutoff
+    for table, (column, extra, to_value, from_value) in _COMPACT_TARGETS.items():
+        cur.execute(f"SELECT MIN({column}) FROM {table} WHERE {extra}{column} < ?",
+                    (to_value(cutoff), ))
+        value = cur.fetchone()[0]
+        if value is not None:
+            oldest = min(oldest, from_value(value))
+    ends = []
+    month = _period_start("month", oldest)
+    while month < cutoff:
+        month = _period_start("month", month + 31)
+        ends.append(month)
+    return ends
+
+
+def compact_chunk(end, after="", limit=COMPACT_BATCH):
+    # end(어느 달의 1일) 이전 기록이 남은 유저 중 user_id 가 after 다음인 limit 명 몫을 접고 지운다
+    # async_db.compact 가 오래된 달부터 부르므로 보통은 한 달치만 남아 있다
+    # 한 유저의 접기/삭제는 같은 쓰기 안에서 끝나고, 접기는 몇 번 해도 결과가 같아서
+    # 중간에 멈춰도 다시 돌리면 이어서 처리된다
+    # 반환: ({테이블: 지운 행 수}, 다음 호출의 after - 이 달이 끝났으면 None)
+    union = " UNION ".join(
+        f"SELECT user_id FROM {table} WHERE {extra}{column} < ? AND user_id > ?"
+        for table, (column, extra, _, _) in _COMPACT_TARGETS.items())
+    cursor.execute(f"{union} ORDER BY user_id LIMIT ?",
+                   [x for _, _, to_value, _ in _COMPACT_TARGETS.values()
+                    for x in (to_value(end), after)] + [limit])
+    users = [row[0] for row in cursor.fetchall()]
+    deleted = dict.fromkeys(COMPACT_TABLES, 0)
+    if not users:
+        return deleted, None
+    last = users[-1]
     cursor.execute(
         """
-        SELECT date FROM study
-        WHERE user_id=? AND minutes >= 10
-        ORDER BY date DESC
-    """, (user_id, ))
-    rows = [row[0] for row in cursor.fetchall()]
-    return _calculate_streak_from_dates(rows)
+        SELECT user_id, day, minutes FROM study
+        WHERE user_id > ? AND user_id <= ? AND day < ?
+    """, (after, last, end))
+    rows = cursor.fetchall()
+    _set_study_bits(cursor, [(user_id, day) for user_id, day, minutes in rows
+                             if minutes >= STUDY_STREAK_MINUTES])
+    months = {}
+    for user_id, day, minutes in rows:
+        key = (_period_start("month", day), user_id)
+        months[key] = months.get(key, 0) + minutes
+    # 월 집계는 공부를 기록할 때마다 같이 늘어나므로 덮어쓰지 않고 모자랄 때만 채운다
+    cursor.executemany(
+        """
+        INSERT INTO rollups (period, start, user_id, minutes)
+        VALUES ('month', ?, ?, ?)
+        ON CONFLICT(period, start, user_id) DO UPDATE SET
+            minutes = MAX(minutes, excluded.minutes)
+    """, [key + (minutes, ) for key, minutes in months.items()])
+    for table, (column, extra, to_value, _) in _COMPACT_TARGETS.items():
+        cursor.execute(
+            f"""
+            DELETE FROM {table}
+            WHERE {extra}{column} < ? AND user_id > ? AND user_id <= ?
+        """, (to_value(end), after, last))
+        deleted[table] = cursor.rowcount
+    _commit()
+    return deleted, (last if len(users) == limit else None)
 
 
-def _get_streak_days(table, user_id):
-    cursor.execute(
-        f"""
-        SELECT date FROM {table}
-        WHERE user_id=?
-        ORDER BY date DESC
-    """, (user_id, ))
-    rows = [row[0] for row in cursor.fetchall()]
-    return _calculate_streak_from_dates(rows)
+def advance_compaction(end):
+    # 한 달의 마지막 묶음까지 끝난 뒤에만 압축 경계를 end 로
+    global compacted_before
+    if end > compacted_before:
+        set_state("compacted_before", end)
+        compacted_before = end
 
 
-def _calculate_streak_from_dates(date_list):
-    if not date_list:
-        return 0
-    streak = 0
-    today = datetime.now().date()
-    for d in date_list:
-        d_date = datetime.strptime(d, "%Y-%m-%d").date()
-        if (today - d_date).days == streak:
-            streak += 1
-        else:
-            break
-    return streak
+def finish_compaction():
+    # 다 지운 뒤 incremental vacuum (시작할 때 INCREMENTAL 로 맞춰 두지만 혹시 아니면 건너뜀)
+    incremental = cursor.execute("PRAGMA auto_vacuum").fetchone()[0] == 2
+    if incremental:
+        # sqlite3 모듈은 결과 없는 PRAGMA 를 한 단계만 실행해서 한 번에 한 페이지씩
+        free = cursor.execute("PRAGMA freelist_count").fetchone()[0]
+        for _ in range(free):
+            cursor.execute("PRAGMA incremental_vacuum(1)")
+    _commit()
+    used, file_bytes = _db_bytes(cursor)
+    return {
+        "vacuum": "incremental" if incremental else "none",
+        "bytes_used_after": used,
+        "bytes_file_after": file_bytes,
+    }
+
+
+# 모듈 로드 시 스키마를 최신으로
+migrate()
+_sync_levels(cursor)
+conn.commit()
+enable_incremental_vacuum()
+load_leaderboard()
+load_compacted_before()
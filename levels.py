@@ -0,0 +1,34 @@
+import bisect
+import os
+
+# ==============================
+# 레벨 곡선 (랭킹/내정보/DB 가 모두 이것만 사용)
+# 앞부분은 기존 구간을 그대로 두고, 그 뒤는 구간 폭을 GROWTH 배씩 늘려 LEVEL_CAP 까지
+# 구간 배열은 모듈 로드 시 한 번만 만들고 조회는 bisect
+# ==============================
+
+# 이미 쌓인 레벨이 바뀌지 않도록 기존 구간 유지
+BASE_THRESHOLDS = [0, 30, 80, 150, 250, 400, 600, 900, 1300]
+LEVEL_CAP = int(os.getenv("LEVEL_CAP", "100"))
+GROWTH = float(os.getenv("LEVEL_GROWTH", "1.2"))
+
+
+def build_thresholds(base=BASE_THRESHOLDS, cap=LEVEL_CAP, growth=GROWTH):
+    # thresholds[i] = 레벨 i+1 이 되는 최소 경험치
+    # 구간 폭을 앞 구간에서 이어 가므로 최소 두 레벨은 있어야 한다
+    if cap < 2:
+        raise ValueError(f"LEVEL_CAP 은 2 이상이어야 함: {cap}")
+    thresholds = list(base[:cap])
+    step = thresholds[-1] - thresholds[-2]
+    while len(thresholds) < cap:
+        step = round(step * growth)
+        thresholds.append(thresholds[-1] + step)
+    return thresholds
+
+
+THRESHOLDS = build_thresholds()
+
+
+def level_for_exp(exp):
+    return max(1, bisect.bisect_right(THRESHOLDS, exp or 0))
+
@@ -0,0 +1,529 @@
+import argparse
+import asyncio
+import functools
+import json
+import os
+import random
+import tempfile
+import threading
+import time
+from datetime import datetime, time as dtime, timedelta
+
+from pytz import timezone
+
+import bench
+
+# ==============================
+# main.py 핸들러 부하 테스트 (디스코드 연결 없이)
+# 가짜 서버/멤버/채널/메시지/ctx 로 음성 입퇴장과 명령어 이벤트를 임시 DB 에 재생하고
+# 이벤트 종류별 처리 지연, 이벤트 루프 지연(lag), DB 시간, 실제로 나간 전송/수정 수를 잰다
+#
+#   python loadtest.py --users 300 --scenario all --out loadtest.json
+#   python loadtest.py --trace my_trace.json
+#
+# 시나리오
+# - rush: 300명이 몇 초 안에 입장 -> 마이크 토글 -> 일부 10분 미만 퇴장 -> 정산 두 번 -> 나머지 한꺼번에 퇴장
+# - midnight: 23:40 입장, 00:20 퇴장 (세션이 날짜별로 나뉨) 후 새 날 출석 몰림
+# - morning: 06:30 기상 인증 몰림 (중복 포함), 08:55 / 09:05 출석 몰림 (9시 지각 경계), 통계 명령어
+# - random: 하루 동안 입퇴장/토글/명령어가 섞인 무작위 트레이스
+#
+# 트레이스(--trace) 형식: [{"name", "set": "HH:MM", "day": 0, "advance": 분,
+#                           "events": [[초, 종류, 유저 번호, 인자], ...]}, ...]
+# 종류: join / leave / move(추적 안 하는 음성 채널로) / toggle / command (인자: "출석", "주간랭킹 경험치" ...)
+#       / tick (진행 중 세션 정산 + 공부 중 보드 갱신, 유저 번호는 무시)
+# 시간은 가짜 시계로 옮기고, 레이트 리밋 대기는 --time-scale 배로 줄여서 돌린다
+# ==============================
+
+KST = timezone('Asia/Seoul')
+USER_ID_BASE = 100000000000000000  # bench.generate 와 같은 ID (기존 기록이 있는 유저)
+GUILD_ID = 1
+LAG_INTERVAL = 0.005  # 이벤트 루프 지연 측정 간격(초)
+
+STAT_COMMANDS = ("내정보", "월통계", "주통계", "연속출석", "연속기상", "연속공부",
+                 "출석기록", "내순위", "주간랭킹", "월간랭킹 경험치")
+
+# ==============================
+# 가짜 시계 (main.py 의 datetime.now, db.now_kst 를 대체)
+# ==============================
+
+_offset = timedelta(0)
+
+
+class _SimDatetime(datetime):
+
+    @classmethod
+    def now(cls, tz=None):
+        return datetime.now(tz) + _offset
+
+
+def sim_now():
+    return datetime.now(KST) + _offset
+
+
+def set_clock(day, hhmm):
+    # 오늘(실제 날짜) + day 일의 HH:MM 으로
+    global _offset
+    hour, minute = (int(x) for x in hhmm.split(":"))
+    base = datetime.now(KST).date() + timedelta(days=day)
+    _offset = KST.localize(datetime.combine(base, dtime(hour, minute))) - datetime.now(KST)
+
+
+def advance_clock(minutes):
+    global _offset
+    _offset += timedelta(minutes=minutes)
+
+
+# ==============================
+# discord 객체 대역
+# ==============================
+
+
+class Counters:
+
+    def __init__(self):
+        self.sends = 0
+        self.edits = 0
+        self.embeds = 0
+        self.api_seconds = 0.0
+
+
+class StubMessage:
+
+    def __init__(self, channel, message_id):
+        self.channel = channel
+        self.id = message_id
+
+    async def pin(self):
+        await self.channel.api_call()
+
+
+class StubPartialMessage:
+
+    def __init__(self, channel, message_id):
+        self.channel = channel
+        self.id = message_id
+
+    async def edit(self, **kwargs):
+        await self.channel.api_call()
+        self.channel.counters.edits += 1
+        self.channel.counters.embeds += len(kwargs.get("embeds") or ())
+
+    async def unpin(self):
+        await self.channel.api_call()
+
+
+class StubChannel:
+    _ids = iter(range(10 ** 6, 10 ** 9))
+
+    def __init__(self, guild, channel_id, name, counters, api_latency=0.0):
+        self.guild = guild
+        self.id = channel_id
+        self.name = name
+        self.counters = counters
+        self.api_latency = api_latency
+
+    async def api_call(self):
+        started = time.perf_counter()
+        if self.api_latency:
+            await asyncio.sleep(self.api_latency)
+        self.counters.api_seconds += time.perf_counter() - started
+
+    async def send(self, **kwargs):
+        await self.api_call()
+        self.counters.sends += 1
+        embeds = kwargs.get("embeds") or ([kwargs["embed"]] if kwargs.get("embed") else [])
+        self.counters.embeds += len(embeds)
+        return StubMessage(self, next(self._ids))
+
+    def get_partial_message(self, message_id):
+        return StubPartialMessage(self, message_id)
+
+
+class StubGuild:
+
+    def __init__(self, counters, api_latency):
+        self.id = GUILD_ID
+        self.name = "loadtest"
+        self.study_voice = StubChannel(self, 10, "🎥｜캠스터디", counters, api_latency)
+        self.lounge = StubChannel(self, 11, "휴게실", counters, api_latency)
+        self.study_log = StubChannel(self, 20, "📕｜공부기록", counters, api_latency)
+        self.chat = StubChannel(self, 21, "💬｜채팅", counters, api_latency)
+        self.voice_channels = [self.study_voice, self.lounge]
+        self.text_channels = [self.study_log, self.chat]
+
+    def get_channel(self, channel_id):
+        for channel in self.voice_channels + self.text_channels:
+            if channel.id == channel_id:
+                return channel
+        return None
+
+
+class StubMember:
+
+    def __init__(self, guild, index, color):
+        self.guild = guild
+        self.id = USER_ID_BASE + index
+        self.display_name = f"user{index}"
+        self.name = self.display_name
+        self.mention = f"<@{self.id}>"
+        self.color = color
+
+
+class StubVoiceState:
+
+    def __init__(self, channel):
+        self.channel = channel
+
+
+class StubContext:
+
+    def __init__(self, member, channel):
+        self.author = member
+        self.channel = channel
+        self.guild = member.guild
+
+
+# ==============================
+# 측정
+# ==============================
+
+
+class DbTimer:
+    # async_db 의 writer/reader 경로를 감싸서 (스레드에서) 쓴 시간을 모은다
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.totals = {kind: [0, 0.0] for kind in ("write", "read", "commit")}
+
+    def add(self, kind, seconds):
+        with self._lock:
+            total = self.totals[kind]
+            total[0] += 1
+            total[1] += seconds
+
+    def wrap(self, kind, fn):
+        @functools.wraps(fn)
+        def timed(*args):
+            started = time.perf_counter()
+            try:
+                return fn(*args)
+            finally:
+                self.add(kind, time.perf_counter() - started)
+        return timed
+
+    def report(self):
+        with self._lock:
+            return {kind: {"calls": n, "seconds": round(s, 4)}
+                    for kind, (n, s) in self.totals.items()}
+
+
+def instrument_db(async_db, timer):
+    run_writes, flush, read = async_db._run_writes, async_db._flush, async_db._read
+    async_db._run_writes = timer.wrap("write", run_writes)
+    async_db._flush = timer.wrap("commit", flush)
+
+    async def timed_read(fn, *args):
+        return await read(timer.wrap("read", fn), *args)
+
+    async_db._read = timed_read
+
+
+async def _watch_lag(samples):
+    clock = time.perf_counter
+    while True:
+        started = clock()
+        await asyncio.sleep(LAG_INTERVAL)
+        samples.append(max(0.0, clock() - started - LAG_INTERVAL))
+
+
+# ==============================
+# 시나리오 (단계 목록)
+# ==============================
+
+
+def _storm(users, kind, spread, rng, arg=None):
+    return [[rng.uniform(0, spread), kind, u, arg] for u in users]
+
+
+def scenario_rush(users, day, rng, spread):
+    everyone = list(range(users))
+    short = rng.sample(everyone, users // 10)
+    rest = [u for u in everyone if u not in set(short)]
+    return [
+        {"name": "rush-join", "set": "20:00", "day": day,
+         "events": _storm(everyone, "join", spread, rng)},
+        {"name": "rush-toggle", "advance": 1,
+         "events": _storm(rng.sample(everyone, users * 3 // 10), "toggle", spread, rng)},
+        {"name": "rush-short-leave", "advance": 5,
+         "events": _storm(short, "leave", spread, rng)},
+        # 진행 중 세션 정산 + "지금 공부 중" 보드 (main.study_tick) 두 번
+        {"name": "rush-tick", "advance": 30, "events": [[0, "tick", 0, None]]},
+        {"name": "rush-tick-2", "advance": 30, "events": [[0, "tick", 0, None]]},
+        {"name": "rush-leave", "advance": 30,
+         "events": _storm(rest, "leave", spread, rng)},
+    ]
+
+
+def scenario_midnight(users, day, rng, spread):
+    everyone = list(range(users))
+    return [
+        {"name": "midnight-join", "set": "23:40", "day": day,
+         "events": _storm(everyone, "join", spread, rng)},
+        {"name": "midnight-leave", "advance": 40,
+         "events": _storm(everyone, "leave", spread, rng)},
+        {"name": "midnight-checkin", "advance": 5,
+         "events": _storm(everyone, "command", spread, rng, "출석")},
+    ]
+
+
+def scenario_morning(users, day, rng, spread):
+    everyone = list(range(users))
+    again = rng.sample(everyone, users // 5)  # 중복 인증
+    early = rng.sample(everyone, users // 2)  # 나머지는 9시 넘어서 (지각)
+    late = [u for u in everyone if u not in set(early)]
+    stats = [[rng.uniform(0, spread), "command", rng.randrange(users), rng.choice(STAT_COMMANDS)]
+             for _ in range(users)]
+    return [
+        {"name": "morning-wakeup", "set": "06:30", "day": day,
+         "events": _storm(everyone + again, "command", spread, rng, "기상")},
+        {"name": "morning-checkin", "set": "08:55", "day": day,
+         "events": _storm(early + again, "command", spread, rng, "출석")},
+        {"name": "morning-late-checkin", "set": "09:05", "day": day,
+         "events": _storm(late + again, "command", spread, rng, "출석")},
+        {"name": "morning-stats", "advance": 10, "events": stats},
+    ]
+
+
+def scenario_random(users, day, rng, spread, steps=24):
+    # 08:00 부터 30분 간격으로 steps 번, 매번 무작위 이벤트 묶음
+    inside = set()
+    phases = [{"name": "random-start", "set": "08:00", "day": day, "events": []}]
+    for step in range(steps):
+        events = []
+        for u in rng.sample(range(users), max(1, users // 10)):
+            roll = rng.random()
+            if roll < 0.4:
+                events.append([rng.uniform(0, spread), "leave" if u in inside else "join", u, None])
+                inside ^= {u}
+            elif roll < 0.6:
+                events.append([rng.uniform(0, spread), "toggle", u, None])
+            else:
+                events.append([rng.uniform(0, spread), "command", u,
+                               rng.choice(("출석", "기상") + STAT_COMMANDS)])
+        phases.append({"name": f"random-{step}", "advance": 30, "events": events})
+    phases.append({"name": "random-end", "advance": 15,
+                   "events": _storm(sorted(inside), "leave", spread, rng)})
+    return phases
+
+
+SCENARIOS = {
+    "rush": scenario_rush,
+    "midnight": scenario_midnight,
+    "morning": scenario_morning,
+    "random": scenario_random,
+}
+
+
+# ==============================
+# 재생
+# ==============================
+
+
+class Harness:
+
+    def __init__(self, main, guild, counters, timer):
+        self.main = main
+        self.guild = guild
+        self.counters = counters
+        self.timer = timer
+        self.members = {}
+        self.where = {}  # 유저 번호 -> 지금 들어가 있는 음성 채널
+
+    def member(self, index):
+        member = self.members.get(index)
+        if member is None:
+            member = self.members[index] = StubMember(self.guild, index,
+                                                       self.main.discord.Color.default())
+        return member
+
+    def handler(self, kind, index, arg):
+        # (측정 이름, 코루틴) - 음성 이벤트는 discord.py 처럼 before/after 상태로
+        member = self.member(index)
+        before = self.where.get(index)
+        if kind == "tick":
+            return kind, self.main.study_tick()
+        if kind == "command":
+            name, *args = arg.split()
+            command = self.main.bot.get_command(name)
+            return f"command:{command.name}", command(StubContext(member, self.guild.chat), *args)
+        if kind == "join":
+            after = self.guild.study_voice
+        elif kind == "move":
+            after = self.guild.lounge
+        elif kind == "leave":
+            after = None
+        elif kind == "toggle":
+            after = before
+        else:
+            raise ValueError(f"알 수 없는 이벤트: {kind}")
+        self.where[index] = after
+        return kind, self.main.on_voice_state_update(member, StubVoiceState(before),
+                                                     StubVoiceState(after))
+
+    async def dispatch(self, at, kind, index, arg, latencies, errors):
+        await asyncio.sleep(at)
+        name, coro = self.handler(kind, index, arg)
+        started = time.perf_counter()
+        try:
+            await coro
+        except Exception as e:
+            errors.setdefault(name, []).append(repr(e))
+        latencies.setdefault(name, []).append(time.perf_counter() - started)
+
+    async def drain(self):
+        # 남은 전송/수정과 커밋 전 쓰기가 모두 끝날 때까지
+        outbox, async_db = self.main.outbox, self.main.async_db
+        while async_db._pending or any(outbox._channels.values()):
+            await asyncio.sleep(0.01)
+
+    async def play(self, phases):
+        latencies, errors, lag = {}, {}, []
+        outbox_before = dict(self.main.outbox.stats)
+        counters_before = dict(vars(self.counters))
+        self.timer.reset()
+        watcher = asyncio.create_task(_watch_lag(lag))
+        events = 0
+        started = time.perf_counter()
+        for phase in phases:
+            if "set" in phase:
+                set_clock(phase.get("day", 0), phase["set"])
+            if phase.get("advance"):
+                advance_clock(phase["advance"])
+            await asyncio.gather(*(self.dispatch(at, kind, index, arg, latencies, errors)
+                                   for at, kind, index, arg in phase["events"]))
+            await self.drain()
+            events += len(phase["events"])
+        wall = time.perf_counter() - started
+        watcher.cancel()
+        lag.sort()
+        return {
+            "phases": [p.get("name") for p in phases],
+            "events": events,
+            "wall_seconds": round(wall, 3),
+            "handlers": {name: dict(bench.summarize(values, wall),
+                                    errors=len(errors.get(name, ())))
+                         for name, values in sorted(latencies.items())},
+            "errors": {name: messages[:3] for name, messages in errors.items()},
+            "loop_lag": dict(bench.summarize(lag, wall) if lag else {},
+                             max_ms=round(lag[-1] * 1000, 3) if lag else 0.0),
+            "db": self.timer.report(),
+            "discord": {key: round(value - counters_before[key], 4)
+                        for key, value in vars(self.counters).items()},
+            "outbox": {key: round(value - outbox_before[key], 4)
+                       for key, value in self.main.outbox.stats.items()},
+            "open_sessions": len(self.main.study_sessions),
+        }
+
+
+def load_trace(path):
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def run(args):
+    workdir = tempfile.mkdtemp(prefix="princess-loadtest-")
+    os.environ["PRINCESS_DB"] = os.path.join(workdir, "loadtest.db")
+    # main 은 import 시점에 DB/상태를 읽으므로 경로를 정한 다음에
+    import outbox
+    outbox.CHANNEL_PER *= args.time_scale
+    import db
+    import main
+    import async_db
+
+    rng = random.Random(args.seed)
+    if args.history_days:
+        bench.generate(db, args.users, args.history_days, rng)
+    db.now_kst = sim_now
+    main.datetime = _SimDatetime
+
+    counters = Counters()
+    timer = DbTimer()
+    instrument_db(async_db, timer)
+    harness = Harness(main, StubGuild(counters, args.api_latency), counters, timer)
+    # bot.guilds 를 도는 작업(공부 중 보드 등)이 가짜 서버를 보도록
+    main.bot._connection._guilds[GUILD_ID] = harness.guild
+
+    if args.trace:
+        plans = {os.path.basename(args.trace): load_trace(args.trace)}
+    else:
+        names = list(SCENARIOS) if args.scenario == "all" else [args.scenario]
+        # 시나리오마다 다른 날에 돌려서 서로의 출석/세션이 겹치지 않게
+        plans = {name: SCENARIOS[name](args.users, i * 2, rng, args.spread)
+                 for i, name in enumerate(names)}
+
+    async def play_all():
+        return {name: await harness.play(phases) for name, phases in plans.items()}
+
+    try:
+        results = asyncio.run(play_all())
+    finally:
+        async_db.close()
+    return {
+        "users": args.users,
+        "history_days": args.history_days,
+        "seed": args.seed,
+        "spread_seconds": args.spread,
+        "time_scale": args.time_scale,
+        "api_latency": args.api_latency,
+        "db_bytes": os.path.getsize(os.environ["PRINCESS_DB"]),
+        "scenarios": results,
+    }
+
+
+def _print_run(run_result):
+    for name, r in run_result["scenarios"].items():
+        lag = r["loop_lag"]
+        print(f"[{name}] events={r['events']} wall={r['wall_seconds']}s "
+              f"lag p99={lag.get('p99_ms', 0)}ms max={lag['max_ms']}ms "
+              f"sends={r['discord']['sends']} edits={r['discord']['edits']}")
+        print(f"  {'':22}{'n':>6}{'p50':>10}{'p95':>10}{'p99':>10}{'err':>6}")
+        for handler, h in r["handlers"].items():
+            print(f"  {handler:22}{h['n']:>6}{h['p50_ms']:>10.2f}{h['p95_ms']:>10.2f}"
+                  f"{h['p99_ms']:>10.2f}{h['errors']:>6}")
+        print("  db " + "  ".join(f"{kind}={d['calls']}/{d['seconds']}s"
+                                   for kind, d in r["db"].items()))
+        for handler, messages in r["errors"].items():
+            print(f"  ! {handler}: {messages[0]}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="main.py 핸들러 부하 테스트")
+    parser.add_argument("--users", type=int, default=300)
+    parser.add_argument("--scenario", default="all", choices=["all", *SCENARIOS])
+    parser.add_argument("--trace", help="시나리오 대신 재생할 트레이스 JSON")
+    parser.add_argument("--history-days", type=int, default=30,
+                        help="미리 채워 둘 과거 기록 일수 (bench.py 와 같은 데이터)")
+    parser.add_argument("--spread", type=float, default=2.0,
+                        help="한 단계의 이벤트가 몰리는 시간(초)")
+    parser.add_argument("--time-scale", type=float, default=0.05,
+                        help="레이트 리밋 대기 시간 배율")
+    parser.add_argument("--api-latency", type=float, default=0.05,
+                        help="가짜 디스코드 API 호출 하나의 지연(초)")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--out", default="loadtest.json")
+    parser.add_argument("--quiet", action="store_true")
+    args = parser.parse_args(argv)
+
+    report = {"meta": bench._meta(), "run": run(args)}
+    if not args.quiet:
+        _print_run(report["run"])
+    with open(args.out, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,153 @@
+import asyncio
+import os
+import sys
+import threading
+import time
+import traceback
+import weakref
+from collections import deque
+from datetime import datetime
+
+import metrics
+
+# ==============================
+# 이벤트 루프 막힘 감지 (WATCHDOG=1 일 때만)
+# - 루프 안: WATCHDOG_INTERVAL 마다 깨어나는 하트비트가 늦게 깨어난 만큼을 지연(lag)으로 기록
+# - 루프 밖: 샘플링 스레드가 하트비트가 WATCHDOG_THRESHOLD 넘게 멈춘 걸 보면
+#           그 순간 루프 스레드의 스택과 실행 중인 작업(이벤트 이름 / !명령어)을 잡아 둔다
+# - 루프가 풀리면 막힌 시간 + 잡아 둔 스택을 로그로 남기고 핸들러별 지표에 더한다
+# ==============================
+
+WATCHDOG_ENABLED = os.getenv("WATCHDOG", "0") == "1"
+WATCHDOG_INTERVAL = float(os.getenv("WATCHDOG_INTERVAL", "0.1"))  # 하트비트 간격(초)
+WATCHDOG_THRESHOLD = float(os.getenv("WATCHDOG_THRESHOLD", "0.2"))  # 이만큼 늦으면 막힘
+WATCHDOG_SAMPLE = float(os.getenv("WATCHDOG_SAMPLE", "0.02"))  # 샘플링 스레드 확인 간격
+STACK_LIMIT = 25  # 로그에 남길 스택 줄 수 (안쪽부터)
+RECENT_BLOCKS = 20  # !상태 용으로 기억할 최근 막힘 수
+
+_PROJECT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+_loop = None
+_loop_thread_id = None
+_sampler = None
+_stop = threading.Event()
+_beat = 0.0  # 하트비트가 마지막으로 돈 시각 (monotonic)
+_captured = None  # (_beat, 잡은 정보) - 지금 막힘에 대해 샘플링 스레드가 잡은 것
+_labels = weakref.WeakKeyDictionary()  # 작업 -> "!명령어" 등 표시 이름
+recent = deque(maxlen=RECENT_BLOCKS)
+
+
+def running():
+    return _sampler is not None
+
+
+def label(text):
+    # 지금 작업에 표시 이름을 붙인다 (명령어 시작 시 등) - 막힘 로그에 같이 나온다
+    try:
+        task = asyncio.current_task()
+    except RuntimeError:
+        return
+    if task is not None:
+        _labels[task] = text
+
+
+def start():
+    # 재연결로 on_ready 가 다시 불려도 한 번만 시작
+    global _loop, _loop_thread_id, _sampler, _beat
+    if not WATCHDOG_ENABLED or _sampler is not None:
+        return
+    _loop = asyncio.get_running_loop()
+    _loop_thread_id = threading.get_ident()
+    _beat = time.monotonic()
+    _stop.clear()
+    _loop.create_task(_heartbeat())
+    _sampler = threading.Thread(target=_sample_loop, name="loop-watchdog",
+                                daemon=True)
+    _sampler.start()
+    print(f"🐶 루프 감시: {WATCHDOG_INTERVAL * 1000:.0f}ms 마다, "
+          f"{WATCHDOG_THRESHOLD * 1000:.0f}ms 넘게 막히면 스택 기록")
+
+
+def stop():
+    global _sampler
+    _stop.set()
+    _sampler = None
+
+
+async def _heartbeat():
+    global _beat
+    while not _stop.is_set():
+        _beat = time.monotonic()
+        await asyncio.sleep(WATCHDOG_INTERVAL)
+        lag = max(0.0, time.monotonic() - _beat - WATCHDOG_INTERVAL)
+        metrics.observe("loop_lag_seconds", lag)
+        if lag >= WATCHDOG_THRESHOLD:
+            _report(_beat, lag)
+
+
+def _sample_loop():
+    global _captured
+    while not _stop.wait(WATCHDOG_SAMPLE):
+        beat = _beat
+        if time.monotonic() - beat < WATCHDOG_INTERVAL + WATCHDOG_THRESHOLD:
+            continue
+        if _captured is not None and _captured[0] == beat:
+            continue  # 이번 막힘은 이미 잡음
+        frame = sys._current_frames().get(_loop_thread_id)
+        if frame is None:
+            continue
+        _captured = (beat, _capture(frame))
+
+
+def _capture(frame):
+    stack = traceback.extract_stack(frame)
+    # 지금 도는 콜백 부분만 (asyncio 가 콜백을 부르는 Handle._run 다음부터)
+    for i in range(len(stack) - 1, -1, -1):
+        if stack[i].name == "_run" and stack[i].filename.endswith(
+                os.path.join("asyncio", "events.py")):
+            stack = stack[i + 1:]
+            break
+    ours = [f for f in stack if f.filename.startswith(_PROJECT_DIR)
+            and "site-packages" not in f.filename]
+    handler = where = None
+    if ours:
+        handler = f"{_module(ours[0].filename)}.{ours[0].name}"
+        where = f"{os.path.basename(ours[-1].filename)}:{ours[-1].lineno} {ours[-1].name}"
+    elif stack:
+        handler = f"{_module(stack[0].filename)}.{stack[0].name}"
+    task_name = task_label = None
+    try:
+        task = asyncio.current_task(_loop)
+    except RuntimeError:
+        task = None
+    if task is not None:
+        task_name = task.get_name()
+        task_label = _labels.get(task)
+    return {
+        "handler": handler or "?",
+        "where": where,
+        "task": task_name,
+        "label": task_label,
+        "stack": traceback.format_list(stack[-STACK_LIMIT:]),
+    }
+
+
+def _module(filename):
+    return os.path.splitext(os.path.basename(filename))[0]
+
+
+def _report(beat, lag):
+    captured = _captured[1] if _captured is not None and _captured[0] == beat else {
+        "handler": "?", "where": None, "task": None, "label": None, "stack": []}
+    handler = captured["handler"]
+    metrics.inc("loop_blocks_total", handler=handler)
+    metrics.observe("loop_block_seconds", lag, handler=handler)
+    block = dict(captured, ms=round(lag * 1000, 1),
+                 time=datetime.now().strftime("%m-%d %H:%M:%S"))
+    recent.append(block)
+    context = ", ".join(x for x in (captured["label"], captured["task"]) if x)
+    print(f"⚠️ 이벤트 루프 {block['ms']:.0f}ms 막힘 - {handler}"
+          + (f" ({context})" if context else "")
+          + (f" @ {captured['where']}" if captured["where"] else ""))
+    if captured["stack"]:
+        print("".join(captured["stack"]).rstrip())
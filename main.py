@@ -1,15 +1,27 @@
+import asyncio
+import calendar
 import discord
-from discord.ext import commands, tasks
-from datetime import datetime
+from discord.ext import commands
+from datetime import datetime, timedelta
 from pytz import timezone
 from dotenv import load_dotenv
-from db import (
-    save_attendance, get_attendance, add_exp, get_level,
-    save_wakeup, log_study_time, get_today_study_time,
-    get_top_users_by_exp, get_monthly_stats, get_weekly_stats,
-    get_streak_attendance, get_streak_wakeup, get_streak_study
+from async_db import (
+    save_attendance, get_attendance_calendar, add_exp, get_profile,
+    save_wakeup, log_study_session, get_study_heatmap, get_period_top,
+    open_session, set_session_message, open_sessions_many, close_session,
+    close_sessions_many, get_open_sessions, checkpoint_sessions, leaderboard
 )
+from outbox import Outbox
+from scheduler import Scheduler
+from state import BotState
+from channels import ChannelResolver, TRACKED_VOICE_KEY, STUDY_LOG_KEY, RANKING_KEY
+from levels import level_for_exp
+import async_db
+import backup
+import loop_watchdog
+import metrics
 import os
+import time
 
 load_dotenv()
 TOKEN = os.getenv("DISCORD_TOKEN")
@@ -19,47 +31,366 @@ intents.message_content = True
 intents.voice_states = True
 bot = commands.Bot(command_prefix="!", intents=intents)
 
-TRACKED_VOICE_CHANNELS = ["🎥｜캠스터디"]
-study_sessions = {}  # {user_id: {"start": datetime, "msg_id": int}}
-RANKING_CHANNEL_ID = 1378863730741219458  # 👑｜랭킹
-ranking_message_id = None
+# {user_id: {"start": datetime, "guild_id": int, "msg_id": int, "msg_index": int,
+#            "credited": 정산한 시각, "exp": 정산한 경험치, "leveled_up": 정산 중 레벨업,
+#            "checkpoint": 정산 쓰기 중일 때만 - 끝나면 완료되는 future}}
+study_sessions = {}
+outbox = Outbox()  # 디스코드 전송은 전부 여기로 (레이트 리밋/묶음/우선순위)
+RECOVERED_SESSION_CAP_MINUTES = 180  # 봇이 꺼져 있는 동안 나간 세션은 최대 3시간까지만 인정
+MIN_STUDY_MINUTES = 10  # 이보다 짧은 세션은 공부시간/경험치 인정 안 함
+# 진행 중 세션을 이 간격(초)마다 정산하고 "지금 공부 중" 보드를 갱신, 0 이면 퇴장 때만 정산
+STUDY_CHECKPOINT_INTERVAL = int(os.getenv("STUDY_CHECKPOINT_INTERVAL", "300"))
+STUDY_BOARD_LIMIT = 30  # 보드에 이름을 보여줄 최대 인원
+bot_state = BotState()  # 채널/메시지 ID 등 (princess.db 의 bot_state, write-through)
+bot_state.load()
+channels = ChannelResolver(bot_state)  # 서버별 공부/기록/랭킹 채널 (ID 캐시)
+# 실시간 랭킹: TOP 10 이 바뀌면 최대 이 간격(초)마다 고정 메시지 갱신, 0 이면 자정에만
+RANKING_LIVE_INTERVAL = int(os.getenv("RANKING_LIVE_INTERVAL", "0"))
+ranking_dirty = asyncio.Event()
+ranking_live_task = None
+pinned_recreating = set()  # 지워진 고정 메시지를 다시 만드는 중인 (guild_id, 설정 키)
+study_checkpoint_task = None
+study_board_last = {}  # guild_id -> 마지막으로 보낸 보드 내용 (같으면 수정 생략)
+scheduler = Scheduler()  # 예약 작업 (KST cron)
+
+# 지표 (내보낼 때 읽는 값들)
+metrics.gauge("study_sessions_active", lambda: len(study_sessions))
+metrics.gauge("db_pending_writes", lambda: async_db._pending)
+metrics.gauge("outbox_pending", outbox.pending)
+metrics.gauge("leaderboard_users", lambda: len(leaderboard))
+metrics.gauge("profile_cache_hits_total", lambda: async_db.profiles.hits)
+metrics.gauge("profile_cache_misses_total", lambda: async_db.profiles.misses)
+for _key in ("rate_limit_waits", "rate_limit_wait_seconds", "coalesced_edits", "batched_announces"):
+    metrics.gauge(f"outbox_{_key}_total", lambda key=_key: outbox.stats[key])
+
+@bot.before_invoke
+async def start_command_timer(ctx):
+    ctx.started_at = time.perf_counter()
+    loop_watchdog.label(f"!{ctx.command.qualified_name}")
+
+@bot.after_invoke
+async def record_command_time(ctx):
+    name = ctx.command.qualified_name
+    metrics.observe("command_seconds", time.perf_counter() - ctx.started_at, command=name)
+    if ctx.command_failed:
+        metrics.inc("command_errors_total", command=name)
 
 @bot.event
 async def on_ready():
     print(f"✅ {bot.user} 로 로그인 완료!")
+    await metrics.start()
+    loop_watchdog.start()
+    await recover_study_sessions()
     await setup_ranking_message()
-    update_ranking.start()
+    scheduler.start()
+    start_ranking_live()
+    start_study_checkpoints()
+
+async def recover_study_sessions():
+    # 저널에 남은 세션을 실제 음성 채널 인원과 맞춰본다
+    # - 아직 채널에 있으면 이어서 진행
+    # - 봇이 꺼진 사이 나갔으면 (상한을 둬서) 정산 후 종료
+    # - 저널에 없는데 채널에 있으면 지금부터 새 세션
+    now = datetime.now(timezone('Asia/Seoul'))
+    present = {}
+    for guild in bot.guilds:
+        for channel in guild.voice_channels:
+            if channels.is_tracked(channel):
+                for member in channel.members:
+                    if not member.bot:
+                        present[member.id] = (guild.id, channel.id)
+
+    journal = {int(row[0]): row for row in await get_open_sessions()}
+    closed = []
+    credits = []
+    for user_id, (guild_id, _, _, start, msg_id, credited, credited_exp) in journal.items():
+        start = datetime.fromisoformat(start)
+        credited = datetime.fromisoformat(credited) if credited else start
+        if user_id in present:
+            study_sessions.setdefault(user_id, {
+                'start': start,
+                'guild_id': int(guild_id) if guild_id else None,
+                'msg_id': msg_id,
+                'msg_index': 0,
+                'credited': credited,
+                'exp': credited_exp,
+                'leveled_up': None
+            })
+            continue
+        closed.append(user_id)
+        study_sessions.pop(user_id, None)
+        # 이미 정산한 구간 이후만 (전체 인정 시간은 시작부터 상한까지)
+        end = min(now, start + timedelta(minutes=RECOVERED_SESSION_CAP_MINUTES))
+        duration = (end - start).total_seconds() / 60
+        if duration >= MIN_STUDY_MINUTES and end > credited:
+            credits.append((user_id, credited, end,
+                            round((duration / 30) * 10) - credited_exp))
+
+    new_rows = []
+    for user_id, (guild_id, channel_id) in present.items():
+        if user_id not in journal and user_id not in study_sessions:
+            study_sessions[user_id] = {'start': now, 'guild_id': guild_id, 'msg_id': None,
+                                       'msg_index': 0, 'credited': now, 'exp': 0,
+                                       'leveled_up': None}
+            new_rows.append((user_id, guild_id, channel_id, now.isoformat(), None))
+
+    # 정산은 한 번의 쓰기로 (공부 구간 + 경험치)
+    await checkpoint_sessions(credits)
+    if closed:
+        await close_sessions_many(closed)
+    if new_rows:
+        await open_sessions_many(new_rows)
+    print(f"📚 공부 세션 복구: 이어감 {len(journal) - len(closed)} / "
+          f"정산 {len(closed)} / 새로 시작 {len(new_rows)}")
+
+def ranking_message_id(guild, channel):
+    # 서버 설정에 저장된 랭킹 메시지, 없으면 (예전 단일 서버용) 전역 값
+    message_id = bot_state.guild(guild.id).get("ranking_message_id")
+    if message_id is None and channel.id == bot_state.get("ranking_channel_id"):
+        message_id = bot_state.get("ranking_message_id")
+    return message_id
 
 async def setup_ranking_message():
-    global ranking_message_id
-    channel = bot.get_channel(RANKING_CHANNEL_ID)
-    async for msg in channel.history(limit=20):
-        if msg.author == bot.user and msg.embeds and "경험치 랭킹" in (msg.embeds[0].title or ""):
-            ranking_message_id = msg.id
-            break
-    else:
-        embed = make_ranking_embed()
-        msg = await channel.send(embed=embed)
-        await msg.pin()
-        ranking_message_id = msg.id
+    for guild in bot.guilds:
+        channel = channels.ranking(guild)
+        # 랭킹 채널이 없거나 저장된 랭킹 메시지가 있으면 REST 호출 없이 끝
+        if channel is None or ranking_message_id(guild, channel):
+            continue
+        # 처음 한 번만: 예전 버전이 올려둔 메시지를 찾아서 저장
+        async for msg in channel.history(limit=20):
+            if msg.author == bot.user and msg.embeds and "경험치 랭킹" in (msg.embeds[0].title or ""):
+                await bot_state.set_guild(guild.id, ranking_message_id=msg.id)
+                break
+        else:
+            await create_ranking_message(guild, channel)
+
+async def post_pinned(guild, channel, embed, key, replaces=None):
+    # 새 메시지를 올리고 서버 설정 key 에 ID 를 저장한 뒤 고정
+    # replaces: 대신하는 예전 메시지 - 아직 남아 있으면 고정을 풀어 고정 수(최대 50)가 쌓이지 않게
+    msg = await outbox.reply(channel, embed=embed)
+    # 고정 실패(권한 등)로 매번 새 메시지를 만들지 않게 ID 부터 저장
+    await bot_state.set_guild(guild.id, **{key: msg.id})
+    if replaces is not None:
+        try:
+            await channel.get_partial_message(replaces).unpin()
+        except discord.NotFound:
+            pass
+        except discord.HTTPException as e:
+            print("예전 고정 메시지 해제 실패:", e)
+    await msg.pin()
+
+def pinned_message_missing(guild, key, recreate):
+    # 저장된 고정 메시지가 지워졌을 때 (outbox.edit 의 on_missing) - 한 번만 recreate(message_id)
+    def on_missing(message_id):
+        if (guild.id, key) not in pinned_recreating:
+            pinned_recreating.add((guild.id, key))
+            asyncio.create_task(recreate_pinned(guild, key, recreate, message_id))
+    return on_missing
+
+async def recreate_pinned(guild, key, recreate, message_id):
+    try:
+        await bot_state.set_guild(guild.id, **{key: None})
+        await recreate(message_id)
+    except Exception as e:
+        print("고정 메시지 다시 만들기 실패:", e)
+    finally:
+        pinned_recreating.discard((guild.id, key))
+
+async def create_ranking_message(guild, channel, replaces=None):
+    await post_pinned(guild, channel, await make_ranking_embed(), "ranking_message_id",
+                      replaces)
 
-@tasks.loop(minutes=1)
+def ranking_message_missing(guild, channel):
+    async def recreate(message_id):
+        if bot_state.get("ranking_message_id") == message_id:
+            await bot_state.set("ranking_message_id", None)  # 예전 단일 서버용 값
+        await create_ranking_message(guild, channel, message_id)
+    return pinned_message_missing(guild, "ranking_message_id", recreate)
+
+@scheduler.cron("0 0 * * *")
 async def update_ranking():
+    await refresh_ranking()
+
+# 새벽에 오래된 원본 기록 압축 (COMPACT_DRY_RUN=1 이면 보고서만)
+COMPACT_DRY_RUN = os.getenv("COMPACT_DRY_RUN", "0") == "1"
+
+@scheduler.cron("30 4 * * *")
+async def compact_records():
+    report = await async_db.compact(dry_run=COMPACT_DRY_RUN)
+    print("🧹 기록 압축:", format_compact_report(report))
+
+# 매일 새벽 온라인 백업 (별도 스레드, 한 번에 복사 + 체크섬 + 오래된 것 정리)
+@scheduler.cron("0 5 * * *")
+async def backup_database():
+    report = await backup.backup()
+    print(f"💾 DB 백업: {report['path']} ({report['bytes'] / 1024:.1f}KB, "
+          f"{report['seconds']}초, 정리 {len(report['removed'])}개)")
+
+def format_compact_report(report):
+    rows = ", ".join(f"{t} {n}행" for t, n in report["rows"].items())
+    text = f"{report['cutoff']} 이전 / {rows}"
+    if report["dry_run"]:
+        estimate = report["bytes_estimated"]
+        if estimate is not None:
+            text += f" / 예상 {estimate / 1024:.1f}KB"
+        return text + " (미리보기)"
+    if "bytes_reclaimed" in report:
+        text += (f" / 사용 {report['bytes_reclaimed'] / 1024:.1f}KB 비움"
+                 f" / 파일 {report['bytes_file_reclaimed'] / 1024:.1f}KB 줄어듦"
+                 f" (vacuum: {report['vacuum']})")
+    return text
+
+async def refresh_ranking():
+    embed = None
+    for guild in bot.guilds:
+        channel = channels.ranking(guild)
+        message_id = channel and ranking_message_id(guild, channel)
+        if message_id:
+            embed = embed or await make_ranking_embed()
+            outbox.edit(channel, message_id, embed,
+                        on_missing=ranking_message_missing(guild, channel))
+
+def start_ranking_live():
+    global ranking_live_task
+    if RANKING_LIVE_INTERVAL <= 0 or ranking_live_task is not None:
+        return
+    loop = asyncio.get_running_loop()
+    # add_exp 는 DB writer 스레드에서 돌기 때문에 이벤트 루프로 넘겨서 표시
+    leaderboard.on_top_change(lambda: loop.call_soon_threadsafe(ranking_dirty.set))
+    ranking_live_task = asyncio.create_task(ranking_live_refresher())
+
+async def ranking_live_refresher():
+    # TOP 10 변경 표시가 있으면 갱신하고, 최소 간격만큼 쉬면서 변경을 모은다
+    while True:
+        await ranking_dirty.wait()
+        ranking_dirty.clear()
+        try:
+            await refresh_ranking()
+        except Exception as e:
+            metrics.inc("job_errors_total", job="ranking_live")
+            print("랭킹 메시지 수정 실패:", e)
+        await asyncio.sleep(RANKING_LIVE_INTERVAL)
+
+def start_study_checkpoints():
+    global study_checkpoint_task
+    if STUDY_CHECKPOINT_INTERVAL <= 0 or study_checkpoint_task is not None:
+        return
+    study_checkpoint_task = asyncio.create_task(study_checkpoint_loop())
+
+async def study_checkpoint_loop():
+    while True:
+        await asyncio.sleep(STUDY_CHECKPOINT_INTERVAL)
+        started = time.perf_counter()
+        try:
+            await study_tick()
+        except Exception as e:
+            metrics.inc("job_errors_total", job="study_checkpoint")
+            print("공부 세션 정산 실패:", e)
+        metrics.observe("job_seconds", time.perf_counter() - started, job="study_checkpoint")
+
+async def study_tick():
+    await checkpoint_study_sessions()
+    await refresh_study_board()
+
+async def checkpoint_study_sessions():
+    # 진행 중 세션의 (마지막 정산 이후) 경과 분 + 경험치를 한 번의 쓰기로 정산
+    # - 최소 인정 시간을 넘긴 세션만, 분 단위로 끊어서 (남은 초는 다음 정산/퇴장 때)
+    # - 경험치는 지금까지 인정된 시간 기준 총량에서 이미 준 만큼을 뺀 값
+    # 쓰는 동안 세션에 'checkpoint' 표시를 달아 두고, 그 사이 퇴장하면 퇴장 쪽이 끝나기를 기다린다
+    # 정산 시각/경험치는 쓰기가 성공한 뒤에만 옮긴다 (실패하면 다음 정산/퇴장 때 다시)
+    now = datetime.now(timezone('Asia/Seoul'))
+    done = asyncio.get_running_loop().create_future()
+    rows = []
+    pending = []
+    for user_id, session in study_sessions.items():
+        if 'checkpoint' in session:
+            continue
+        if now - session['start'] < timedelta(minutes=MIN_STUDY_MINUTES):
+            continue
+        minutes = int((now - session['credited']).total_seconds() // 60)
+        if minutes <= 0:
+            continue
+        end = session['credited'] + timedelta(minutes=minutes)
+        total = (end - session['start']).total_seconds() / 60
+        exp = round((total / 30) * 10) - session['exp']
+        rows.append((user_id, session['credited'], end, exp))
+        pending.append((session, end, exp))
+        session['checkpoint'] = done
+    if not rows:
+        return
+    try:
+        levels = await checkpoint_sessions(rows)
+        for (session, end, exp), level in zip(pending, levels):
+            session['credited'] = end
+            session['exp'] += exp
+            if level:
+                session['leveled_up'] = level
+    finally:
+        for session, _, _ in pending:
+            del session['checkpoint']
+        done.set_result(None)
+
+def format_minutes(minutes):
+    h, m = divmod(int(minutes), 60)
+    return f"{h}시간 {m}분" if h else f"{m}분"
+
+def make_study_board_embed(sessions, now):
+    # sessions: [(user_id, 시작), ...] - 오래 공부한 순
+    embed = discord.Embed(title=f"📚 지금 공부 중 ({len(sessions)}명)",
+                          color=discord.Color.pink())
+    if not sessions:
+        embed.description = "지금은 도서관이 비어 있어요! 🌙"
+    else:
+        sessions = sorted(sessions, key=lambda s: s[1])
+        lines = [f"{i}. <@{user_id}> · {format_minutes((now - start).total_seconds() // 60)}"
+                 for i, (user_id, start) in enumerate(sessions[:STUDY_BOARD_LIMIT], start=1)]
+        if len(sessions) > STUDY_BOARD_LIMIT:
+            lines.append(f"… 외 {len(sessions) - STUDY_BOARD_LIMIT}명")
+        embed.description = "\n".join(lines)
+    embed.set_footer(text=f"{now.strftime('%H:%M')} 기준 · "
+                          f"{max(STUDY_CHECKPOINT_INTERVAL // 60, 1)}분마다 갱신")
+    return embed
+
+async def refresh_study_board():
+    # 서버마다 공부 기록 채널의 고정 메시지 하나를 수정 한 번으로 갱신
     now = datetime.now(timezone('Asia/Seoul'))
-    if now.hour == 0 and now.minute == 0:
-        channel = bot.get_channel(RANKING_CHANNEL_ID)
-        if ranking_message_id:
-            try:
-                msg = await channel.fetch_message(ranking_message_id)
-                embed = make_ranking_embed()
-                await msg.edit(embed=embed)
-            except Exception as e:
-                print("랭킹 메시지 수정 실패:", e)
-
-def make_ranking_embed():
+    by_guild = {}
+    for user_id, session in study_sessions.items():
+        by_guild.setdefault(session['guild_id'], []).append((user_id, session['start']))
+    for guild in bot.guilds:
+        await update_study_board(guild, by_guild.get(guild.id, []), now)
+
+async def update_study_board(guild, sessions, now, replaces=None):
+    channel = channels.study_log(guild)
+    if channel is None:
+        return
+    embed = make_study_board_embed(sessions, now)
+    if embed.description == study_board_last.get(guild.id):
+        return
+    message_id = bot_state.guild(guild.id).get("study_board_message_id")
+    if message_id is None:
+        if not sessions:
+            return
+        await post_pinned(guild, channel, embed, "study_board_message_id", replaces)
+    else:
+        outbox.edit(channel, message_id, embed,
+                    on_missing=study_board_missing(guild))
+    study_board_last[guild.id] = embed.description
+
+def study_board_missing(guild):
+    # 지워진 보드는 (공부 중인 사람이 있으면) 바로 새로 올리고 고정, 없으면 다음에 누가 들어올 때
+    async def recreate(message_id):
+        study_board_last.pop(guild.id, None)
+        sessions = [(user_id, session['start']) for user_id, session in study_sessions.items()
+                    if session['guild_id'] == guild.id]
+        await update_study_board(guild, sessions, datetime.now(timezone('Asia/Seoul')),
+                                 message_id)
+    return pinned_message_missing(guild, "study_board_message_id", recreate)
+
+async def make_ranking_embed():
     now = datetime.now(timezone('Asia/Seoul'))
     today_str = now.strftime("%Y년 %m월 %d일")
-    ranking = get_top_users_by_exp()
+    ranking = leaderboard.top(10)
     embed = discord.Embed(
         title="🏆 경험치 랭킹 TOP 10",
         color=discord.Color.gold()
@@ -68,83 +399,113 @@ def make_ranking_embed():
         embed.description = "아직 아무도 경험치를 쌓지 않았어요! 🌱"
     else:
         msg = ""
-        for i, (name, exp) in enumerate(ranking, start=1):
+        for i, (_, name, exp) in enumerate(ranking, start=1):
             crown = "👑" if i == 1 else ""
-            level = calculate_level_from_exp(exp)
+            level = level_for_exp(exp)
             msg += f"{i}위 {crown} **{name}** - Lv.{level} / {exp} Exp\n"
         embed.description = msg
     embed.set_footer(text=today_str)
     return embed
 
-def calculate_level_from_exp(exp):
-    thresholds = [0, 30, 80, 150, 250, 400, 600]
-    level = 1
-    for i, threshold in enumerate(thresholds):
-        if exp < threshold:
-            break
-        level = i + 1
-    return level
+async def make_period_ranking_embed(period, by, today_str):
+    # 이번 주/달 공부시간 또는 획득 경험치 TOP 10 (rollups 집계에서 바로)
+    label = "주간" if period == "week" else "월간"
+    ranking = await get_period_top(period, by, 10)
+    embed = discord.Embed(
+        title=f"🏆 {label} {'경험치' if by == 'exp' else '공부시간'} 랭킹 TOP 10",
+        color=discord.Color.gold()
+    )
+    if not ranking:
+        embed.description = f"이번 {'주' if period == 'week' else '달'}에는 아직 기록이 없어요! 🌱"
+    else:
+        msg = ""
+        for i, (user_id, value) in enumerate(ranking, start=1):
+            crown = "👑" if i == 1 else ""
+            if by == "exp":
+                score = f"{value} Exp"
+            else:
+                h, m = divmod(value, 60)
+                score = f"{h}시간 {m}분" if h else f"{m}분"
+            msg += f"{i}위 {crown} **{leaderboard.name(user_id)}** - {score}\n"
+        embed.description = msg
+    embed.set_footer(text=today_str)
+    return embed
 
 # === 공부 입퇴장 메시지 edit 구조 ===
 
 @bot.event
+@metrics.track_event
 async def on_voice_state_update(member, before, after):
+    # 마이크/스피커/화면공유 토글 등 채널이 그대로인 이벤트는 바로 무시
+    if before.channel == after.channel:
+        return
+    was_tracked = channels.is_tracked(before.channel)
+    is_tracked = channels.is_tracked(after.channel)
+    # 추적 채널끼리 옮겨 다니거나 둘 다 아닌 경우도 할 일 없음
+    if was_tracked == is_tracked:
+        return
     now = datetime.now(timezone('Asia/Seoul'))
     today_str = now.strftime("%Y년 %m월 %d일")
-    after_channel = after.channel.name if after.channel else None
-    before_channel = before.channel.name if before.channel else None
-    study_channel = discord.utils.get(member.guild.text_channels, name="📕｜공부기록")
+    study_channel = channels.study_log(member.guild)
     embed_color = member.color
 
     # 입장
-    if after_channel in TRACKED_VOICE_CHANNELS and before.channel != after_channel:
+    if is_tracked:
         embed = discord.Embed(
             title="🎀 공듀의 입장 🎀",
             description=(f"{member.mention} 공듀님이 도서관에 나타났어요!\n오늘도 집중모드 발동✨"),
             color=embed_color
         )
         embed.set_footer(text=today_str)
-        msg = await study_channel.send(embed=embed)
-        study_sessions[member.id] = {
+        # 공지는 레이트 리밋/묶음 때문에 몇 초 걸릴 수 있으니 세션부터 만든다
+        # (그 사이 퇴장하면 퇴장 쪽이 세션을 가져가고, 공지가 끝나도 되살리지 않는다)
+        session = {
             'start': now,
-            'msg_id': msg.id
+            'guild_id': member.guild.id,
+            'msg_id': None,
+            'msg_index': 0,
+            'credited': now,
+            'exp': 0,
+            'leveled_up': None
         }
+        study_sessions[member.id] = session
+        await open_session(member.id, member.guild.id, after.channel.id,
+                           now.isoformat(), None)
+        msg_id, msg_index = await outbox.announce(study_channel, embed)
+        if study_sessions.get(member.id) is session:
+            session['msg_id'] = msg_id
+            session['msg_index'] = msg_index
+            await set_session_message(member.id, msg_id)
 
     # 퇴장
-    if before_channel in TRACKED_VOICE_CHANNELS and (
-        after.channel is None or after_channel not in TRACKED_VOICE_CHANNELS
-    ):
+    if was_tracked:
         session = study_sessions.pop(member.id, None)
         if session:
+            if 'checkpoint' in session:
+                await session['checkpoint']  # 진행 중인 정산이 반영된 뒤 나머지만
+            await close_session(member.id)
             end_time = datetime.now(timezone('Asia/Seoul'))
             duration = (end_time - session['start']).total_seconds() / 60
-            try:
-                msg = await study_channel.fetch_message(session['msg_id'])
-            except Exception:
-                msg = None
 
-            if duration < 10:
+            if duration < MIN_STUDY_MINUTES:
                 embed = discord.Embed(
                     title="⏰ 집중 실패! (10분 미만)",
                     description=(f"{member.mention} 공듀님, 10분 미만은 집중 인정 불가에요!\n다시 도전해볼까요?"),
                     color=embed_color
                 )
                 embed.set_footer(text=today_str)
-                if msg:
-                    await msg.edit(embed=embed)
-                else:
-                    await study_channel.send(embed=embed)
+                outbox.edit(study_channel, session['msg_id'], embed, index=session['msg_index'])
                 return
 
-            log_study_time(member.id, int(duration))
+            # 주기 정산에서 이미 준 구간/경험치를 빼고 나머지만 (자정을 넘기면 날짜별로 나뉜다)
+            await log_study_session(member.id, session['credited'], end_time)
             exp = round((duration / 30) * 10)
-            add_exp(member.id, exp)
-            level = get_level(member.id)
-            today_total = get_today_study_time(member.id)
+            leveled_up = await add_exp(member.id, exp - session['exp']) or session['leveled_up']
+            profile = await get_profile(member.id)
+            level = profile['level']
+            today_total = profile['today_minutes']
 
-            h = int(duration) // 60
-            m = int(duration) % 60
-            time_str = f"{h}시간 {m}분" if h else f"{m}분"
+            time_str = format_minutes(duration)
 
             embed = discord.Embed(
                 title="✨ 집중 완료! 공듀 퇴장 ✨",
@@ -155,11 +516,25 @@ async def on_voice_state_update(member, before, after):
             embed.add_field(name="🌹 획득 경험치", value=f"**{exp} Exp**", inline=True)
             embed.add_field(name="👑 오늘 누적", value=f"**{today_total}분**", inline=True)
             embed.add_field(name="🏅 현재 레벨", value=f"**Lv.{level}**", inline=True)
+            if leveled_up:
+                embed.add_field(name="🎉 레벨 업!", value=f"**Lv.{leveled_up}** 달성!", inline=False)
             embed.set_footer(text=today_str)
-            if msg:
-                await msg.edit(embed=embed)
-            else:
-                await study_channel.send(embed=embed)
+            outbox.edit(study_channel, session['msg_id'], embed, index=session['msg_index'])
+
+# === 채널 캐시 무효화 ===
+
+@bot.event
+async def on_guild_channel_create(channel):
+    channels.invalidate(channel.guild.id)
+
+@bot.event
+async def on_guild_channel_delete(channel):
+    channels.invalidate(channel.guild.id)
+
+@bot.event
+async def on_guild_channel_update(before, after):
+    if before.name != after.name:
+        channels.invalidate(after.guild.id)
 
 # ======= 아래부터 기존 명령어 커맨드들 그대로 붙여서 사용 (출석, 기상, 기록 등) =======
 
@@ -173,7 +548,7 @@ async def checkin(ctx):
     nickname = ctx.author.display_name
     embed_color = ctx.author.color
 
-    saved = save_attendance(ctx.author.id, nickname)
+    saved = await save_attendance(ctx.author.id, nickname)
 
     embed = discord.Embed(color=embed_color)
     if not saved:
@@ -181,8 +556,8 @@ async def checkin(ctx):
         embed.description = f"{ctx.author.mention} 공듀님, 오늘은 이미 출석하셨어요! 🐣"
     else:
         exp_gained = 5 if not is_late else 3
-        add_exp(ctx.author.id, exp_gained)
-        level = get_level(ctx.author.id)
+        leveled_up = await add_exp(ctx.author.id, exp_gained)
+        level = (await get_profile(ctx.author.id))['level']
         embed.title = "👑 출석 완료"
         if is_late:
             embed.description = f"{ctx.author.mention} 공듀님, 지각핑! 늦은만큼 더 달려보자 공듀🔥 (+{exp_gained} Exp)"
@@ -190,9 +565,11 @@ async def checkin(ctx):
             embed.description = f"{ctx.author.mention} 공듀님, 출석 완료! 오늘도 힘내보자 공듀❤️‍🔥 (+{exp_gained} Exp)"
         embed.add_field(name="📅 날짜", value=date_str)
         embed.add_field(name="🎁 현재 레벨", value=f"Lv.{level}")
+        if leveled_up:
+            embed.add_field(name="🎉 레벨 업!", value=f"Lv.{leveled_up} 달성!", inline=False)
 
     embed.set_footer(text=today_str)
-    await ctx.send(embed=embed)
+    await outbox.reply(ctx.channel, embed=embed)
 
 @bot.command(name="기상", aliases=["굿모닝"])
 async def wakeup(ctx):
@@ -204,7 +581,7 @@ async def wakeup(ctx):
     nickname = ctx.author.display_name
     embed_color = ctx.author.color
 
-    saved = save_wakeup(ctx.author.id, nickname)
+    saved = await save_wakeup(ctx.author.id, nickname)
 
     embed = discord.Embed(color=embed_color)
     if not saved:
@@ -212,8 +589,8 @@ async def wakeup(ctx):
         embed.description = f"{ctx.author.mention} 공듀님, 오늘은 이미 기상 인증했어요! ☀️"
     else:
         exp_gained = 5 if not is_late else 3
-        add_exp(ctx.author.id, exp_gained)
-        level = get_level(ctx.author.id)
+        leveled_up = await add_exp(ctx.author.id, exp_gained)
+        level = (await get_profile(ctx.author.id))['level']
         embed.title = "☀️ 기상 인증 완료"
         if is_late:
             embed.description = f"{ctx.author.mention} 공듀님, 늦잠 잤지만 인증 완료! ☁️ (+{exp_gained} Exp)"
@@ -221,29 +598,84 @@ async def wakeup(ctx):
             embed.description = f"{ctx.author.mention} 공듀님, 눈부신 아침이에요! 🌞 (+{exp_gained} Exp)"
         embed.add_field(name="📅 날짜", value=date_str)
         embed.add_field(name="🎁 현재 레벨", value=f"Lv.{level}")
+        if leveled_up:
+            embed.add_field(name="🎉 레벨 업!", value=f"Lv.{leveled_up} 달성!", inline=False)
 
     embed.set_footer(text=today_str)
-    await ctx.send(embed=embed)
+    await outbox.reply(ctx.channel, embed=embed)
+
+def render_month_calendar(month, days):
+    # "YYYY-MM" 한 달을 월~일 7칸 달력으로 (출석한 날 ✅)
+    year, mon = (int(x) for x in month.split("-"))
+    attended = set(days)
+    lines = ["월 화 수 목 금 토 일"]
+    for week in calendar.monthcalendar(year, mon):
+        cells = []
+        for day in week:
+            if day == 0:
+                cells.append("▫️")
+            elif day in attended:
+                cells.append("✅")
+            else:
+                cells.append("⬜")
+        lines.append(" ".join(cells))
+    return "\n".join(lines)
+
+def make_attendance_embed(member, page, today_str):
+    month, days, _, _ = page
+    embed = discord.Embed(color=member.color)
+    embed.title = "📒 출석 기록"
+    if month is None:
+        embed.description = f"{member.mention} 공듀님은 아직 출석 기록이 없어!🏫"
+    else:
+        year, mon = month.split("-")
+        embed.description = (f"{member.mention} 공듀님의 {year}년 {int(mon)}월 출석: "
+                             f"**{len(days)}일**\n\n{render_month_calendar(month, days)}")
+    embed.set_footer(text=today_str)
+    return embed
+
+class AttendancePager(discord.ui.View):
+    # 한 페이지 = 한 달. 버튼을 누를 때만 그 달을 DB 에서 읽는다
+    def __init__(self, member, page, today_str):
+        super().__init__(timeout=120)
+        self.member = member
+        self.page = page
+        self.today_str = today_str
+        self._sync_buttons()
+
+    def _sync_buttons(self):
+        _, _, older, newer = self.page
+        self.older_button.disabled = older is None
+        self.newer_button.disabled = newer is None
+
+    async def interaction_check(self, interaction):
+        return interaction.user.id == self.member.id
+
+    async def _show(self, interaction, month):
+        self.page = await get_attendance_calendar(self.member.id, month)
+        self._sync_buttons()
+        embed = make_attendance_embed(self.member, self.page, self.today_str)
+        await interaction.response.edit_message(embed=embed, view=self)
+
+    @discord.ui.button(label="◀ 이전 달", style=discord.ButtonStyle.secondary)
+    async def older_button(self, interaction, button):
+        await self._show(interaction, self.page[2])
+
+    @discord.ui.button(label="다음 달 ▶", style=discord.ButtonStyle.secondary)
+    async def newer_button(self, interaction, button):
+        await self._show(interaction, self.page[3])
 
 @bot.command(name="출석기록")
 async def show_attendance(ctx):
     now = datetime.now(timezone('Asia/Seoul'))
     today_str = now.strftime("%Y년 %m월 %d일")
-    user_id = ctx.author.id
-    rows = get_attendance(user_id)
-    embed_color = ctx.author.color
-    embed = discord.Embed(color=embed_color)
-    embed.title = "📒 출석 기록"
-
-    if not rows:
-        embed.description = f"{ctx.author.mention} 공듀님은 아직 출석 기록이 없어!🏫"
+    page = await get_attendance_calendar(ctx.author.id)
+    embed = make_attendance_embed(ctx.author, page, today_str)
+    if page[0] is None:
+        await outbox.reply(ctx.channel, embed=embed)
     else:
-        dates = [row[0] for row in rows]
-        formatted = "\n".join(f"✅ {d}" for d in dates)
-        embed.description = f"{ctx.author.mention} 공듀님의 출석 기록:\n{formatted}"
-
-    embed.set_footer(text=today_str)
-    await ctx.send(embed=embed)
+        await outbox.reply(ctx.channel, embed=embed,
+                           view=AttendancePager(ctx.author, page, today_str))
 
 @bot.command(name="내정보")
 async def my_info(ctx):
@@ -251,7 +683,7 @@ async def my_info(ctx):
     today_str = now.strftime("%Y년 %m월 %d일")
     user_id = ctx.author.id
     nickname = ctx.author.display_name
-    level = get_level(user_id)
+    level = (await get_profile(user_id))['level']
     embed_color = ctx.author.color
 
     embed = discord.Embed(
@@ -261,14 +693,54 @@ async def my_info(ctx):
     )
     embed.add_field(name="👑 레벨", value=f"Lv.{level}")
     embed.set_footer(text=today_str)
-    await ctx.send(embed=embed)
+    await outbox.reply(ctx.channel, embed=embed)
+
+@bot.command(name="내순위")
+async def my_rank(ctx):
+    now = datetime.now(timezone('Asia/Seoul'))
+    today_str = now.strftime("%Y년 %m월 %d일")
+    user_id = ctx.author.id
+    rank = leaderboard.rank(user_id)
+    embed_color = ctx.author.color
+    embed = discord.Embed(title="🏅 내 순위", color=embed_color)
+
+    if rank is None:
+        embed.description = f"{ctx.author.mention} 공듀님은 아직 경험치가 없어요! 🌱"
+    else:
+        exp = leaderboard.exp(user_id)
+        embed.description = (f"{ctx.author.mention} 공듀님은 전체 {len(leaderboard)}명 중 "
+                             f"**{rank}위** (Lv.{level_for_exp(exp)} / {exp} Exp)")
+        lines = []
+        for r, uid, name, e in leaderboard.around(user_id):
+            me = "👉 " if uid == str(user_id) else ""
+            lines.append(f"{me}{r}위 **{name}** - {e} Exp")
+        embed.add_field(name="주변 순위", value="\n".join(lines), inline=False)
+
+    embed.set_footer(text=today_str)
+    await outbox.reply(ctx.channel, embed=embed)
+
+@bot.command(name="주간랭킹")
+async def weekly_ranking(ctx, by: str = None):
+    now = datetime.now(timezone('Asia/Seoul'))
+    today_str = now.strftime("%Y년 %m월 %d일")
+    embed = await make_period_ranking_embed(
+        "week", "exp" if by == "경험치" else "minutes", today_str)
+    await outbox.reply(ctx.channel, embed=embed)
+
+@bot.command(name="월간랭킹")
+async def monthly_ranking(ctx, by: str = None):
+    now = datetime.now(timezone('Asia/Seoul'))
+    today_str = now.strftime("%Y년 %m월 %d일")
+    embed = await make_period_ranking_embed(
+        "month", "exp" if by == "경험치" else "minutes", today_str)
+    await outbox.reply(ctx.channel, embed=embed)
 
 @bot.command(name="월통계")
 async def monthly_stats(ctx):
     now = datetime.now(timezone('Asia/Seoul'))
     today_str = now.strftime("%Y년 %m월 %d일")
     user_id = ctx.author.id
-    stats = get_monthly_stats(user_id)
+    stats = (await get_profile(user_id))['month']
     embed_color = ctx.author.color
     embed = discord.Embed(
         title="📅 이번달 통계",
@@ -280,14 +752,14 @@ async def monthly_stats(ctx):
     embed.add_field(name="총 공부시간", value=f"{stats['study_minutes']}분")
     embed.add_field(name="획득 Exp", value=f"{stats['exp']}Exp")
     embed.set_footer(text=today_str)
-    await ctx.send(embed=embed)
+    await outbox.reply(ctx.channel, embed=embed)
 
 @bot.command(name="주통계")
 async def weekly_stats(ctx):
     now = datetime.now(timezone('Asia/Seoul'))
     today_str = now.strftime("%Y년 %m월 %d일")
     user_id = ctx.author.id
-    stats = get_weekly_stats(user_id)
+    stats = (await get_profile(user_id))['week']
     embed_color = ctx.author.color
     embed = discord.Embed(
         title="🗓️ 이번주 통계",
@@ -299,14 +771,14 @@ async def weekly_stats(ctx):
     embed.add_field(name="총 공부시간", value=f"{stats['study_minutes']}분")
     embed.add_field(name="획득 Exp", value=f"{stats['exp']}Exp")
     embed.set_footer(text=today_str)
-    await ctx.send(embed=embed)
+    await outbox.reply(ctx.channel, embed=embed)
 
 @bot.command(name="연속출석")
 async def streak_attendance(ctx):
     now = datetime.now(timezone('Asia/Seoul'))
     today_str = now.strftime("%Y년 %m월 %d일")
     user_id = ctx.author.id
-    streak = get_streak_attendance(user_id)
+    streak = (await get_profile(user_id))['streaks']['attendance']
     embed_color = ctx.author.color
     embed = discord.Embed(
         title="🌱 연속 출석일수",
@@ -314,14 +786,14 @@ async def streak_attendance(ctx):
         color=embed_color
     )
     embed.set_footer(text=today_str)
-    await ctx.send(embed=embed)
+    await outbox.reply(ctx.channel, embed=embed)
 
 @bot.command(name="연속기상")
 async def streak_wakeup(ctx):
     now = datetime.now(timezone('Asia/Seoul'))
     today_str = now.strftime("%Y년 %m월 %d일")
     user_id = ctx.author.id
-    streak = get_streak_wakeup(user_id)
+    streak = (await get_profile(user_id))['streaks']['wakeup']
     embed_color = ctx.author.color
     embed = discord.Embed(
         title="⏰ 연속 기상일수",
@@ -329,14 +801,14 @@ async def streak_wakeup(ctx):
         color=embed_color
     )
     embed.set_footer(text=today_str)
-    await ctx.send(embed=embed)
+    await outbox.reply(ctx.channel, embed=embed)
 
 @bot.command(name="연속공부")
 async def streak_study(ctx):
     now = datetime.now(timezone('Asia/Seoul'))
     today_str = now.strftime("%Y년 %m월 %d일")
     user_id = ctx.author.id
-    streak = get_streak_study(user_id)
+    streak = (await get_profile(user_id))['streaks']['study']
     embed_color = ctx.author.color
     embed = discord.Embed(
         title="📚 연속 공부일수",
@@ -344,14 +816,167 @@ async def streak_study(ctx):
         color=embed_color
     )
     embed.set_footer(text=today_str)
-    await ctx.send(embed=embed)
+    await outbox.reply(ctx.channel, embed=embed)
+
+HEATMAP_SHADES = "·░▒▓█"
+WEEKDAY_NAMES = "월화수목금토일"
+
+def render_heatmap(heatmap):
+    # 168칸(요일*24+시) 분 -> 요일별 한 줄, 시간마다 한 글자 (많을수록 진하게)
+    peak = max(heatmap) or 1
+    lines = ["   " + "".join(f"{h:<6}" for h in (0, 6, 12, 18))]
+    for d, name in enumerate(WEEKDAY_NAMES):
+        row = heatmap[d * 24:(d + 1) * 24]
+        cells = "".join(HEATMAP_SHADES[-(-4 * m // peak)] for m in row)
+        lines.append(f"{name} {cells}")
+    return "```\n" + "\n".join(lines) + "\n```"
+
+def peak_hours(heatmap, k=3):
+    # 요일 상관없이 가장 많이 공부한 시간대 TOP k: [(시, 분), ...]
+    by_hour = [sum(heatmap[d * 24 + h] for d in range(7)) for h in range(24)]
+    ranked = sorted(range(24), key=lambda h: by_hour[h], reverse=True)
+    return [(h, by_hour[h]) for h in ranked[:k] if by_hour[h]]
+
+@bot.command(name="공부패턴")
+async def study_pattern(ctx, scope: str = None):
+    now = datetime.now(timezone('Asia/Seoul'))
+    today_str = now.strftime("%Y년 %m월 %d일")
+    server = scope == "서버"
+    heatmap = await get_study_heatmap(None if server else ctx.author.id)
+    embed_color = ctx.author.color
+    embed = discord.Embed(
+        title="🔥 서버 공부 패턴" if server else "🔥 내 공부 패턴",
+        color=embed_color
+    )
+    if not any(heatmap):
+        embed.description = "아직 기록된 공부 시간이 없어요! 🌱"
+    else:
+        who = "공듀님들이" if server else f"{ctx.author.mention} 공듀님이"
+        embed.description = (f"{who} 요일·시간대별로 공부한 시간이에요\n"
+                             f"{render_heatmap(heatmap)}")
+        best_day = max(range(7), key=lambda d: sum(heatmap[d * 24:(d + 1) * 24]))
+        peaks = "\n".join(f"{h}시~{h + 1}시 · {m}분" for h, m in peak_hours(heatmap))
+        embed.add_field(name="⏰ 집중 시간대 TOP 3", value=peaks, inline=True)
+        embed.add_field(name="📅 제일 열심히 하는 요일",
+                        value=f"{WEEKDAY_NAMES[best_day]}요일", inline=True)
+    embed.set_footer(text=today_str)
+    await outbox.reply(ctx.channel, embed=embed)
+
+@bot.command(name="기록정리")
+@commands.has_permissions(administrator=True)
+async def compact_command(ctx, mode: str = None):
+    # 관리자용: 기본은 미리보기, `!기록정리 실행` 이면 실제로 압축
+    report = await async_db.compact(dry_run=mode != "실행")
+    embed = discord.Embed(
+        title="🧹 기록 압축" + (" 미리보기" if report["dry_run"] else ""),
+        description=format_compact_report(report),
+        color=ctx.author.color
+    )
+    await outbox.reply(ctx.channel, embed=embed)
+
+@bot.command(name="백업")
+@commands.has_permissions(administrator=True)
+async def backup_command(ctx):
+    # 관리자용: 지금 바로 백업
+    report = await backup.backup()
+    embed = discord.Embed(
+        title="💾 DB 백업 완료",
+        description=(f"`{report['path']}` ({report['bytes'] / 1024:.1f}KB, {report['seconds']}초)\n"
+                     f"sha256 `{report['sha256'][:16]}…`"),
+        color=ctx.author.color
+    )
+    await outbox.reply(ctx.channel, embed=embed)
+
+def format_latency_rows(rows, limit=5):
+    # metrics.summary 결과 -> "이름 n회 · p50 / p95" 줄들
+    lines = []
+    for labels, count, _, p50, p95, _ in rows[:limit]:
+        name = next(iter(labels.values()), "?")
+        lines.append(f"`{name}` {count}회 · {p50 * 1000:.1f} / {p95 * 1000:.1f}ms")
+    return "\n".join(lines) or "기록 없음"
+
+@bot.command(name="상태")
+@commands.has_permissions(administrator=True)
+async def status_command(ctx):
+    # 관리자용: 처리 시간/DB/디스코드 전송 지표 요약 (p50 / p95)
+    uptime = int(time.monotonic() - metrics.started)
+    cache = async_db.profiles.stats()
+    embed = discord.Embed(title="📈 봇 상태", color=ctx.author.color)
+    embed.description = (f"가동 {uptime // 3600}시간 {uptime % 3600 // 60}분 · "
+                         f"공부 중 {len(study_sessions)}명 · "
+                         f"DB 대기 쓰기 {async_db._pending} · 전송 대기 {outbox.pending()}")
+    embed.add_field(name="⌨️ 명령어", value=format_latency_rows(metrics.summary("command_seconds")),
+                    inline=False)
+    embed.add_field(name="🎧 이벤트", value=format_latency_rows(metrics.summary("event_seconds")),
+                    inline=False)
+    # DB 는 총 시간이 큰 함수부터
+    db_rows = sorted(metrics.summary("db_seconds"), key=lambda row: -row[2])
+    embed.add_field(name="🗄️ DB (총 시간 순)", value=format_latency_rows(db_rows), inline=False)
+    embed.add_field(name="📨 디스코드",
+                    value=(f"전송 {outbox.stats['sends']} · 수정 {outbox.stats['edits']} · "
+                           f"합친 수정 {outbox.stats['coalesced_edits']}\n"
+                           f"레이트 리밋 대기 {outbox.stats['rate_limit_waits']}회 "
+                           f"({outbox.stats['rate_limit_wait_seconds']:.1f}초)"),
+                    inline=False)
+    if loop_watchdog.running():
+        lag = metrics.summary("loop_lag_seconds")
+        value = "기록 없음"
+        if lag:
+            _, _, _, p50, _, p99 = lag[0]
+            value = f"지연 p50 {p50 * 1000:.1f}ms · p99 {p99 * 1000:.1f}ms"
+        for block in list(loop_watchdog.recent)[-3:]:
+            value += f"\n{block['time']} {block['ms']:.0f}ms `{block['handler']}`"
+            if block["where"]:
+                value += f" @ `{block['where']}`"
+        embed.add_field(name="⏱️ 이벤트 루프", value=value, inline=False)
+    embed.add_field(name="🧠 프로필 캐시",
+                    value=f"{cache['size']}명 · 적중률 {cache['hit_rate'] * 100:.1f}%",
+                    inline=False)
+    await outbox.reply(ctx.channel, embed=embed)
+
+@bot.command(name="서버설정")
+@commands.has_permissions(administrator=True)
+@commands.guild_only()
+async def guild_settings(ctx, key: str = None, *targets: discord.abc.GuildChannel):
+    # 관리자용 서버별 채널 설정
+    # !서버설정 / !서버설정 공부채널 <음성채널...> / 기록채널 <채널> / 랭킹채널 <채널>
+    guild = ctx.guild
+    if key == "공부채널" and targets:
+        await bot_state.set_guild(guild.id, **{TRACKED_VOICE_KEY: [c.id for c in targets]})
+    elif key == "기록채널" and len(targets) == 1:
+        # "지금 공부 중" 보드는 새 기록채널에 다시 만든다
+        await bot_state.set_guild(guild.id, **{STUDY_LOG_KEY: targets[0].id},
+                                  study_board_message_id=None)
+        study_board_last.pop(guild.id, None)
+    elif key == "랭킹채널" and len(targets) == 1:
+        # 채널이 바뀌면 새 채널에 랭킹 메시지를 다시 만든다
+        await bot_state.set_guild(guild.id, **{RANKING_KEY: targets[0].id},
+                                  ranking_message_id=None)
+    elif key is not None:
+        await outbox.reply(ctx.channel, content=(
+            "사용법: `!서버설정 공부채널 <음성채널...>` / "
+            "`!서버설정 기록채널 <채널>` / `!서버설정 랭킹채널 <채널>`"))
+        return
+    channels.invalidate(guild.id)
+    if key == "랭킹채널":
+        await setup_ranking_message()
+
+    resolved = channels.get(guild)
+    voice = " ".join(f"<#{c}>" for c in sorted(resolved.tracked_voice_ids)) or "없음"
+    embed = discord.Embed(title="⚙️ 서버 설정", color=ctx.author.color)
+    embed.add_field(name="🎥 공부 음성채널", value=voice, inline=False)
+    embed.add_field(name="📕 공부 기록채널",
+                    value=resolved.study_log.mention if resolved.study_log else "없음")
+    embed.add_field(name="👑 랭킹채널",
+                    value=resolved.ranking.mention if resolved.ranking else "없음")
+    await outbox.reply(ctx.channel, embed=embed)
 
 @bot.command(name="명령어")
 async def command_list(ctx):
-    ranking_channel_id = 1378863730741219458   # 👑｜랭킹
-    attendance_channel_id = 1378862713484218489  # 🍀｜출석체크
-    wakeup_channel_id = 1378862771214745690     # 🌅｜기상인증
-    myinfo_channel_id = 1378952514702938182     # 🏠｜내정보
+    ranking_channel_id = bot_state.get("ranking_channel_id")        # 👑｜랭킹
+    attendance_channel_id = bot_state.get("attendance_channel_id")  # 🍀｜출석체크
+    wakeup_channel_id = bot_state.get("wakeup_channel_id")          # 🌅｜기상인증
+    myinfo_channel_id = bot_state.get("myinfo_channel_id")          # 🏠｜내정보
 
     embed_color = ctx.author.color
     embed = discord.Embed(
@@ -363,7 +988,10 @@ async def command_list(ctx):
         name="👑 랭킹",
         value=(
             f"<#{ranking_channel_id}> 에서 사용\n"
-            "`!랭킹` - 전체 경험치 순위 TOP 10"
+            "`!랭킹` - 전체 경험치 순위 TOP 10\n"
+            "`!내순위` - 내 순위와 주변 순위\n"
+            "`!주간랭킹` `!월간랭킹` - 이번 주/달 공부시간 TOP 10 "
+            "(뒤에 `경험치` 를 붙이면 획득 경험치 순)"
         ),
         inline=False
     )
@@ -372,7 +1000,7 @@ async def command_list(ctx):
         value=(
             f"<#{attendance_channel_id}> 에서 사용\n"
             "`!출석` - 오늘 출석 체크\n"
-            "`!출석기록` - 내 출석 날짜 전체 확인"
+            "`!출석기록` - 월별 출석 달력 (버튼으로 넘기기)"
         ),
         inline=False
     )
@@ -391,18 +1019,27 @@ async def command_list(ctx):
             "`!내정보` - 내 레벨 및 프로필\n"
             "`!월통계` - 이번달 통계\n"
             "`!주통계` - 이번주 통계\n"
-            "`!연속출석` `!연속기상` `!연속공부`"
+            "`!연속출석` `!연속기상` `!연속공부`\n"
+            "`!공부패턴` - 요일·시간대별 공부 히트맵 (`!공부패턴 서버` 는 전체)"
         ),
         inline=False
     )
     embed.add_field(
         name="Voice 자동 기록",
         value=(
-            "- `🎥｜캠스터디`, `독서실` 채널에 입퇴장 시 자동으로 공부시간 기록"
+            "- `🎥｜캠스터디`, `독서실` 채널에 입퇴장 시 자동으로 공부시간 기록\n"
+            "- 공부 중에도 몇 분마다 공부시간·경험치가 쌓이고, 기록채널 고정 메시지에 '지금 공부 중' 표시\n"
+            "- 관리자: `!서버설정` 으로 서버별 공부/기록/랭킹 채널 지정, `!상태` 로 처리 시간·DB 지표 확인"
         ),
         inline=False
     )
     embed.set_footer(text="궁금한 점은 언제든 !명령어 로 확인해 주세요!")
-    await ctx.send(embed=embed)
+    await outbox.reply(ctx.channel, embed=embed)
 
-bot.run(TOKEN)
+if __name__ == "__main__":
+    # (loadtest.py 처럼 import 만 해서 핸들러를 직접 부를 때는 실행하지 않음)
+    try:
+        bot.run(TOKEN)
+    finally:
+        # 예외로 끝나도 응답은 했지만 아직 커밋 안 된 쓰기까지 처리 후 DB 스레드 종료
+        async_db.close()
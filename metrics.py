@@ -0,0 +1,263 @@
+import asyncio
+import bisect
+import functools
+import os
+import threading
+import time
+
+# ==============================
+# 운영 지표 (카운터 / 히스토그램 / 게이지) + Prometheus 텍스트 형식
+# - 명령어/이벤트 처리 시간, db.py 함수별 시간과 행 수, 디스코드 REST 호출/대기, 공부 세션 수
+# - 관측 한 번 = 잠금 + bisect 한 번 이라 항상 켜 둬도 되는 수준
+#   (DB writer/reader 스레드에서도 부르므로 잠금 하나로 보호)
+# - METRICS_PORT 가 있으면 METRICS_HOST:PORT/metrics 로,
+#   METRICS_FILE 이 있으면 METRICS_FILE_INTERVAL 초마다 파일로 (node_exporter textfile 용)
+# ==============================
+
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))
+METRICS_FILE = os.getenv("METRICS_FILE")
+METRICS_FILE_INTERVAL = float(os.getenv("METRICS_FILE_INTERVAL", "15"))
+PREFIX = "princess_"
+
+# 초 단위 히스토그램 구간 (마지막 +Inf 는 자동)
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                   1.0, 2.5, 5.0, 10.0)
+
+# 이름 -> (종류, 설명)  (여기 없는 이름은 untyped 로 내보냄)
+HELP = {
+    "command_seconds": ("histogram", "명령어 처리 시간"),
+    "command_errors_total": ("counter", "실패한 명령어 수"),
+    "event_seconds": ("histogram", "디스코드 이벤트 핸들러 처리 시간"),
+    "event_errors_total": ("counter", "실패한 이벤트 핸들러 수"),
+    "job_seconds": ("histogram", "예약 작업 처리 시간"),
+    "job_errors_total": ("counter", "실패한 예약 작업 수"),
+    "db_seconds": ("histogram", "db.py 함수 실행 시간 (묶음 실행은 한 번)"),
+    "db_requests_total": ("counter", "db.py 함수 요청 수 (묶음에 합쳐진 요청 포함)"),
+    "db_rows_total": ("counter", "읽은 행 수 / 바뀐 행 수"),
+    "db_errors_total": ("counter", "실패한 db.py 호출 수"),
+    "db_commit_seconds": ("histogram", "그룹 커밋 시간"),
+    "db_pending_writes": ("gauge", "커밋 전/대기 중인 쓰기 수"),
+    "discord_request_seconds": ("histogram", "디스코드 REST 호출 시간"),
+    "discord_errors_total": ("counter", "실패한 디스코드 REST 호출 수"),
+    "outbox_rate_limit_waits_total": ("counter", "레이트 리밋 전에 쉰 횟수"),
+    "outbox_rate_limit_wait_seconds_total": ("counter", "레이트 리밋 전에 쉰 시간"),
+    "outbox_coalesced_edits_total": ("counter", "합쳐져서 생략된 메시지 수정 수"),
+    "outbox_batched_announces_total": ("counter", "묶음 전송으로 아낀 공지 수"),
+    "outbox_pending": ("gauge", "전송/수정 대기 중인 항목 수"),
+    "study_sessions_active": ("gauge", "지금 공부 중인 세션 수"),
+    "profile_cache_hits_total": ("counter", "프로필 캐시 적중"),
+    "profile_cache_misses_total": ("counter", "프로필 캐시 미스"),
+    "leaderboard_users": ("gauge", "랭킹 인덱스 유저 수"),
+    "uptime_seconds": ("gauge", "프로세스 가동 시간"),
+    "loop_lag_seconds": ("histogram", "이벤트 루프 지연 (하트비트가 늦게 깨어난 시간)"),
+    "loop_blocks_total": ("counter", "임계값 넘게 이벤트 루프가 막힌 횟수"),
+    "loop_block_seconds": ("histogram", "이벤트 루프가 막힌 시간 (막은 핸들러별)"),
+}
+
+_lock = threading.Lock()
+_counters = {}  # (이름, 라벨) -> 값
+_histograms = {}  # (이름, 라벨) -> Histogram
+_gauges = {}  # (이름, 라벨) -> 값을 돌려주는 함수 (내보낼 때 호출)
+_tasks = []
+started = time.monotonic()
+
+
+class Histogram:
+    __slots__ = ("buckets", "counts", "count", "sum")
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def quantile(self, q):
+        # 구간 안에서는 선형 보간 (Prometheus histogram_quantile 과 같은 방식)
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for i, n in enumerate(self.counts):
+            if seen + n >= rank and n:
+                if i == len(self.buckets):
+                    return self.buckets[-1]
+                lo = self.buckets[i - 1] if i else 0.0
+                return lo + (self.buckets[i] - lo) * (rank - seen) / n
+            seen += n
+        return self.buckets[-1]
+
+
+def _key(name, labels):
+    return name, tuple(sorted(labels.items()))
+
+
+def inc(name, amount=1, **labels):
+    key = _key(name, labels)
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + amount
+
+
+def observe(name, value, **labels):
+    key = _key(name, labels)
+    with _lock:
+        histogram = _histograms.get(key)
+        if histogram is None:
+            histogram = _histograms[key] = Histogram()
+        histogram.observe(value)
+
+
+def gauge(name, fn, **labels):
+    # fn() 은 내보낼 때마다 불린다 (이벤트 루프에서)
+    _gauges[_key(name, labels)] = fn
+
+
+def track_event(fn):
+    # @bot.event 아래에 붙여서 이벤트 핸들러 처리 시간/실패 기록
+    name = fn.__name__
+
+    @functools.wraps(fn)
+    async def wrapper(*args, **kwargs):
+        started_at = time.perf_counter()
+        try:
+            return await fn(*args, **kwargs)
+        except Exception:
+            inc("event_errors_total", event=name)
+            raise
+        finally:
+            observe("event_seconds", time.perf_counter() - started_at, event=name)
+    return wrapper
+
+
+def summary(name):
+    # [(라벨 dict, count, sum, p50, p95, p99), ...] count 많은 순 (!상태 용)
+    with _lock:
+        rows = [(dict(labels), h.count, h.sum, h.quantile(0.5), h.quantile(0.95),
+                 h.quantile(0.99))
+                for (n, labels), h in _histograms.items() if n == name]
+    return sorted(rows, key=lambda row: -row[1])
+
+
+def counter(name, **labels):
+    with _lock:
+        return _counters.get(_key(name, labels), 0)
+
+
+# ==============================
+# Prometheus 텍스트 형식
+# ==============================
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(labels, extra=()):
+    pairs = [f'{k}="{_escape(v)}"' for k, v in (*labels, *extra)]
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def render():
+    series = {}  # 이름 -> [줄, ...]
+    gauges = []
+    for (name, labels), fn in list(_gauges.items()):
+        try:
+            gauges.append((name, labels, fn()))
+        except Exception:
+            continue
+    with _lock:
+        for (name, labels), value in _counters.items():
+            series.setdefault(name, []).append(
+                f"{PREFIX}{name}{_labels(labels)} {_number(value)}")
+        for (name, labels), h in _histograms.items():
+            lines = series.setdefault(name, [])
+            cumulative = 0
+            for le, n in zip((*h.buckets, float("inf")), h.counts):
+                cumulative += n
+                lines.append(f"{PREFIX}{name}_bucket"
+                             f"{_labels(labels, [('le', _number(le))])} {cumulative}")
+            lines.append(f"{PREFIX}{name}_sum{_labels(labels)} {_number(h.sum)}")
+            lines.append(f"{PREFIX}{name}_count{_labels(labels)} {h.count}")
+    for name, labels, value in gauges:
+        series.setdefault(name, []).append(
+            f"{PREFIX}{name}{_labels(labels)} {_number(value)}")
+    out = []
+    for name in sorted(series):
+        kind, text = HELP.get(name, ("untyped", name))
+        out.append(f"# HELP {PREFIX}{name} {text}")
+        out.append(f"# TYPE {PREFIX}{name} {kind}")
+        out.extend(series[name])
+    return "\n".join(out) + "\n"
+
+
+# ==============================
+# 내보내기 (로컬 HTTP / 파일)
+# ==============================
+
+
+async def _handle(reader, writer):
+    try:
+        request = await asyncio.wait_for(reader.readline(), 5)
+        while (await asyncio.wait_for(reader.readline(), 5)) not in (b"\r\n", b"\n", b""):
+            pass
+        parts = request.split()
+        if len(parts) >= 2 and parts[1] in (b"/metrics", b"/"):
+            status, body = "200 OK", render().encode()
+        else:
+            status, body = "404 Not Found", b"not found\n"
+        writer.write(f"HTTP/1.1 {status}\r\n"
+                     "Content-Type: text/plain; version=0.0.4; charset=utf-8\r\n"
+                     f"Content-Length: {len(body)}\r\n"
+                     "Connection: close\r\n\r\n".encode() + body)
+        await writer.drain()
+    except (asyncio.TimeoutError, ConnectionError):
+        pass
+    finally:
+        writer.close()
+
+
+def write_file(path=METRICS_FILE):
+    # 다 쓴 다음 이름을 바꿔서 수집기가 반쪽 파일을 읽지 않게
+    partial = f"{path}.part"
+    with open(partial, "w", encoding="utf-8") as f:
+        f.write(render())
+    os.replace(partial, path)
+
+
+async def _write_file_loop(path, interval):
+    while True:
+        try:
+            write_file(path)
+        except OSError as e:
+            print("지표 파일 쓰기 실패:", e)
+        await asyncio.sleep(interval)
+
+
+async def start():
+    # 재연결로 on_ready 가 다시 불려도 한 번만 시작
+    if _tasks:
+        return
+    gauge("uptime_seconds", lambda: round(time.monotonic() - started, 1))
+    if METRICS_PORT:
+        # 포트가 이미 쓰이고 있어도 봇 시작(on_ready)은 계속되도록 로그만
+        try:
+            server = await asyncio.start_server(_handle, METRICS_HOST, METRICS_PORT)
+        except OSError as e:
+            print(f"지표 서버 시작 실패 ({METRICS_HOST}:{METRICS_PORT}):", e)
+        else:
+            _tasks.append(asyncio.create_task(server.serve_forever()))
+            print(f"📈 지표: http://{METRICS_HOST}:{METRICS_PORT}/metrics")
+    if METRICS_FILE:
+        _tasks.append(asyncio.create_task(
+            _write_file_loop(METRICS_FILE, METRICS_FILE_INTERVAL)))
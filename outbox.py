@@ -0,0 +1,230 @@
+import asyncio
+import time
+from collections import OrderedDict, deque
+
+import discord
+
+import metrics
+
+# ==============================
+# 디스코드 전송 스케줄러
+# - 채널별 토큰 버킷으로 레이트 리밋 전에 알아서 속도 조절
+#   (discord.py 내부 429 대기가 다른 작업까지 막지 않도록)
+# - 명령어 응답 > 메시지 수정 > 입퇴장 공지 순으로 우선 처리
+# - 밀린 공지는 임베드 여러 개짜리 메시지 하나로 묶어서 전송
+# - 같은 메시지에 대한 수정은 마지막 것만 전송
+# ==============================
+
+MAX_EMBEDS_PER_MESSAGE = 10  # 디스코드 메시지당 임베드 제한
+CHANNEL_RATE = 5  # 채널당 CHANNEL_PER 초에 CHANNEL_RATE 번
+CHANNEL_PER = 5.0
+EMBED_CACHE_SIZE = 500  # 수정용으로 기억해 둘 메시지 수
+
+
+class _Bucket:
+
+    def __init__(self, rate, per):
+        self.rate = rate
+        self.per = per
+        self.tokens = rate
+        self.updated = time.monotonic()
+
+    def delay(self):
+        # 지금 토큰을 하나 쓰려면 기다려야 하는 시간
+        now = time.monotonic()
+        self.tokens = min(self.rate, self.tokens +
+                          (now - self.updated) * self.rate / self.per)
+        self.updated = now
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) * self.per / self.rate
+
+    def take(self):
+        self.tokens -= 1
+
+
+class _ChannelQueue:
+
+    def __init__(self, channel):
+        self.channel = channel
+        self.replies = deque()  # (kwargs, future)
+        self.edits = OrderedDict()  # 수정 대기 중인 msg_id (들어온 순서)
+        self.announces = deque()  # (embed, future)
+        self.bucket = _Bucket(CHANNEL_RATE, CHANNEL_PER)
+        self.wakeup = asyncio.Event()
+        self.task = None
+
+    def __bool__(self):
+        return bool(self.replies or self.edits or self.announces)
+
+
+class Outbox:
+
+    def __init__(self):
+        self._channels = {}  # channel_id -> _ChannelQueue
+        self._embeds = OrderedDict()  # msg_id -> 현재 임베드 리스트
+        self.stats = {
+            "sends": 0,
+            "edits": 0,
+            "coalesced_edits": 0,
+            "batched_announces": 0,
+            "rate_limit_waits": 0,
+            "rate_limit_wait_seconds": 0.0,
+        }
+
+    # ---------- 외부 API ----------
+
+    async def reply(self, channel, **kwargs):
+        # 명령어 응답 - 가장 먼저 보낸다. 보낸 Message 를 돌려줌
+        q = self._queue(channel)
+        fut = asyncio.get_running_loop().create_future()
+        q.replies.append((kwargs, fut))
+        q.wakeup.set()
+        return await fut
+
+    async def announce(self, channel, embed):
+        # 입퇴장 공지 - 몰리면 한 메시지로 묶인다. (msg_id, 임베드 위치) 반환
+        q = self._queue(channel)
+        fut = asyncio.get_running_loop().create_future()
+        q.announces.append((embed, fut))
+        q.wakeup.set()
+        return await fut
+
+    def pending(self):
+        # 전송/수정 대기 중인 항목 수 (지표용)
+        return sum(len(q.replies) + len(q.edits) + len(q.announces)
+                   for q in self._channels.values())
+
+    def edit(self, channel, msg_id, embed, index=None, on_missing=None):
+        # 메시지 수정 (기다리지 않음)
+        # index=None 이면 메시지 전체를 embed 하나로 교체
+        # index 가 있으면 묶음 메시지의 해당 임베드만 교체
+        # - 캐시에 없는 묶음 메시지는 안전하게 새 메시지로 보낸다
+        # on_missing: 원본이 지워졌을 때(NotFound) 새 메시지로 보내는 대신 on_missing(msg_id)
+        #             (고정 메시지처럼 ID 를 따로 저장해 둔 쪽이 직접 다시 만들도록)
+        q = self._queue(channel)
+        if index is None:
+            self._remember(msg_id, [embed])
+        elif msg_id in self._embeds and index < len(self._embeds[msg_id]):
+            self._embeds[msg_id][index] = embed
+            self._embeds.move_to_end(msg_id)
+        else:
+            q.announces.append((embed, None))
+            q.wakeup.set()
+            return
+        if msg_id in q.edits:
+            self.stats["coalesced_edits"] += 1
+            on_missing = on_missing or q.edits[msg_id]
+        q.edits[msg_id] = on_missing
+        q.wakeup.set()
+
+    # ---------- 내부 ----------
+
+    def _queue(self, channel):
+        q = self._channels.get(channel.id)
+        if q is None:
+            q = self._channels[channel.id] = _ChannelQueue(channel)
+        q.channel = channel
+        if q.task is None or q.task.done():
+            q.task = asyncio.create_task(self._worker(q))
+        return q
+
+    def _remember(self, msg_id, embeds):
+        self._embeds[msg_id] = embeds
+        self._embeds.move_to_end(msg_id)
+        while len(self._embeds) > EMBED_CACHE_SIZE:
+            self._embeds.popitem(last=False)
+
+    async def _worker(self, q):
+        while True:
+            if not q:
+                q.wakeup.clear()
+                await q.wakeup.wait()
+                continue
+            delay = q.bucket.delay()
+            if delay:
+                self.stats["rate_limit_waits"] += 1
+                self.stats["rate_limit_wait_seconds"] += delay
+                await asyncio.sleep(delay)
+                continue
+            q.bucket.take()
+            if q.replies:
+                await self._send_reply(q)
+            elif q.edits:
+                await self._send_edit(q)
+            else:
+                await self._send_announces(q)
+
+    async def _send_reply(self, q):
+        kwargs, fut = q.replies.popleft()
+        started = time.perf_counter()
+        try:
+            msg = await q.channel.send(**kwargs)
+        except Exception as e:
+            metrics.inc("discord_errors_total", kind="reply")
+            _resolve(fut, exc=e)
+        else:
+            self.stats["sends"] += 1
+            _resolve(fut, msg)
+        finally:
+            metrics.observe("discord_request_seconds",
+                            time.perf_counter() - started, kind="reply")
+
+    async def _send_edit(self, q):
+        msg_id, on_missing = q.edits.popitem(last=False)
+        embeds = self._embeds.get(msg_id)
+        if embeds is None:
+            return
+        started = time.perf_counter()
+        try:
+            # 캐시된 내용으로 바로 수정 (fetch_message 없이)
+            await q.channel.get_partial_message(msg_id).edit(embeds=embeds)
+            self.stats["edits"] += 1
+        except discord.NotFound:
+            # 원본이 지워졌으면 알려 주거나, 받을 쪽이 없으면 새 메시지로
+            metrics.inc("discord_errors_total", kind="edit")
+            self._embeds.pop(msg_id, None)
+            if on_missing is not None:
+                on_missing(msg_id)
+            else:
+                for embed in embeds:
+                    q.announces.append((embed, None))
+        except Exception as e:
+            metrics.inc("discord_errors_total", kind="edit")
+            print("메시지 수정 실패:", e)
+        finally:
+            metrics.observe("discord_request_seconds",
+                            time.perf_counter() - started, kind="edit")
+
+    async def _send_announces(self, q):
+        batch = []
+        while q.announces and len(batch) < MAX_EMBEDS_PER_MESSAGE:
+            batch.append(q.announces.popleft())
+        started = time.perf_counter()
+        try:
+            msg = await q.channel.send(embeds=[embed for embed, _ in batch])
+        except Exception as e:
+            metrics.inc("discord_errors_total", kind="announce")
+            for _, fut in batch:
+                _resolve(fut, exc=e)
+            if all(fut is None for _, fut in batch):
+                print("공지 전송 실패:", e)
+            return
+        finally:
+            metrics.observe("discord_request_seconds",
+                            time.perf_counter() - started, kind="announce")
+        self.stats["sends"] += 1
+        if len(batch) > 1:
+            self.stats["batched_announces"] += len(batch) - 1
+        self._remember(msg.id, [embed for embed, _ in batch])
+        for i, (_, fut) in enumerate(batch):
+            _resolve(fut, (msg.id, i))
+
+
+def _resolve(fut, result=None, exc=None):
+    if fut is None or fut.done():
+        return
+    if exc is not None:
+        fut.set_exception(exc)
+    else:
+        fut.set_result(result)
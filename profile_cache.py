@@ -0,0 +1,94 @@
+import threading
+import time
+from collections import OrderedDict
+
+# ==============================
+# 유저 프로필 캐시 (LRU + TTL)
+# 내정보/통계/연속기록/퇴장 메시지가 매번 DB 를 다시 읽지 않도록
+# - db.py 쓰기 함수가 write-through 로 갱신
+# - 날짜가 바뀐 항목은 (오늘/이번주/이번달 값이 달라지므로) 미스 처리
+# ==============================
+
+
+class ProfileCache:
+
+    def __init__(self, max_size=2000, ttl=300):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()  # user_id -> (만료 시각, 날짜, 프로필)
+        self._loading = {}  # user_id -> 읽는 도중 쓰기가 없었으면 True
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, user_id, day):
+        user_id = str(user_id)
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None or entry[0] < time.monotonic() or entry[1] != day:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(user_id)
+            self.hits += 1
+            return _copy(entry[2])
+
+    def begin_load(self, user_id):
+        # 미스 후 DB 에서 읽기 시작할 때 - 그 사이 쓰기가 있으면 put 을 버린다
+        with self._lock:
+            self._loading[str(user_id)] = True
+
+    def put(self, user_id, day, profile):
+        user_id = str(user_id)
+        with self._lock:
+            if not self._loading.pop(user_id, False):
+                return
+            self._entries[user_id] = (time.monotonic() + self.ttl, day,
+                                      _copy(profile))
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def cached(self, user_id):
+        return str(user_id) in self._entries
+
+    def update(self, user_id, fn):
+        # write-through: 캐시에 있으면 fn(profile) 로 제자리 수정
+        user_id = str(user_id)
+        with self._lock:
+            if user_id in self._loading:
+                self._loading[user_id] = False
+            entry = self._entries.get(user_id)
+            if entry is not None:
+                fn(entry[2])
+
+    def invalidate(self, user_id):
+        user_id = str(user_id)
+        with self._lock:
+            if user_id in self._loading:
+                self._loading[user_id] = False
+            self._entries.pop(user_id, None)
+
+    def clear(self):
+        with self._lock:
+            for user_id in self._loading:
+                self._loading[user_id] = False
+            self._entries.clear()
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
+
+
+def _copy(profile):
+    # 한 단계 안쪽 dict(streaks, month, week)까지 복사
+    return {k: dict(v) if isinstance(v, dict) else v
+            for k, v in profile.items()}
@@ -0,0 +1,125 @@
+import asyncio
+import time
+from datetime import datetime, timedelta
+
+from pytz import timezone
+
+import metrics
+
+# ==============================
+# cron 스타일 예약 작업
+# 매 분 깨어나서 시간을 확인하는 대신, 다음 실행 시각(KST)까지 정확히 잠든다
+# 형식: "분 시 일 월 요일"  (요일 0=일요일 ... 6=토요일, 7도 일요일)
+# 각 필드는 *, */n, a-b, a-b/n, a,b,c 지원
+# ==============================
+
+KST = timezone('Asia/Seoul')
+MAX_SLEEP = 3600  # 긴 대기는 나눠서 자고 시계를 다시 확인
+
+
+def _parse_field(field, lo, hi):
+    values = set()
+    for part in field.split(","):
+        step = 1
+        if "/" in part:
+            part, step = part.split("/")
+            step = int(step)
+        if part == "*":
+            start, end = lo, hi
+        elif "-" in part:
+            start, end = (int(x) for x in part.split("-"))
+        else:
+            start = end = int(part)
+            if step != 1:
+                end = hi
+        if start < lo or end > hi or start > end or step < 1:
+            raise ValueError(f"cron 필드 범위 오류: {field}")
+        values.update(range(start, end + 1, step))
+    return sorted(values)
+
+
+class Cron:
+
+    def __init__(self, spec, tz=KST):
+        fields = spec.split()
+        if len(fields) != 5:
+            raise ValueError(f"cron 형식은 '분 시 일 월 요일': {spec}")
+        self.spec = spec
+        self.tz = tz
+        self.minutes = _parse_field(fields[0], 0, 59)
+        self.hours = _parse_field(fields[1], 0, 23)
+        self.days = set(_parse_field(fields[2], 1, 31))
+        self.months = set(_parse_field(fields[3], 1, 12))
+        self.weekdays = {d % 7 for d in _parse_field(fields[4], 0, 7)}
+        # cron 규칙: 일/요일이 둘 다 지정되면 둘 중 하나만 맞아도 실행
+        self._any_day = fields[2] == "*"
+        self._any_weekday = fields[4] == "*"
+
+    def _day_matches(self, d):
+        if d.month not in self.months:
+            return False
+        in_days = d.day in self.days
+        in_weekdays = (d.weekday() + 1) % 7 in self.weekdays
+        if self._any_day or self._any_weekday:
+            return in_days and in_weekdays
+        return in_days or in_weekdays
+
+    def next_after(self, now):
+        # now 이후(초과) 첫 실행 시각 (tz 포함 datetime)
+        local = now.astimezone(self.tz).replace(tzinfo=None)
+        start = local.replace(second=0, microsecond=0) + timedelta(minutes=1)
+        day = start.date()
+        for _ in range(366 * 5):
+            if self._day_matches(day):
+                for hour in self.hours:
+                    for minute in self.minutes:
+                        candidate = datetime(day.year, day.month, day.day,
+                                             hour, minute)
+                        if candidate >= start:
+                            return self.tz.localize(candidate)
+            day += timedelta(days=1)
+        raise ValueError(f"실행 시각을 찾을 수 없는 cron: {self.spec}")
+
+
+class Scheduler:
+
+    def __init__(self, tz=KST):
+        self.tz = tz
+        self._jobs = []  # (Cron, coroutine function)
+        self._tasks = []
+
+    def cron(self, spec):
+        # @scheduler.cron("0 0 * * *") 로 작업 등록
+        def decorator(fn):
+            self._jobs.append((Cron(spec, self.tz), fn))
+            return fn
+        return decorator
+
+    def start(self):
+        # 재연결로 on_ready 가 다시 불려도 한 번만 시작
+        if self._tasks:
+            return
+        self._tasks = [asyncio.create_task(self._run(cron, fn))
+                       for cron, fn in self._jobs]
+
+    def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        self._tasks = []
+
+    async def _run(self, cron, fn):
+        while True:
+            fire_at = cron.next_after(datetime.now(self.tz))
+            while True:
+                delay = (fire_at - datetime.now(self.tz)).total_seconds()
+                if delay <= 0:
+                    break
+                await asyncio.sleep(min(delay, MAX_SLEEP))
+            started = time.perf_counter()
+            try:
+                await fn()
+            except Exception as e:
+                metrics.inc("job_errors_total", job=fn.__name__)
+                print(f"예약 작업 실패 ({fn.__name__}, {cron.spec}):", e)
+            metrics.observe("job_seconds", time.perf_counter() - started,
+                            job=fn.__name__)
@@ -0,0 +1,61 @@
+import async_db
+import db
+
+# ==============================
+# 봇 상태 캐시 (bot_state 테이블 write-through)
+# 시작할 때 한 번만 DB 에서 읽고, 이후 읽기는 메모리에서 바로
+# 값을 바꾸면 메모리와 DB 를 같이 갱신한다
+# ==============================
+
+# 키별 기본값 - 타입도 여기서 정해진다 (None 이면 int 로 취급)
+DEFAULTS = {
+    "ranking_channel_id": 1378863730741219458,  # 👑｜랭킹
+    "attendance_channel_id": 1378862713484218489,  # 🍀｜출석체크
+    "wakeup_channel_id": 1378862771214745690,  # 🌅｜기상인증
+    "myinfo_channel_id": 1378952514702938182,  # 🏠｜내정보
+    "ranking_message_id": None,
+}
+
+GUILD_PREFIX = "guild:"
+
+
+def _coerce(key, value):
+    if value is None:
+        return None
+    default = DEFAULTS.get(key)
+    kind = type(default) if default is not None else int
+    return kind(value)
+
+
+class BotState:
+
+    def __init__(self):
+        self._values = dict(DEFAULTS)
+        self._guilds = {}  # guild_id -> {설정 키: 값}
+
+    def load(self):
+        # DB 에서 한 번 읽기 (동기 - bot.run 전에 호출)
+        for key, value in db.get_all_state().items():
+            if key.startswith(GUILD_PREFIX):
+                self._guilds[int(key[len(GUILD_PREFIX):])] = dict(value)
+            elif key in DEFAULTS:
+                self._values[key] = _coerce(key, value)
+
+    def get(self, key):
+        return self._values[key]
+
+    async def set(self, key, value):
+        if key not in DEFAULTS:
+            raise KeyError(f"알 수 없는 상태 키: {key}")
+        value = _coerce(key, value)
+        self._values[key] = value
+        await async_db.set_state(key, value)
+
+    def guild(self, guild_id):
+        # 서버별 설정 (없으면 빈 dict, 수정은 set_guild 로)
+        return dict(self._guilds.get(guild_id, {}))
+
+    async def set_guild(self, guild_id, **settings):
+        config = self._guilds.setdefault(guild_id, {})
+        config.update(settings)
+        await async_db.set_state(f"{GUILD_PREFIX}{guild_id}", config)